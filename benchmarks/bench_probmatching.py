@@ -0,0 +1,57 @@
+"""Benchmark of the approximate histogram method of
+pysteps.postproc.probmatching.nonparam_match_empirical_cdf against the exact
+rank-based method.
+
+For each field size and number of bins, the script matches a lognormal field
+with the CDF of another lognormal field (both with 50% zeros) with both methods
+and prints the run times and the absolute errors of the approximate method
+relative to the exact one: the maximum error, its 99th percentile and the
+maximum error in the 0.1% tails of the distribution. The bin width of the
+target histogram is printed for reference.
+
+Usage: python bench_probmatching.py [num_repeats]
+"""
+
+import sys
+import time
+import numpy as np
+from pysteps.postproc import probmatching
+
+def _run(method, initialarray, targetarray, num_bins, num_repeats):
+    times = []
+    for i in range(num_repeats):
+        starttime = time.perf_counter()
+        result = probmatching.nonparam_match_empirical_cdf(initialarray,
+            targetarray, method=method, num_bins=num_bins)
+        times.append(time.perf_counter() - starttime)
+
+    return result,min(times)
+
+def main(num_repeats=3):
+    rng = np.random.default_rng(42)
+
+    print("%6s %6s %9s %9s %9s %9s %9s %9s" % ("size", "bins", "exact",
+          "approx", "bin width", "max err", "p99 err", "tail err"))
+    for n in [256, 512, 1024, 2048]:
+        initialarray = rng.lognormal(size=(n, n))
+        initialarray[initialarray < 1.0] = 0.0
+        targetarray = 1.5 * rng.lognormal(size=(n, n))
+        targetarray[targetarray < 1.5] = 0.0
+
+        for num_bins in [1000, 10000]:
+            R_e,t_e = _run("exact", initialarray, targetarray, num_bins,
+                           num_repeats)
+            R_a,t_a = _run("approx", initialarray, targetarray, num_bins,
+                           num_repeats)
+
+            err = np.abs(R_a - R_e).ravel()
+            q = np.argsort(np.argsort(initialarray.ravel())) / err.size
+            tail = np.logical_or(q < 0.001, q > 0.999)
+            bin_width = np.ptp(targetarray) / num_bins
+
+            print("%6d %6d %8.3fs %8.3fs %9.4f %9.4f %9.4f %9.4f" % (n,
+                  num_bins, t_e, t_a, bin_width, np.max(err),
+                  np.percentile(err, 99), np.max(err[tail])))
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:2]])
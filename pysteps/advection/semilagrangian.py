@@ -4,6 +4,7 @@
 import numpy as np
 import scipy.ndimage.interpolation as ip
 import time
+from ..utils import cache
 
 def extrapolate(R, V, num_timesteps, outval=np.nan, **kwargs):
     """Apply semi-Lagrangian extrapolation to a two-dimensional precipitation 
@@ -13,7 +14,8 @@ def extrapolate(R, V, num_timesteps, outval=np.nan, **kwargs):
     ----------
     R : array-like
         Array of shape (m,n) containing the input precipitation field. All 
-        values are required to be finite.
+        values are required to be finite. If R is a single-precision array, the 
+        coordinates and displacements are computed in single precision.
     V : array-like
         Array of shape (2,m,n) containing the x- and y-components of the m*n 
         advection field. All values are required to be finite.
@@ -78,17 +80,22 @@ def extrapolate(R, V, num_timesteps, outval=np.nan, **kwargs):
     
     coeff = 1.0 if not inverse else -1.0
     
-    X,Y = np.meshgrid(np.arange(V.shape[2]), np.arange(V.shape[1]))
-    XY  = np.stack([X, Y])
+    # the coordinates and displacements are computed in single precision if the 
+    # input field is in single precision
+    dtype = np.float32 if R.dtype == np.float32 else np.float64
+    
+    XY = cache.get_or_compute(("semilagrangian_grid", V.shape[1:3], 
+                               np.dtype(dtype).name), _get_grid, V.shape[1:3], 
+                              dtype)
     
     R_e = []
     if D_prev is None:
-        D = np.zeros((2, V.shape[1], V.shape[2]))
+        D = np.zeros((2, V.shape[1], V.shape[2]), dtype=dtype)
     else:
-        D = D_prev.copy()
+        D = D_prev.astype(dtype)
     
     for t in range(num_timesteps):
-        V_inc = np.zeros(D.shape)
+        V_inc = np.zeros(D.shape, dtype=dtype)
       
         for k in range(n_iter):
             if t > 0 or k > 0 or D_prev is not None:
@@ -121,4 +128,10 @@ def extrapolate(R, V, num_timesteps, outval=np.nan, **kwargs):
     if not return_displacement:
         return np.stack(R_e)
     else:
-        return np.stack(R_e), D
\ No newline at end of file
+        return np.stack(R_e), D
+
+def _get_grid(shape, dtype):
+    X,Y = np.meshgrid(np.arange(shape[1], dtype=dtype), 
+                      np.arange(shape[0], dtype=dtype))
+    
+    return np.stack([X, Y])
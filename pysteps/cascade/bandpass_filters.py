@@ -13,21 +13,45 @@ key-value pairs:
 
     weights_1d       2d array of shape (n, L/2) containing 1d filter weights 
                      for each frequency band k=1,2,...,n
-    weights_2d       3d array of shape (n, L, L) containing the 2d filter 
-                     weights for each frequency band k=1,2,...,n
+    weights_2d_rfft  3d array of shape (n, L, L/2+1) containing the 2d filter 
+                     weights in the layout of numpy.fft.rfft2, i.e. for the 
+                     half-spectrum of a real field with the zero frequency at 
+                     index (0,0)
+    shape            1d array containing the shape (L, L) of the input field
     central_freqs    1d array of shape n containing the central frequencies of 
                      the filters
 
 The filter weights are assumed to be normalized so that for any Fourier 
-wavenumber they sum to one.
+wavenumber they sum to one. The weights are even functions of the wavenumber, 
+so the half-spectrum determines them, and the dense 2d weights over the full 
+spectrum with the zero frequency shifted to the center (previously stored 
+under the key weights_2d) are computed on demand by get_weights_2d.
+
+If the filter function supports the keyword argument compact=True, the dense 
+2d weights are not stored. Instead, the dictionary contains the sparse support 
+of each band in the half-spectrum, i.e. the wavenumbers where the weights are 
+not negligible:
+
+    support_index    1d array containing the flat indices of the supports of 
+                     all bands into the half-spectrum of shape (L, L/2+1), 
+                     concatenated in the order of the bands
+    support_weights  1d array containing the filter weights corresponding to 
+                     support_index
+    support_offsets  1d array of shape n+1, the support of band k is given by 
+                     the elements support_offsets[k]:support_offsets[k+1] of 
+                     support_index and support_weights
+
+Use get_filter_shape, get_support and get_weights_2d for accessing the filters 
+independently of their representation.
 """
 
 import numpy as np
+from ..utils import spectral
 
 # TODO: Should the filter always return an 1d array and should we use a separate 
 # method for generating the 2d filter from the 1d filter?
 
-def filter_uniform(N, n, M=None):
+def filter_uniform(N, n, M=None, dtype=np.float64, compact=False):
     """A dummy filter with one frequency band covering the whole domain. The 
     weights are set to one.
   
@@ -40,6 +64,12 @@ def filter_uniform(N, n, M=None):
         be equal to the width.
     n : int
         Not used. Needed for compatibility with the filter interface.
+    dtype : str or numpy.dtype
+        The data type of the 2d filter weights, e.g. 'float32' for use with 
+        single-precision inputs.
+    compact : bool
+        If True, store the support of the band instead of the dense 2d weights 
+        (see the module documentation).
     """
     result = {}
     
@@ -48,12 +78,18 @@ def filter_uniform(N, n, M=None):
     r_max = int(max(N, M)/2)+1
     
     result["weights_1d"]    = np.ones((1, r_max))
-    result["weights_2d"]    = np.ones((1, M, N))
     result["central_freqs"] = None
+    if compact:
+        W_h = np.ones((M, int(N/2)+1))
+        result.update(_get_compact_weights([W_h], (M, N), 0.0, dtype))
+    else:
+        result["weights_2d_rfft"] = np.ones((1, M, int(N/2)+1), dtype=dtype)
+        result["shape"]           = np.array((M, N))
     
     return result
 
-def filter_gaussian(N, n, M=None, l_0=3, gauss_scale=0.5, gauss_scale_0=0.5):
+def filter_gaussian(N, n, M=None, l_0=3, gauss_scale=0.5, gauss_scale_0=0.5, 
+                    dtype=np.float64, compact=False, compact_tol=1e-6):
     """Gaussian band-pass filter in logarithmic frequency scale. The method is 
     described in
     
@@ -80,6 +116,18 @@ def filter_gaussian(N, n, M=None, l_0=3, gauss_scale=0.5, gauss_scale_0=0.5):
     gauss_scale_0 : float
         Optional scaling parameter for the Gaussian function corresponding to 
         the first frequency band.
+    dtype : str or numpy.dtype
+        The data type of the 2d filter weights, e.g. 'float32' for use with 
+        single-precision inputs. The weights are computed in double precision.
+    compact : bool
+        If True, store the supports of the bands instead of the dense 2d 
+        weights (see the module documentation). The weights are evaluated on 
+        the cached radius map of the half-spectrum one band at a time, so the 
+        dense weights of all bands are never allocated.
+    compact_tol : float
+        If compact is True, the weights below this value are neglected. The 
+        weights are not renormalized, so the bands sum to one within 
+        n*compact_tol.
     """
     if n < 3:
         raise ValueError("n must be greater than 2")
@@ -87,18 +135,7 @@ def filter_gaussian(N, n, M=None, l_0=3, gauss_scale=0.5, gauss_scale_0=0.5):
     if M == None:
         M = N
     
-    if N % 2 == 1:
-        rx = np.s_[-int(N/2):int(N/2)+1]
-    else:
-        rx = np.s_[-int(N/2):int(N/2)]
-    
-    if M % 2 == 1:
-        ry = np.s_[-int(M/2):int(M/2)+1]
-    else:
-        ry = np.s_[-int(M/2):int(M/2)]
-    
-    Y,X = np.ogrid[ry, rx]
-    R = np.sqrt(X*X + Y*Y)
+    R_h = spectral.get_rfft_radius_map((M, N))
     
     L = max(N, M)
     r_max = int(L/2)+1
@@ -108,23 +145,152 @@ def filter_gaussian(N, n, M=None, l_0=3, gauss_scale=0.5, gauss_scale_0=0.5):
                                gauss_scale_0=gauss_scale_0)
     
     w = np.empty((n, r_max))
-    W = np.empty((n, M, N))
-    
     for i,wf in enumerate(wfs):
         w[i, :] = wf(r)
-        W[i, :, :] = wf(R)
-    
-    w_sum = np.sum(w, axis=0)
-    W_sum = np.sum(W, axis=0)
-    for k in range(W.shape[0]):
-        w[k, :]    /= w_sum
-        W[k, :, :] /= W_sum
+    w /= np.sum(w, axis=0)
     
     result = {}
     result["weights_1d"]    = w
-    result["weights_2d"]    = W
     result["central_freqs"] = np.array(cfs)
     
+    if compact:
+        # the normalization factors are accumulated in a first pass, and each 
+        # band is then evaluated again, normalized and thresholded
+        W_sum = np.zeros(R_h.shape)
+        for wf in wfs:
+            W_sum += wf(R_h)
+        bands = (wf(R_h) / W_sum for wf in wfs)
+        result.update(_get_compact_weights(bands, (M, N), compact_tol, dtype))
+        return result
+    
+    W_h = np.empty((n,) + R_h.shape)
+    for i,wf in enumerate(wfs):
+        W_h[i, :, :] = wf(R_h)
+    W_h /= np.sum(W_h, axis=0)
+    
+    result["weights_2d_rfft"] = W_h.astype(dtype, copy=False)
+    result["shape"]           = np.array((M, N))
+    
+    return result
+
+def get_filter_shape(filter):
+    """Return the shape of the input field of a filter.
+    
+    Parameters
+    ----------
+    filter : dict
+        A filter returned by any method implemented in this module.
+    
+    Returns
+    -------
+    out : tuple
+        The shape (M, N) of the input field.
+    """
+    if "shape" in filter.keys():
+        return tuple(int(l) for l in filter["shape"])
+    else:
+        return filter["weights_2d"].shape[1:3]
+
+def is_compact(filter):
+    """Return True if the filter stores the supports of the bands instead of 
+    the dense 2d weights (see the module documentation)."""
+    return "support_index" in filter.keys()
+
+def get_support(filter, k):
+    """Return the support of the kth band of a filter in the half-spectrum 
+    (in the layout of numpy.fft.rfft2).
+    
+    Parameters
+    ----------
+    filter : dict
+        A filter returned by any method implemented in this module.
+    k : int
+        Index of the band.
+    
+    Returns
+    -------
+    out : tuple
+        Two 1d arrays containing the flat indices of the wavenumbers into the 
+        half-spectrum and the corresponding weights. For a filter with dense 
+        2d weights, the support contains the whole half-spectrum.
+    """
+    if is_compact(filter):
+        i0,i1 = filter["support_offsets"][k:k+2]
+        return filter["support_index"][i0:i1],filter["support_weights"][i0:i1]
+    
+    if "weights_2d_rfft" in filter.keys():
+        W_k = filter["weights_2d_rfft"][k, :, :]
+    else:
+        W_k = np.fft.ifftshift(filter["weights_2d"][k, :, :])
+        W_k = W_k[:, :int(W_k.shape[1]/2)+1]
+    
+    return np.arange(W_k.size),W_k.ravel()
+
+def get_weights_2d(filter, k=None):
+    """Return the dense 2d filter weights over the full spectrum with the zero 
+    frequency shifted to the center. The weights are computed from the 
+    half-spectrum, so the returned array is a new one.
+    
+    Parameters
+    ----------
+    filter : dict
+        A filter returned by any method implemented in this module.
+    k : int
+        If not None, return only the weights of the kth band.
+    
+    Returns
+    -------
+    out : ndarray
+        Array of shape (n, M, N) containing the filter weights, where (M, N) 
+        is the shape of the input field, or an array of shape (M, N) if k is 
+        given.
+    """
+    if "weights_2d" in filter.keys():
+        W = filter["weights_2d"]
+        return W if k is None else W[k, :, :]
+    
+    M,N = get_filter_shape(filter)
+    n_h = int(N/2)+1
+    bands = range(len(filter["weights_1d"])) if k is None else [k]
+    
+    if is_compact(filter):
+        dtype = filter["support_weights"].dtype
+    else:
+        dtype = filter["weights_2d_rfft"].dtype
+    
+    W = np.zeros((len(bands), M, N), dtype=dtype)
+    for i,k_ in enumerate(bands):
+        idx,w = get_support(filter, k_)
+        W[i, idx // n_h, idx % n_h] = w
+    
+    # the weights are even, so the negative frequencies along the last axis 
+    # are those of the half-spectrum at the mirrored wavenumbers
+    rows = -np.arange(M) % M
+    cols = N - np.arange(n_h, N)
+    W[:, :, n_h:] = W[:, rows, :][:, :, cols]
+    W = np.fft.fftshift(W, axes=(1, 2))
+    
+    return W if k is None else W[0, :, :]
+
+def _get_compact_weights(bands, shape, tol, dtype):
+    # Extract the supports of the bands, given as an iterable of half-spectrum 
+    # weight arrays of shape (M,N/2+1).
+    index   = []
+    weights = []
+    offsets = [0]
+    for W_k in bands:
+        W_k = W_k.ravel()
+        idx = np.where(W_k >= tol)[0] if tol > 0.0 else np.arange(W_k.size)
+        index.append(idx)
+        weights.append(W_k[idx].astype(dtype))
+        offsets.append(offsets[-1] + len(idx))
+    
+    result = {}
+    result["shape"]           = np.array(shape)
+    result["support_index"]   = np.hstack(index)
+    result["support_weights"] = np.hstack(weights)
+    result["support_offsets"] = np.array(offsets)
+    
     return result
 
 def _gaussweights_1d(l, n, l_0=3, gauss_scale=0.5, gauss_scale_0=0.5):
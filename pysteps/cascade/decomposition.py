@@ -14,24 +14,37 @@ dictionary with the following key-value pairs:
                     field
   means             list of mean values for each cascade level
   stds              list of standard deviations for each cascade level
+
+If the method supports the keyword argument domain="spectral", the cascade 
+levels are returned as Fourier spectra instead of spatial fields. The spectra 
+are in the layout of numpy.fft.rfft2, i.e. the cascade_levels array has shape 
+(n,L,L/2+1), and a spatial field is obtained by applying an inverse real FFT 
+(numpy.fft.irfft2) to a spectrum. The means and standard deviations are still 
+those of the spatial fields.
+
+If the method supports the keyword argument multiresolution=True, each cascade 
+level is represented on a grid whose resolution matches the frequency band of 
+the level (see get_level_shapes). The cascade_levels item is then a list of n 
+arrays of different shapes instead of a three-dimensional array. A level of 
+shape (m,n) is a band-limited field sampled on a regular grid of m x n points 
+covering the same domain as the input field, and it can be transformed back to 
+the original resolution by padding its spectrum with pad_rfft_spectrum.
+
+If the method supports the keyword argument input_domain="spectral", the input 
+field can also be given as its real FFT spectrum, which avoids transforming a 
+field that is already available in the Fourier domain.
+
+If the method supports the keyword argument decimate=True, the cascade levels 
+are returned on grids that are coarsened by a factor of two per level, and the 
+cascade_levels item is a list of n arrays of different shapes. A decimated 
+level is transformed to the resolution of the input field with 
+expand_pyramid_level.
 """
 
 import numpy as np
-# Use the pyfftw interface if it is installed. If not, fall back to the fftpack 
-# interface provided by SciPy, and finally to numpy if SciPy is not installed.
-try:
-    import pyfftw.interfaces.numpy_fft as fft
-    import pyfftw
-    # TODO: Caching and multithreading currently disabled because they give a 
-    # segfault with dask.
-    #pyfftw.interfaces.cache.enable()
-    fft_kwargs = {"threads":1, "planner_effort":"FFTW_ESTIMATE"}
-except ImportError:
-    import scipy.fftpack as fft
-    fft_kwargs = {}
-except ImportError:
-    import numpy.fft as fft
-    fft_kwargs = {}
+from scipy import ndimage
+from . import bandpass_filters
+from ..utils import fftbackend as fft
 
 def decomposition_fft(X, filter, **kwargs):
     """Decompose a 2d input field into multiple spatial scales by using the Fast 
@@ -50,43 +63,653 @@ def decomposition_fft(X, filter, **kwargs):
     MASK : array_like
       Optional mask to use for computing the statistics for the cascade levels. 
       Pixels with MASK==False are excluded from the computations.
+    input_domain : str
+      If 'spatial' (the default), X is a spatial field. If 'spectral', X is the 
+      real FFT spectrum of the input field (see the module documentation), and 
+      the shape of the field is taken from the filter. MASK cannot be used in 
+      this case.
+    domain : str
+      If 'spatial' (the default), the cascade levels are returned as spatial 
+      fields. If 'spectral', they are returned as real FFT spectra (see the 
+      module documentation), and the inverse FFTs of the cascade levels are 
+      not computed. The means and standard deviations are then computed from 
+      the spectra by using Parseval's theorem. MASK cannot be used in this case.
+    multiresolution : bool
+      If True, return each cascade level on a grid whose resolution matches 
+      the frequency band of the level (see the module documentation). The 
+      spectra of the levels are cropped, so no inverse FFTs are computed at 
+      the resolution of X. MASK cannot be used in this case.
+    multiresolution_tol : float
+      The filter weights below this value are neglected when determining the 
+      resolutions of the levels if multiresolution is True. The default is 
+      1e-4. See get_level_shapes.
     
     Returns
     -------
     out : ndarray
       A dictionary described in the module documentation. The parameter n is 
-      determined from the filter (see bandpass_filters.py).
+      determined from the filter (see bandpass_filters.py). The input field is 
+      always real, so the decomposition is done with real FFTs on the 
+      half-spectrum (see get_rfft_weights). If X is a 
+      single-precision array, the cascade levels are computed with 
+      single-precision FFTs and returned as a single-precision array. The 
+      means and standard deviations are accumulated in double precision.
     """
-    MASK = kwargs.get("MASK", None)
+    MASK   = kwargs.get("MASK", None)
+    domain = kwargs.get("domain", "spatial")
+    input_domain        = kwargs.get("input_domain", "spatial")
+    multiresolution     = kwargs.get("multiresolution", False)
+    multiresolution_tol = kwargs.get("multiresolution_tol", 1e-4)
     
     if len(X.shape) != 2:
         raise ValueError("the input is not two-dimensional array")
+    if input_domain not in ["spatial", "spectral"]:
+        raise ValueError("unknown input domain %s, the available options are 'spatial' and 'spectral'" % input_domain)
+    shape = bandpass_filters.get_filter_shape(filter)
+    if input_domain == "spectral":
+        if X.shape != (shape[0], int(shape[1]/2)+1):
+            raise ValueError("dimension mismatch between the spectrum X and filter: X.shape=%s, filter shape=%s" % (str(X.shape), str(shape)))
+        if MASK is not None:
+            raise ValueError("MASK cannot be used with input_domain='spectral'")
+    elif X.shape != shape:
+        raise ValueError("dimension mismatch between X and filter: X.shape=%s, filter shape=%s" % (str(X.shape), str(shape)))
     if MASK is not None and MASK.shape != X.shape:
       raise ValueError("dimension mismatch between X and MASK: X.shape=%s, MASK.shape=%s" % \
         (str(X.shape), str(MASK.shape)))
-    if X.shape != filter["weights_2d"].shape[1:3]:
-        raise ValueError("dimension mismatch between X and filter: X.shape=%s, filter['weights_2d'].shape[1:3]=%s" % (str(X.shape), str(filter["weights_2d"].shape[1:3])))
     if np.any(~np.isfinite(X)):
       raise ValueError("X contains non-finite values")
+    if domain not in ["spatial", "spectral"]:
+        raise ValueError("unknown domain %s, the available options are 'spatial' and 'spectral'" % domain)
+    if domain == "spectral" and MASK is not None:
+        raise ValueError("MASK cannot be used with domain='spectral'")
+    if multiresolution and MASK is not None:
+        raise ValueError("MASK cannot be used with multiresolution=True")
+    
+    if X.dtype in [np.float32, np.complex64]:
+        dtype,cdtype = np.float32,np.complex64
+    else:
+        dtype,cdtype = np.float64,np.complex128
+    
+    if input_domain == "spectral":
+        F = X.astype(cdtype, copy=False)
+    else:
+        F = fft.rfft2(X).astype(cdtype, copy=False)
+    
+    if multiresolution:
+        return _decomposition_fft_multiresolution(F, filter, shape, domain, 
+                                                  multiresolution_tol, dtype)
+    if domain == "spectral":
+        return _decomposition_fft_spectral(F, filter, shape, dtype)
+    
+    return _decomposition_fft_rfft(F, filter, shape, MASK, dtype)
+
+def decomposition_fft_batch(X, filter, **kwargs):
+    """Decompose a stack of 2d input fields into multiple spatial scales by 
+    using the Fast Fourier Transform (FFT) and a bandpass filter. The result 
+    is equivalent to applying decomposition_fft to each field, but the fields 
+    are transformed with one multidimensional real FFT over the trailing axes, 
+    and the statistics of the cascade levels are computed for all fields at 
+    once.
+    
+    Parameters
+    ----------
+    X : array_like
+      Three-dimensional array of shape (k,m,n) containing k input fields. All 
+      values are required to be finite.
+    filter : dict
+      A filter returned by any method implemented in bandpass_filters.py.
+    
+    Optional kwargs
+    ---------------
+    MASK : array_like
+      Optional mask of shape (m,n) or (k,m,n) to use for computing the 
+      statistics for the cascade levels. Pixels with MASK==False are excluded 
+      from the computations.
+    num_workers : int
+      The number of threads used by the FFTs. This option is ignored if the 
+      FFTs are computed with numpy (see pysteps.utils.fftbackend). If None (the 
+      default), the global thread budget of pysteps.utils.fftbackend is used.
+    
+    Returns
+    -------
+    out : dict
+      A dictionary with the keys 'cascade_levels', 'means' and 'stds' (see the 
+      module documentation), where cascade_levels is an array of shape 
+      (k,L,m,n), and means and stds are arrays of shape (k,L) containing the 
+      statistics of each level of each field. The number of levels L is 
+      determined from the filter. The precision follows that of X as in 
+      decomposition_fft.
+    """
+    MASK        = kwargs.get("MASK", None)
+    num_workers = kwargs.get("num_workers", None)
+    
+    if len(X.shape) != 3:
+        raise ValueError("the input is not three-dimensional array")
+    shape = bandpass_filters.get_filter_shape(filter)
+    if X.shape[1:3] != shape:
+        raise ValueError("dimension mismatch between X and filter: X.shape[1:3]=%s, filter shape=%s" % (str(X.shape[1:3]), str(shape)))
+    if MASK is not None and MASK.shape != X.shape[1:3] and MASK.shape != X.shape:
+        raise ValueError("dimension mismatch between X and MASK: X.shape=%s, MASK.shape=%s" % \
+            (str(X.shape), str(MASK.shape)))
+    if np.any(~np.isfinite(X)):
+        raise ValueError("X contains non-finite values")
+    
+    if X.dtype in [np.float32, np.complex64]:
+        dtype,cdtype = np.float32,np.complex64
+    else:
+        dtype,cdtype = np.float64,np.complex128
+    
+    F = fft.rfft2(X, axes=(-2, -1), threads=num_workers)
+    F = F.astype(cdtype, copy=False)
+    
+    if MASK is not None:
+        MASK = np.broadcast_to(MASK, X.shape).reshape((X.shape[0], -1))
+        counts = np.sum(MASK, axis=1)
+    
+    n = len(filter["weights_1d"])
+    X_decomp = np.empty((X.shape[0], n) + tuple(shape), dtype=dtype)
+    means    = np.empty((X.shape[0], n))
+    stds     = np.empty((X.shape[0], n))
+    F_k = np.zeros(F.shape, dtype=F.dtype)
+    for k in range(n):
+        F_k = _get_level_spectrum(F, filter, k, dtype, out=F_k)
+        X_decomp[:, k, :, :] = fft.irfft2(F_k, s=shape, axes=(-2, -1), 
+                                          threads=num_workers)
+        
+        X_k = X_decomp[:, k, :, :].reshape((X.shape[0], -1))
+        if MASK is None:
+            means[:, k] = np.mean(X_k, axis=1, dtype=np.float64)
+            stds[:, k]  = np.std(X_k, axis=1, dtype=np.float64)
+        else:
+            mu = np.sum(X_k, axis=1, where=MASK, dtype=np.float64) / counts
+            means[:, k] = mu
+            stds[:, k]  = np.sqrt(np.sum((X_k - mu[:, np.newaxis])**2, axis=1, 
+                                         where=MASK, dtype=np.float64) / counts)
+    
+    result = {}
+    result["cascade_levels"] = X_decomp
+    result["means"] = means
+    result["stds"]  = stds
+    
+    return result
+
+def _decomposition_fft_rfft(F, filter, shape, MASK, dtype):
+    # the input is real, so the levels are obtained from the half-spectrum 
+    # with inverse real FFTs, and no shifted copies of the spectrum are needed
+    n = len(filter["weights_1d"])
+    
+    X_decomp = np.empty((n,) + tuple(shape), dtype=dtype)
+    means    = []
+    stds     = []
+    F_k = np.zeros(F.shape, dtype=F.dtype)
+    for k in range(n):
+        F_k = _get_level_spectrum(F, filter, k, dtype, out=F_k)
+        X_decomp[k, :, :] = fft.irfft2(F_k, s=shape)
+        
+        X_ = X_decomp[k, :, :]
+        if MASK is not None:
+            X_ = X_[MASK]
+        means.append(float(np.mean(X_, dtype=np.float64)))
+        stds.append(float(np.std(X_, dtype=np.float64)))
+    
+    result = {}
+    result["cascade_levels"] = X_decomp
+    result["means"] = means
+    result["stds"]  = stds
+    
+    return result
+
+def _decomposition_fft_spectral(F, filter, shape, dtype):
+    if bandpass_filters.is_compact(filter):
+        # the levels are scattered directly into the zeroed output array
+        X_decomp = np.zeros((len(filter["weights_1d"]),) + F.shape, 
+                            dtype=F.dtype)
+        for k in range(len(X_decomp)):
+            _get_level_spectrum(F, filter, k, dtype, out=X_decomp[k])
+    else:
+        X_decomp = F[np.newaxis, :, :] * \
+            get_rfft_weights(filter).astype(dtype, copy=False)
+    means,stds = compute_spectral_stats(X_decomp, shape)
     
     result = {}
-    means  = []
-    stds   = []
+    result["cascade_levels"] = X_decomp
+    result["means"] = means
+    result["stds"]  = stds
+    
+    return result
+
+def _get_level_spectrum(F, filter, k, dtype, out=None):
+    # Multiply the half-spectrum F (or a stack of half-spectra along the 
+    # leading axes) with the weights of the kth band. For a compact filter, 
+    # only the wavenumbers in the support of the band are touched. The result 
+    # can be written to out, which must be zero outside the support of band 
+    # k-1 (e.g. the output of the previous band, or zeros if k=0). Then only 
+    # the previous support is cleared, and no new array is allocated.
+    if not bandpass_filters.is_compact(filter):
+        return F * get_rfft_weights(filter, k).astype(dtype, copy=False)
+    
+    if out is None:
+        F_k = np.zeros(F.shape, dtype=F.dtype)
+    else:
+        F_k = out
+        if k > 0:
+            idx,_ = bandpass_filters.get_support(filter, k-1)
+            F_k.reshape(F.shape[:-2] + (-1,))[..., idx] = 0.0
+    
+    idx,w = bandpass_filters.get_support(filter, k)
+    F_k.reshape(F.shape[:-2] + (-1,))[..., idx] = \
+        F.reshape(F.shape[:-2] + (-1,))[..., idx] * w.astype(dtype, copy=False)
+    
+    return F_k
+
+def _decomposition_fft_multiresolution(F, filter, shape_in, domain, tol, dtype):
+    M,N = shape_in
     
-    F = fft.fftshift(fft.fft2(X, **fft_kwargs))
     X_decomp = []
-    for k in range(len(filter["weights_1d"])):
-        W_k = filter["weights_2d"][k, :, :]
-        X_ = np.real(fft.ifft2(fft.ifftshift(F*W_k), **fft_kwargs))
-        X_decomp.append(X_)
+    means    = []
+    stds     = []
+    for k,shape in enumerate(get_level_shapes(filter, tol)):
+        # the scaling keeps the values of the field when the number of grid 
+        # points changes
+        c = 1.0*shape[0]*shape[1] / (M*N)
+        F_k = crop_rfft_spectrum(F, shape)
+        F_k *= _get_cropped_weights(filter, k, shape).astype(dtype, copy=False) * c
         
+        if domain == "spectral":
+            X_decomp.append(F_k)
+            mu,sigma = compute_spectral_stats(F_k[np.newaxis, :, :], shape)
+            means.append(mu[0])
+            stds.append(sigma[0])
+        else:
+            X_ = fft.irfft2(F_k, s=shape).astype(dtype, copy=False)
+            X_decomp.append(X_)
+            means.append(float(np.mean(X_, dtype=np.float64)))
+            stds.append(float(np.std(X_, dtype=np.float64)))
+    
+    result = {}
+    result["cascade_levels"] = X_decomp
+    result["means"] = means
+    result["stds"]  = stds
+    
+    return result
+
+# the binomial kernel of the Burt-Adelson pyramid
+_PYRAMID_KERNEL = np.array([1.0, 4.0, 6.0, 4.0, 1.0]) / 16.0
+
+def decomposition_pyramid(X, filter, **kwargs):
+    """Decompose a 2d input field into multiple spatial scales by using a 
+    Laplacian pyramid (Burt and Adelson, 1983). The field is repeatedly 
+    smoothed with a separable binomial filter and decimated by a factor of two, 
+    and each level is the difference between a smoothed field and the 
+    expansion of the next coarser one. The coarsest level is the most smoothed 
+    field. The cost is linear in the number of grid points, and the input field 
+    can have any shape, so no padding to a square domain is needed.
+    
+    As with decomposition_fft, the first level contains the largest scales, 
+    and the cascade levels sum up to the input field.
+    
+    Parameters
+    ----------
+    X : array_like
+      Two-dimensional array containing the input field. All values are required 
+      to be finite.
+    filter : dict
+      A filter returned by any method implemented in bandpass_filters.py. Only 
+      the number of cascade levels is taken from the filter, and the shape of 
+      the filter does not need to match that of X.
+    
+    Optional kwargs
+    ---------------
+    MASK : array_like
+      Optional mask to use for computing the statistics for the cascade levels. 
+      Pixels with MASK==False are excluded from the computations.
+    decimate : bool
+      If True, return the levels on the decimated grids of the pyramid (see the 
+      module documentation), where the shape of a level is that of the next 
+      finer level divided by two and rounded up. The means and standard 
+      deviations are then computed from the decimated levels, and MASK cannot 
+      be used. If False (the default), the levels are expanded to the 
+      resolution of X.
+    
+    Returns
+    -------
+    out : dict
+      A dictionary described in the module documentation. If X is a 
+      single-precision array, the cascade levels are returned as a 
+      single-precision array. The means and standard deviations are 
+      accumulated in double precision.
+    """
+    MASK     = kwargs.get("MASK", None)
+    decimate = kwargs.get("decimate", False)
+    
+    if len(X.shape) != 2:
+        raise ValueError("the input is not two-dimensional array")
+    if MASK is not None and MASK.shape != X.shape:
+        raise ValueError("dimension mismatch between X and MASK: X.shape=%s, MASK.shape=%s" % \
+            (str(X.shape), str(MASK.shape)))
+    if np.any(~np.isfinite(X)):
+        raise ValueError("X contains non-finite values")
+    if decimate and MASK is not None:
+        raise ValueError("MASK cannot be used with decimate=True")
+    
+    n = len(filter["weights_1d"])
+    shapes = _get_pyramid_shapes(X.shape, n)
+    if min(shapes[-1]) < 2:
+        raise ValueError("the input field of shape %s is too small for %d pyramid levels" % (str(X.shape), n))
+    
+    dtype = np.float32 if X.dtype == np.float32 else np.float64
+    
+    # the Laplacian pyramid from the finest to the coarsest level
+    G = X.astype(dtype, copy=False)
+    levels = []
+    for k in range(1, n):
+        G_next = _reduce_pyramid_level(G)
+        levels.append(G - _expand_pyramid_level(G_next, shapes[k-1]))
+        G = G_next
+    levels.append(G)
+    levels = levels[::-1]
+    
+    if not decimate:
+        levels = np.stack([expand_pyramid_level(X_, X.shape) for X_ in levels])
+    
+    means = []
+    stds  = []
+    for X_ in levels:
         if MASK is not None:
             X_ = X_[MASK]
-        means.append(np.mean(X_))
-        stds.append(np.std(X_))
+        means.append(float(np.mean(X_, dtype=np.float64)))
+        stds.append(float(np.std(X_, dtype=np.float64)))
     
-    result["cascade_levels"] = np.stack(X_decomp)
+    result = {}
+    result["cascade_levels"] = levels
     result["means"] = means
     result["stds"]  = stds
     
     return result
+
+def expand_pyramid_level(X, shape):
+    """Expand a level returned by decomposition_pyramid with decimate=True to 
+    the resolution of the input field. The level is upsampled by a factor of two 
+    and interpolated with the pyramid filter until its shape matches the given 
+    one.
+    
+    Parameters
+    ----------
+    X : array_like
+      Two-dimensional array containing the decimated level.
+    shape : tuple
+      The shape (M,N) of the input field of the decomposition.
+    
+    Returns
+    -------
+    out : ndarray
+      Array of shape (M,N) containing the expanded level.
+    """
+    shapes = _get_pyramid_shapes(shape, int(np.log2(max(shape)))+2)
+    if tuple(X.shape) not in shapes:
+        raise ValueError("the shape %s of X does not belong to the pyramid of a field of shape %s" % (str(X.shape), str(shape)))
+    
+    for shape_ in shapes[:shapes.index(tuple(X.shape))][::-1]:
+        X = _expand_pyramid_level(X, shape_)
+    
+    return X
+
+def _get_pyramid_shapes(shape, n):
+    # the grid shapes of the pyramid from the finest to the coarsest level
+    shapes = [tuple(int(l) for l in shape)]
+    for k in range(1, n):
+        shapes.append(tuple(int((l+1)/2) for l in shapes[-1]))
+    
+    return shapes
+
+def _reduce_pyramid_level(X):
+    # smooth with the separable pyramid filter and take every other grid point
+    X = ndimage.convolve1d(X, _PYRAMID_KERNEL.astype(X.dtype), axis=0, 
+                           mode="reflect")
+    X = ndimage.convolve1d(X, _PYRAMID_KERNEL.astype(X.dtype), axis=1, 
+                           mode="reflect")
+    
+    return X[::2, ::2]
+
+def _expand_pyramid_level(X, shape):
+    # insert zeros between the grid points and interpolate with the pyramid 
+    # filter, the factor 2 per axis compensates for the inserted zeros
+    X_e = np.zeros(shape, dtype=X.dtype)
+    X_e[::2, ::2] = X
+    w = 2.0 * _PYRAMID_KERNEL.astype(X.dtype)
+    X_e = ndimage.convolve1d(X_e, w, axis=0, mode="reflect")
+    X_e = ndimage.convolve1d(X_e, w, axis=1, mode="reflect")
+    
+    return X_e
+
+def compute_spectral_stats(F, shape):
+    """Compute the means and standard deviations of the fields corresponding to 
+    the given real FFT spectra by using Parseval's theorem: 
+    sum(x**2) = sum(|F|**2)/(M*N).
+    
+    Parameters
+    ----------
+    F : array_like
+      Array of shape (...,M,N/2+1) containing real FFT spectra (in the layout 
+      of numpy.fft.rfft2) of fields of shape (M,N).
+    shape : tuple
+      The shape (M,N) of the fields.
+    
+    Returns
+    -------
+    out : tuple
+      Two lists containing the means and standard deviations of the fields 
+      (flattened over the leading dimensions of F).
+    """
+    M,N = shape
+    
+    # the squared magnitudes of the half spectrum are weighted so that they 
+    # account for the omitted conjugate-symmetric half
+    c = np.full(F.shape[-1], 2.0)
+    c[0] = 1.0
+    if N % 2 == 0:
+        c[-1] = 1.0
+    
+    S = np.sum(np.abs(F)**2 * c, axis=(-2, -1), dtype=np.float64)
+    means = F[..., 0, 0].real.astype(np.float64) / (M*N)
+    stds  = np.sqrt(np.maximum(S / (M*N)**2 - means**2, 0.0))
+    
+    return [float(m) for m in means.flat],[float(s) for s in stds.flat]
+
+def get_level_shapes(filter, tol=1e-4):
+    """Determine the grid resolutions for representing the cascade levels 
+    of a band-pass filter at a resolution matching their frequency bands. The 
+    size of the grid of a level is chosen so that all wavenumbers where the 
+    1d filter weights are at least tol are below its Nyquist frequency.
+    
+    Parameters
+    ----------
+    filter : dict
+      A filter returned by any method implemented in bandpass_filters.py.
+    tol : float
+      The filter weights below this value are neglected.
+    
+    Returns
+    -------
+    out : list
+      List of tuples (m,n) containing the grid shape of each cascade level. 
+      The shapes do not exceed the shape of the input field.
+    """
+    M,N = bandpass_filters.get_filter_shape(filter)
+    w = filter["weights_1d"]
+    
+    shapes = []
+    for k in range(w.shape[0]):
+        r = np.where(w[k, :] >= tol)[0]
+        r = r[-1] if len(r) > 0 else 0
+        # one extra wavenumber is included because the 2d weights are evaluated 
+        # at non-integer radii, and the Nyquist wavenumber is excluded
+        l = _next_fft_size(2*(r+2))
+        shapes.append((l if l < M-1 else M, l if l < N-1 else N))
+    
+    return shapes
+
+def _next_fft_size(l):
+    # the smallest even number >= l whose prime factors are 2, 3 and 5
+    while True:
+        r = l
+        for p in [2, 3, 5]:
+            while r % p == 0:
+                r /= p
+        if r == 1 and l % 2 == 0:
+            return l
+        l += 1
+
+def crop_rfft_spectrum(F, shape):
+    """Crop a real FFT spectrum (in the layout of numpy.fft.rfft2) of a field 
+    to the spectrum of a field with a lower resolution. The wavenumbers that 
+    cannot be represented on the smaller grid are discarded, and the Nyquist 
+    wavenumbers of the smaller grid are set to zero. The values are not 
+    scaled.
+    
+    Parameters
+    ----------
+    F : array_like
+      Array of shape (M,N/2+1) containing the real FFT spectrum of a field of 
+      shape (M,N).
+    shape : tuple
+      The shape (m,n) of the target field, where m and n are even numbers or 
+      equal to M and N, respectively.
+    
+    Returns
+    -------
+    out : ndarray
+      Array of shape (m,n/2+1) containing the cropped spectrum.
+    """
+    M = F.shape[0]
+    m,n = shape
+    
+    rows_src,rows_dst = _get_crop_indices(M, m)
+    F_c = np.zeros((m, int(n/2)+1), dtype=F.dtype)
+    if int(n/2)+1 == F.shape[1]:
+        F_c[rows_dst, :] = F[rows_src, :]
+    else:
+        F_c[rows_dst, :int(n/2)] = F[rows_src, :int(n/2)]
+    
+    return F_c
+
+def pad_rfft_spectrum(F, shape):
+    """Inverse of crop_rfft_spectrum: pad a real FFT spectrum of a field with 
+    zeros to the spectrum of a field with a higher resolution. The values are 
+    not scaled.
+    
+    Parameters
+    ----------
+    F : array_like
+      Array of shape (m,n/2+1) containing the real FFT spectrum of a field of 
+      shape (m,n), where m and n are even numbers or equal to M and N, 
+      respectively.
+    shape : tuple
+      The shape (M,N) of the target field.
+    
+    Returns
+    -------
+    out : ndarray
+      Array of shape (M,N/2+1) containing the padded spectrum. A cascade level 
+      returned by decomposition_fft with multiresolution=True is transformed 
+      to the resolution of the input field by multiplying the padded spectrum 
+      with M*N/(m*n) and applying numpy.fft.irfft2.
+    """
+    M,N = shape
+    m = F.shape[0]
+    
+    rows_src,rows_dst = _get_crop_indices(M, m)
+    F_p = np.zeros((M, int(N/2)+1), dtype=F.dtype)
+    if F.shape[1] == F_p.shape[1]:
+        F_p[rows_src, :] = F[rows_dst, :]
+    else:
+        n2 = F.shape[1] - 1
+        F_p[rows_src, :n2] = F[rows_dst, :n2]
+    
+    return F_p
+
+def _get_crop_indices(M, m):
+    # Return the indices of the rows of a spectrum with M rows and the 
+    # corresponding rows of a cropped spectrum with m rows. The Nyquist row of 
+    # the cropped spectrum is excluded.
+    if m == M:
+        return np.arange(M),np.arange(M)
+    
+    h = int(m/2)
+    rows_src = np.hstack([np.arange(h), np.arange(M-h+1, M)])
+    rows_dst = np.hstack([np.arange(h), np.arange(m-h+1, m)])
+    
+    return rows_src,rows_dst
+
+def get_rfft_weights(filter, k=None):
+    """Return the 2d filter weights of a band-pass filter in the layout of 
+    numpy.fft.rfft2, i.e. without the zero frequency shifted to the center and 
+    without the negative frequencies along the last axis.
+    
+    Parameters
+    ----------
+    filter : dict
+      A filter returned by any method implemented in bandpass_filters.py.
+    k : int
+      If not None, return only the weights of the kth band.
+    
+    Returns
+    -------
+    out : ndarray
+      Array of shape (n,M,N/2+1) containing the filter weights, where (M,N) is 
+      the shape of the input field, or an array of shape (M,N/2+1) if k is 
+      given. If filter contains the key 'weights_2d_rfft', the corresponding 
+      array is returned. For a compact filter (see bandpass_filters.py), the 
+      dense weights are reconstructed from the supports of the bands, which 
+      should be avoided for large fields.
+    """
+    if "weights_2d_rfft" in filter.keys():
+        W = filter["weights_2d_rfft"]
+        return W if k is None else W[k, :, :]
+    
+    if bandpass_filters.is_compact(filter):
+        M,N = bandpass_filters.get_filter_shape(filter)
+        bands = range(len(filter["weights_1d"])) if k is None else [k]
+        W = np.zeros((len(bands), M, int(N/2)+1), 
+                     dtype=filter["support_weights"].dtype)
+        for i,k_ in enumerate(bands):
+            idx,w = bandpass_filters.get_support(filter, k_)
+            W[i, :, :].flat[idx] = w
+        return W if k is None else W[0, :, :]
+    
+    if k is None:
+        W = fft.ifftshift(filter["weights_2d"], axes=(1, 2))
+    else:
+        W = fft.ifftshift(filter["weights_2d"][k, :, :])
+    
+    return np.ascontiguousarray(W[..., :int(W.shape[-1]/2)+1])
+
+def _get_cropped_weights(filter, k, shape):
+    # Return the weights of the kth band cropped to the half-spectrum of a 
+    # field of the given shape (see crop_rfft_spectrum). The support of a 
+    # compact filter is scattered directly into the cropped spectrum.
+    if not bandpass_filters.is_compact(filter):
+        return crop_rfft_spectrum(get_rfft_weights(filter, k), shape)
+    
+    M,N = bandpass_filters.get_filter_shape(filter)
+    m,n = shape
+    
+    idx,w = bandpass_filters.get_support(filter, k)
+    rows,cols = np.divmod(idx, int(N/2)+1)
+    
+    # map the rows of the full spectrum to those of the cropped spectrum, the 
+    # discarded rows are marked with -1
+    rows_src,rows_dst = _get_crop_indices(M, m)
+    row_map = -np.ones(M, dtype=int)
+    row_map[rows_src] = rows_dst
+    rows = row_map[rows]
+    
+    mask = rows >= 0
+    if n != N:
+        # the Nyquist column of the cropped spectrum is excluded
+        mask &= cols < int(n/2)
+    
+    W_c = np.zeros((m, int(n/2)+1), dtype=w.dtype)
+    W_c[rows[mask], cols[mask]] = w[mask]
+    
+    return W_c
@@ -24,12 +24,17 @@ def get_method(name):
     |  fft              | decomposition based on Fast Fourier Transform (FFT)    |
     |                   | and a bandpass filter                                  |
     +-------------------+--------------------------------------------------------+
+    |  pyramid          | Laplacian pyramid decomposition with separable spatial |
+    |                   | filtering and decimation                               |
+    +-------------------+--------------------------------------------------------+
     """
     if name == "fft":
         return decomposition.decomposition_fft
+    elif name == "pyramid":
+        return decomposition.decomposition_pyramid
     elif name == "gaussian":
         return bandpass_filters.filter_gaussian
     elif name == "uniform":
         return bandpass_filters.filter_uniform
     else:
-        raise ValueError("unknown method %s, the currently implemented methods are 'fft', 'gaussian' and 'uniform'" % name)
+        raise ValueError("unknown method %s, the currently implemented methods are 'fft', 'pyramid', 'gaussian' and 'uniform'" % name)
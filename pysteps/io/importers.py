@@ -33,6 +33,9 @@ The metadata dictionary contains the following mandatory key-value pairs:
                     and accutime of the data. 
     zerovalue       it is the value assigned to the no rain pixels with the same 
                     unit, transformation and accutime of the data. 
+
+All methods accept the optional keyword argument dtype for specifying the data 
+type of the precipitation field (default 'float64').
 """
 
 import datetime
@@ -69,6 +72,12 @@ def import_bom_rf3(filename, **kwargs):
     filename : str
         Name of the file to import.
 
+    Optional kwargs
+    ---------------
+    dtype : str
+        The data type of the output precipitation field, e.g. 'float32' to 
+        halve the memory usage. Default : 'float64'
+
     Returns
     -------
     out : tuple
@@ -79,7 +88,9 @@ def import_bom_rf3(filename, **kwargs):
     if not netcdf4_imported:
         raise Exception("netCDF4 not imported")
 
-    R = _import_bom_rf3_data(filename)
+    dtype = kwargs.get("dtype", "float64")
+
+    R = _import_bom_rf3_data(filename).astype(dtype, copy=False)
    
     geodata = _import_bom_rf3_geodata(filename)
     metadata = geodata
@@ -181,6 +192,9 @@ def import_fmi_pgm(filename, **kwargs):
     ---------------
     gzipped : bool
         If True, the input file is treated as a compressed gzip file.
+    dtype : str
+        The data type of the output precipitation field, e.g. 'float32' to 
+        halve the memory usage. Default : 'float64'
 
     Returns
     -------
@@ -193,6 +207,7 @@ def import_fmi_pgm(filename, **kwargs):
         raise Exception("pyproj not imported")
 
     gzipped = kwargs.get("gzipped", False)
+    dtype   = kwargs.get("dtype", "float64")
 
     pgm_metadata = _import_fmi_pgm_metadata(filename, gzipped=gzipped)
 
@@ -203,9 +218,10 @@ def import_fmi_pgm(filename, **kwargs):
     geodata = _import_fmi_pgm_geodata(pgm_metadata)
 
     MASK = R == pgm_metadata["missingval"]
-    R = R.astype(float)
+    R = R.astype(dtype)
     R[MASK] = np.nan
-    R = (R - 64.0) / 2.0
+    R -= 64.0
+    R /= 2.0
 
     metadata = geodata
     metadata["institution"] = "Finnish Meteorological Institute"
@@ -299,6 +315,9 @@ def import_mch_gif(filename, **kwargs):
 		Options:
 			- "AQC" (AQUIRE)
 			- "RZC" (PRECIP)
+    dtype : str
+        The data type of the output precipitation field, e.g. 'float32' to 
+        halve the memory usage. Default : 'float64'
 
     Returns
     -------
@@ -311,6 +330,7 @@ def import_mch_gif(filename, **kwargs):
         raise Exception("PIL not imported")
 
     product = kwargs.get("product", "AQC")
+    dtype   = kwargs.get("dtype", "float64")
 
     geodata = _import_mch_gif_geodata()
 
@@ -333,7 +353,8 @@ def import_mch_gif(filename, **kwargs):
                 lut[i] = (10.**((i - 71.2)/20.0)/A)**(1.0/b)
 
         # apply lookup table [mm/h]
-        R = lut[B]*12
+        lut *= 12
+        R = lut.astype(dtype)[B]
 
     elif product == "RZC":
 
@@ -346,7 +367,7 @@ def import_mch_gif(filename, **kwargs):
         lut = dict(zip(zip(lut[:, 1], lut[:,2], lut[:,3]), lut[:,-1]))
 
         # apply lookup table conversion
-        R = np.zeros(len(Brgb.getdata()))
+        R = np.zeros(len(Brgb.getdata()), dtype=dtype)
         for i,dn in enumerate(Brgb.getdata()):
             R[i] = lut.get(dn, np.nan)
 
@@ -421,6 +442,9 @@ def import_odim_hdf5(filename, **kwargs):
         are: 'RATE'=instantaneous rain rate (mm/h), 'ACRR'=hourly rainfall
         accumulation (mm) and 'DBZH'=max-reflectivity (dBZ). The default value
         is 'RATE'.
+    dtype : str
+        The data type of the output precipitation field, e.g. 'float32' to 
+        halve the memory usage. Default : 'float64'
 
     Returns
     -------
@@ -433,7 +457,8 @@ def import_odim_hdf5(filename, **kwargs):
     if not h5py_imported:
         raise Exception("h5py not imported")
 
-    qty = kwargs.get("qty", "RATE")
+    qty   = kwargs.get("qty", "RATE")
+    dtype = kwargs.get("dtype", "float64")
 
     if qty not in ["ACRR", "DBZH", "RATE"]:
         raise ValueError("unknown quantity %s: the available options are 'ACRR', 'DBZH' and 'RATE'")
@@ -466,7 +491,7 @@ def import_odim_hdf5(filename, **kwargs):
                         MASK = np.logical_and(~MASK_U, ~MASK_N)
 
                         if qty_.decode() == qty:
-                            R = np.empty(ARR.shape)
+                            R = np.empty(ARR.shape, dtype=dtype)
                             R[MASK]   = ARR[MASK] * gain + offset
                             R[MASK_U] = 0.0
                             R[MASK_N] = np.nan
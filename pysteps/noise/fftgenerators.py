@@ -23,27 +23,59 @@ where F (m, n) is a filter returned from an initialization method, and randstate
 and seed can be used to set the random generator and its seed. Additional 
 keyword arguments can be included as a dictionary.
 The output of each generator method is a two-dimensional array containing the 
-field of correlated noise cN of shape (m, n)."""
+field of correlated noise cN of shape (m, n). If the filter F is a 
+single-precision array, the noise is generated with single-precision FFTs and 
+returned as a single-precision array.
 
+The global Fourier filter also has a batched generator
+
+  generate_noise_2d_fft_filter_batch(F, num_fields=None, randstates=None, seed=None)
+
+that returns a three-dimensional array of shape (k, m, n) containing k fields 
+of correlated noise, e.g. one for each ensemble member. The fields are drawn 
+from k independent random generators (see 
+pysteps.noise.utils.get_random_generators), and they are filtered with real 
+FFTs computed over the whole batch. The ith field depends only on the ith 
+generator, so the results do not depend on how the fields are batched.
+
+For decomposing the noise into a cascade, the global Fourier filter also has a 
+generator
+
+  generate_noise_2d_fft_filter_cascade(F, filter, randstate=np.random, seed=None)
+
+that applies the noise filter F and the band-pass filter directly to the 
+spectrum of the white noise. It returns a dictionary in the format of 
+pysteps.cascade.decomposition, where the cascade levels are normalized to zero 
+mean and unit variance.
+
+The local filters of the SSFT and nested methods can be converted into a plan 
+with initialize_ssft_plan. The plan contains the window geometry, the tapering 
+masks and compact local filters, and it can be passed to 
+generate_noise_2d_ssft_filter instead of F, so that the noise is filtered with 
+FFTs of the padded local windows instead of the whole domain. The plan is an 
+approximation, because the convolution kernels of the local filters are 
+truncated to the padding.
+
+With the keyword argument compact=True, the SSFT and nested initialization 
+methods return a compact filter bank instead of the four-dimensional array F. 
+The bank is a dictionary that stores each distinct local filter only once as a 
+half-spectrum in the layout of numpy.fft.rfft2 (or as a radially averaged 
+profile), and an index array maps the windows to the filters. The windows 
+whose filter is not modified from the global filter share the first filter of 
+the bank. The filter banks can be passed to generate_noise_2d_ssft_filter and 
+initialize_ssft_plan instead of F."""
+
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+from ..utils import cache
+from ..utils import fftbackend as fft
+from ..utils import spectral
 
 # TODO: Update the methods so that they allow inputs with non-square shapes.
 
-# Use the pyfftw interface if it is installed. If not, fall back to the fftpack 
-# interface provided by SciPy, and finally to numpy if SciPy is not installed.
-try:
-    import pyfftw.interfaces.numpy_fft as fft
-    import pyfftw
-    # TODO: Caching and multithreading currently disabled because they give a 
-    # segfault with dask.
-    #pyfftw.interfaces.cache.enable()
-    fft_kwargs = {"threads":1, "planner_effort":"FFTW_ESTIMATE"}
-except ImportError:
-    import scipy.fftpack as fft
-    fft_kwargs = {}
-except ImportError:
-    import numpy.fft as fft
-    fft_kwargs = {}
+from .utils import get_random_generators, seed_generator
+from ..cascade import bandpass_filters
+from ..cascade import decomposition
 
 def initialize_param_2d_fft_filter(X, **kwargs):
     """Takes a 2d input field and produces a fourier filter by using the Fast 
@@ -99,7 +131,7 @@ def initialize_param_2d_fft_filter(X, **kwargs):
     if model.lower() == 'power-law':
        
         # compute radially averaged PSD
-        psd = _rapsd(X*tapering)
+        psd = spectral.rapsd(X*tapering)
         
         # wavenumbers
         if L % 2 == 0:
@@ -115,12 +147,7 @@ def initialize_param_2d_fft_filter(X, **kwargs):
         beta = -p0[0]
         
         # compute 2d filter
-        if L % 2 == 1:
-            XC,YC = np.ogrid[-int(L/2):int(L/2)+1, -int(L/2):int(L/2)+1]
-        else:
-            XC,YC = np.ogrid[-int(L/2):int(L/2), -int(L/2):int(L/2)]
-        R = np.sqrt(XC*XC + YC*YC)
-        R = fft.fftshift(R)
+        R = fft.fftshift(spectral.get_radius_map((L, L)))
         F = R**(-beta)
         F[~np.isfinite(F)] = 1
     
@@ -170,7 +197,7 @@ def initialize_nonparam_2d_fft_filter(X, **kwargs):
         tapering = build_2D_tapering_function(X.shape, win_type)
     else:
         tapering = np.ones_like(X)
-    F = fft.fft2(X*tapering, **fft_kwargs)
+    F = fft.fft2(X*tapering)
     
     # normalize the real and imaginary parts
     if donorm:
@@ -188,10 +215,12 @@ def generate_noise_2d_fft_filter(F, randstate=np.random, seed=None):
         Two-dimensional array containing the input filter. 
         It can be computed by related methods.
         All values are required to be finite.
-    randstate : mtrand.RandomState
+    randstate : mtrand.RandomState or numpy.random.Generator
         Optional random generator to use. If set to None, use numpy.random.
     seed : int
-        Value to set a seed for the generator. None will not set the seed.
+        Value to set a seed for the generator. None will not set the seed. A 
+        numpy.random.Generator cannot be reseeded, so it is replaced with a new 
+        one initialized with the seed (see pysteps.noise.utils.seed_generator).
     
     Returns
     -------
@@ -205,19 +234,176 @@ def generate_noise_2d_fft_filter(F, randstate=np.random, seed=None):
       raise ValueError("F contains non-finite values")
     
     # set the seed
-    if seed is not None:
-        randstate.seed(seed)
+    randstate = seed_generator(randstate, seed)
+    
+    dtype,cdtype = _get_dtypes(F)
     
     # produce fields of white noise
-    N = randstate.randn(F.shape[0], F.shape[1])
+    N = randstate.standard_normal(F.shape).astype(dtype, copy=False)
     
     # apply the global Fourier filter to impose a correlation structure
-    fN = fft.fft2(N, **fft_kwargs)
+    fN = fft.fft2(N).astype(cdtype, copy=False)
     fN *= F
-    N = np.array(fft.ifft2(fN, **fft_kwargs).real)
+    N = np.array(fft.ifft2(fN).real, dtype=dtype)
     N = (N - N.mean())/N.std()
     
     return N
+
+def generate_noise_2d_fft_filter_cascade(F, filter, randstate=np.random, 
+                                         seed=None, **kwargs):
+    """Produces a field of correlated noise using global Fourier filtering, and 
+    decomposes it into a cascade by using the given band-pass filter. This is 
+    equivalent to decomposing the output of generate_noise_2d_fft_filter with 
+    pysteps.cascade.decomposition.decomposition_fft and normalizing the 
+    cascade levels, but the noise field is not transformed back to the 
+    spatial domain before the decomposition. The same white noise is drawn 
+    from randstate as in generate_noise_2d_fft_filter.
+    
+    Parameters
+    ----------
+    F : array-like
+        Two-dimensional array containing the input filter. 
+        It can be computed by related methods.
+        All values are required to be finite.
+    filter : dict
+        A band-pass filter returned by any method implemented in 
+        pysteps.cascade.bandpass_filters. Its shape must match that of F.
+    randstate : mtrand.RandomState or numpy.random.Generator
+        Optional random generator to use. If set to None, use numpy.random.
+    seed : int
+        Value to set a seed for the generator. None will not set the seed. A 
+        numpy.random.Generator cannot be reseeded, so it is replaced with a new 
+        one initialized with the seed (see pysteps.noise.utils.seed_generator).
+    
+    Optional kwargs
+    ---------------
+    domain : str
+        If 'spatial' (the default), the cascade levels are returned as spatial 
+        fields. If 'spectral', they are returned as real FFT spectra. See 
+        pysteps.cascade.decomposition.
+    multiresolution : bool
+        If True, each cascade level is returned at a resolution matching its 
+        frequency band. See pysteps.cascade.decomposition.
+        Default : False
+    multiresolution_tol : float
+        See pysteps.cascade.decomposition.
+        Default : 1e-4
+    
+    Returns
+    -------
+    out : dict
+        A dictionary described in pysteps.cascade.decomposition. The cascade 
+        levels are normalized to zero mean and unit variance, and the means 
+        and standard deviations are those of the cascade levels of the noise 
+        field normalized as in generate_noise_2d_fft_filter.
+    """
+    
+    if len(F.shape) != 2:
+        raise ValueError("the input is not two-dimensional array")
+    if np.any(~np.isfinite(F)):
+      raise ValueError("F contains non-finite values")
+    if F.shape != bandpass_filters.get_filter_shape(filter):
+        raise ValueError("dimension mismatch between F and filter: F.shape=%s, filter shape=%s" % (str(F.shape), str(bandpass_filters.get_filter_shape(filter))))
+    
+    domain = kwargs.get("domain", "spatial")
+    
+    # set the seed
+    randstate = seed_generator(randstate, seed)
+    
+    dtype,cdtype = _get_dtypes(F)
+    
+    # produce a field of white noise and apply the global Fourier filter to 
+    # its spectrum, the mean is removed by zeroing the zero-frequency component
+    N = randstate.standard_normal(F.shape).astype(dtype, copy=False)
+    fN = fft.rfft2(N).astype(cdtype, copy=False)
+    fN *= _get_rfft_filter(F)
+    fN[0, 0] = 0.0
+    N = None
+    
+    kwargs = kwargs.copy()
+    kwargs["input_domain"] = "spectral"
+    result = decomposition.decomposition_fft(fN, filter, **kwargs)
+    
+    # normalize the cascade levels in place, the zero-frequency components of 
+    # the spectra are already zero
+    levels = result["cascade_levels"]
+    for i in range(len(levels)):
+        if domain != "spectral":
+            levels[i] -= result["means"][i]
+        levels[i] /= result["stds"][i]
+    
+    # scale the statistics to those of a noise field with unit variance
+    sigma = decomposition.compute_spectral_stats(fN, F.shape)[1][0]
+    result["means"] = [mu / sigma for mu in result["means"]]
+    result["stds"]  = [s / sigma for s in result["stds"]]
+    
+    return result
+
+def generate_noise_2d_fft_filter_batch(F, num_fields=None, randstates=None, 
+                                       seed=None):
+    """Produces a batch of fields of correlated noise using global Fourier 
+    filtering. Each field is equivalent to one produced by 
+    generate_noise_2d_fft_filter, but the white noise is drawn from a separate 
+    random generator for each field, and the filtering is done with real FFTs 
+    over the whole batch.
+    
+    Parameters
+    ----------
+    F : array-like
+        Two-dimensional array containing the input filter. 
+        It can be computed by related methods.
+        All values are required to be finite.
+    num_fields : int
+        The number of fields to generate. Required if randstates is None.
+    randstates : list
+        Optional list of random generators (numpy.random.Generator or 
+        mtrand.RandomState), one for each field. If None, num_fields 
+        generators are created from the seed by using 
+        pysteps.noise.utils.get_random_generators.
+    seed : int
+        Seed for the generators created if randstates is None.
+    
+    Returns
+    -------
+    N : array-like
+        A three-dimensional numpy array of shape (k, m, n) containing k fields 
+        of stationary correlated noise with zero mean and unit variance.
+    """
+    
+    if len(F.shape) != 2:
+        raise ValueError("the input is not two-dimensional array")
+    if np.any(~np.isfinite(F)):
+      raise ValueError("F contains non-finite values")
+    
+    if randstates is None:
+        if num_fields is None:
+            raise ValueError("either num_fields or randstates must be given")
+        randstates = get_random_generators(seed, num_fields)
+    
+    dtype,cdtype = _get_dtypes(F)
+    
+    # produce fields of white noise, the generators write directly into the 
+    # batch array if they support it
+    N = np.empty((len(randstates), F.shape[0], F.shape[1]), dtype=dtype)
+    for i,randstate in enumerate(randstates):
+        if isinstance(randstate, np.random.Generator):
+            randstate.standard_normal(dtype=dtype, out=N[i, :, :])
+        else:
+            N[i, :, :] = randstate.standard_normal(F.shape)
+    
+    # apply the global Fourier filter to impose a correlation structure
+    fN = fft.rfft2(N, axes=(-2, -1)).astype(cdtype, copy=False)
+    fN *= _get_rfft_filter(F)
+    # the mean is removed by zeroing the zero-frequency component
+    fN[:, 0, 0] = 0.0
+    N = None
+    N = np.array(fft.irfft2(fN, s=F.shape, axes=(-2, -1)), 
+                 dtype=dtype, copy=False)
+    fN = None
+    
+    N /= N.std(axis=(1, 2), keepdims=True)
+    
+    return N
        
 def initialize_nonparam_2d_ssft_filter(X, **kwargs):
     """Function to compute the local Fourier filters using the Short-Space Fourier
@@ -250,12 +436,28 @@ def initialize_nonparam_2d_ssft_filter(X, **kwargs):
     war_thr : float [0,1]
         Threshold for the minimum fraction of rain needed for computing the FFT.
         Default : 0.1
+    compact : bool
+        If True, return a compact filter bank (see the module documentation) 
+        instead of a four-dimensional array.
+        Default : False
+    compact_dtype : string ['float64', 'float32']
+        The precision of the filters of a compact filter bank.
+        Default : float64
+    compact_encoding : string ['rfft', 'radial']
+        The encoding of the filters of a compact filter bank: half-spectra or 
+        radially averaged profiles. The radial profiles are much smaller, but 
+        they neglect the anisotropy of the local filters.
+        Default : rfft
+    num_workers : int
+        The number of threads for computing the local filters in parallel. The 
+        result does not depend on the number of threads.
+        Default : 1
 
     Returns
     -------
-    F : array-like
+    F : array-like or dict
         Four-dimensional array containing the 2d fourier filters distributed over
-        a 2d spatial grid.
+        a 2d spatial grid, or a compact filter bank if compact is True.
     """
     
     if len(X.shape) != 2:
@@ -270,6 +472,10 @@ def initialize_nonparam_2d_ssft_filter(X, **kwargs):
     win_type = kwargs.get('win_type', 'flat-hanning')
     overlap  = kwargs.get('overlap', 0.3)
     war_thr  = kwargs.get('war_thr', 0.1)
+    compact          = kwargs.get('compact', False)
+    compact_dtype    = kwargs.get('compact_dtype', 'float64')
+    compact_encoding = kwargs.get('compact_encoding', 'rfft')
+    num_workers      = kwargs.get('num_workers', 1)
     
     # make sure non-rainy pixels are set to zero
     min_value = np.min(X)
@@ -283,40 +489,44 @@ def initialize_nonparam_2d_ssft_filter(X, **kwargs):
        
     # SSFT algorithm 
     
-    # prepare indices
-    idxi = np.zeros((2, 1), dtype=int)
-    idxj = np.zeros((2, 1), dtype=int)
-    
     # number of windows
     num_windows_y = np.ceil( float(dim_y) / win_size[0] ).astype(int)
     num_windows_x = np.ceil( float(dim_x) / win_size[1] ).astype(int)
     
+    # indices of the windows
+    windows = _get_ssft_windows(dim, (num_windows_y, num_windows_x), win_size, 
+                                overlap)
+    
     # domain fourier filter
-    F0 = initialize_nonparam_2d_fft_filter(X, win_type, True)
+    F0 = initialize_nonparam_2d_fft_filter(X, win_type=win_type, donorm=True)
     # and allocate it to the final grid
-    F = np.zeros((num_windows_y, num_windows_x, F0.shape[0], F0.shape[1]))
-    F += F0[np.newaxis, np.newaxis, :, :]
+    if compact:
+        F = _init_filter_bank(F0, (num_windows_y, num_windows_x), 
+                              compact_dtype, compact_encoding)
+    else:
+        F = np.zeros((num_windows_y, num_windows_x, F0.shape[0], F0.shape[1]))
+        F += F0[np.newaxis, np.newaxis, :, :]
+    num_windows = (num_windows_y, num_windows_x)
+    
+    # compute the local filters of the windows with enough rain
+    newfilters = _compute_local_filters(X, windows.reshape((-1, 4)), win_type, 
+                                        war_thr, num_workers)
 
     # loop rows
-    for i in range(F.shape[0]):
+    for i in range(num_windows[0]):
         # loop columns
-        for j in range(F.shape[1]):
-        
-            # compute indices of local window
-            idxi[0] = np.max( (i*win_size[0] - overlap*win_size[0], 0) ).astype(int)
-            idxi[1] = np.min( (idxi[0] + win_size[0]  + overlap*win_size[0], dim_y) ).astype(int)
-            idxj[0] = np.max( (j*win_size[1] - overlap*win_size[1], 0) ).astype(int)
-            idxj[1] = np.min( (idxj[0] + win_size[1]  + overlap*win_size[1], dim_x) ).astype(int)
-       
-            # build localization mask
-            # TODO: the 0.01 rain threshold must be improved
-            mask = _get_mask(dim, idxi, idxj, win_type)
-            war = float(np.sum((X*mask) > 0.01)) / ((idxi[1]-idxi[0])*(idxj[1]-idxj[0]))
+        for j in range(num_windows[1]):
             
-            if war > war_thr:
-                # the new filter 
-                F[i, j, : ,:] = initialize_nonparam_2d_fft_filter(X*mask, None, True)
-                
+            newfilter = newfilters[i*num_windows[1]+j]
+            if newfilter is not None:
+                if compact:
+                    _add_bank_filter(F, newfilter, i, j)
+                else:
+                    F[i, j, : ,:] = _get_full_filter(newfilter, dim)
+    
+    if compact:
+        F = _finalize_filter_bank(F)
+    
     return F            
  
 def initialize_nonparam_2d_nested_filter(X, gridres=1.0, **kwargs):
@@ -341,12 +551,27 @@ def initialize_nonparam_2d_nested_filter(X, gridres=1.0, **kwargs):
     war_thr : float [0;1]
         Threshold for the minimum fraction of rain needed for computing the FFT.
         Default : 0.1
+    compact : bool
+        If True, return a compact filter bank (see the module documentation) 
+        instead of a four-dimensional array.
+        Default : False
+    compact_dtype : string ['float64', 'float32']
+        The precision of the filters of a compact filter bank.
+        Default : float64
+    compact_encoding : string ['rfft', 'radial']
+        The encoding of the filters of a compact filter bank. See 
+        initialize_nonparam_2d_ssft_filter.
+        Default : rfft
+    num_workers : int
+        The number of threads for computing the local filters of each level in 
+        parallel. The result does not depend on the number of threads.
+        Default : 1
 
     Returns
     -------
-    F : array-like
+    F : array-like or dict
         Four-dimensional array containing the 2d fourier filters distributed over
-        a 2d spatial grid.
+        a 2d spatial grid, or a compact filter bank if compact is True.
     """
     
     if len(X.shape) != 2:
@@ -361,6 +586,10 @@ def initialize_nonparam_2d_nested_filter(X, gridres=1.0, **kwargs):
     max_level = kwargs.get('max_level', 3)
     win_type  = kwargs.get('win_type', 'flat-hanning')
     war_thr   = kwargs.get('war_thr', 0.1)
+    compact          = kwargs.get('compact', False)
+    compact_dtype    = kwargs.get('compact_dtype', 'float64')
+    compact_encoding = kwargs.get('compact_encoding', 'rfft')
+    num_workers      = kwargs.get('num_workers', 1)
     
     # make sure non-rainy pixels are set to zero
     min_value = np.min(X)
@@ -384,42 +613,70 @@ def initialize_nonparam_2d_nested_filter(X, gridres=1.0, **kwargs):
     freq = fft.fftfreq(dim_y, gridres)
     fx,fy = np.meshgrid(freq, freq)
     freq_grid = np.sqrt(fx**2 + fy**2)
+    if compact:
+        # the filters of a compact filter bank are half-spectra
+        freq_grid = freq_grid[:, :int(dim_x/2)+1]
     
     # domain fourier filter
-    F0 = initialize_nonparam_2d_fft_filter(X, win_type, True)
+    F0 = initialize_nonparam_2d_fft_filter(X, win_type=win_type, donorm=True)
     # and allocate it to the final grid
-    F = np.zeros((2**max_level, 2**max_level, F0.shape[0], F0.shape[1]))
-    F += F0[np.newaxis, np.newaxis, :, :]
+    if compact:
+        F = _init_filter_bank(F0, (2**max_level, 2**max_level), compact_dtype, 
+                              compact_encoding)
+    else:
+        F = np.zeros((2**max_level, 2**max_level, F0.shape[0], F0.shape[1]))
+        F += F0[np.newaxis, np.newaxis, :, :]
     
     # now loop levels and build composite spectra
     level=0 
     while level < max_level:
 
+        # the indices of rainfall field and the field of fourier filters for 
+        # each sub-window of the level
+        Idxinext = []
+        Idxjnext = []
+        Idxipsdnext = []
+        Idxjpsdnext = []
         for m in range(len(Idxi)):
+            Idxinext_, Idxjnext_ = _split_field(Idxi[m, :], Idxj[m, :], 2)
+            Idxipsdnext_, Idxjpsdnext_ = _split_field(Idxipsd[m, :], Idxjpsd[m, :], 2)
+            Idxinext.append(Idxinext_)
+            Idxjnext.append(Idxjnext_)
+            Idxipsdnext.append(Idxipsdnext_)
+            Idxjpsdnext.append(Idxjpsdnext_)
+        Idxinext = np.vstack(Idxinext)
+        Idxjnext = np.vstack(Idxjnext)
+        Idxipsdnext = np.vstack(Idxipsdnext)
+        Idxjpsdnext = np.vstack(Idxjpsdnext)
         
-            # the indices of rainfall field
-            Idxinext, Idxjnext = _split_field(Idxi[m, :], Idxj[m, :], 2)
-            # the indices of the field of fourier filters
-            Idxipsdnext, Idxjpsdnext = _split_field(Idxipsd[m, :], Idxjpsd[m, :], 2)
-            
-            for n in range(len(Idxinext)):
+        # compute the local filters of the sub-windows with enough rain
+        newfilters = _compute_local_filters(X, np.hstack([Idxinext, Idxjnext]), 
+                                            win_type, war_thr, num_workers)
+        
+        for n in range(len(Idxinext)):
             
-                mask = _get_mask(dim, Idxinext[n, :], Idxjnext[n, :], win_type)
-                war = np.sum((X*mask) > 0.01)/float((Idxinext[n, 1] - Idxinext[n, 0])**2)
+            newfilter = newfilters[n]
+            if newfilter is not None:
+                if not compact:
+                    newfilter = _get_full_filter(newfilter, dim)
                 
-                if war > war_thr:
-                    # the new filter 
-                    newfilter = initialize_nonparam_2d_fft_filter(X*mask, None, True)
-                    
-                    # compute logistic function to define weights as function of frequency
-                    # k controls the shape of the weighting function
-                    # TODO: optimize parameters
-                    k = 0.05
-                    x0 = (Idxinext[n, 1] - Idxinext[n, 0])/2.
-                    merge_weights = 1/(1 + np.exp(-k*(1/freq_grid - x0)))
-                    newfilter *= (1 - merge_weights)
-                    
-                    # perform the weighted average of previous and new fourier filters
+                # compute logistic function to define weights as function of frequency
+                # k controls the shape of the weighting function
+                # TODO: optimize parameters
+                k = 0.05
+                x0 = (Idxinext[n, 1] - Idxinext[n, 0])/2.
+                merge_weights = 1/(1 + np.exp(-k*(1/freq_grid - x0)))
+                newfilter *= (1 - merge_weights)
+                
+                # perform the weighted average of previous and new fourier filters
+                if compact:
+                    # the windows of the block share the same filter
+                    k_parent = F["index"][Idxipsdnext[n, 0], Idxjpsdnext[n, 0]]
+                    newfilter += _get_bank_filter(F, k_parent)*merge_weights
+                    _add_bank_filter(F, newfilter, 
+                                     slice(Idxipsdnext[n, 0], Idxipsdnext[n, 1]), 
+                                     slice(Idxjpsdnext[n, 0], Idxjpsdnext[n, 1]))
+                else:
                     F[Idxipsdnext[n, 0]:Idxipsdnext[n, 1], Idxjpsdnext[n,0]:Idxjpsdnext[n, 1], :, :] *= merge_weights[np.newaxis, np.newaxis, :, :]
                     F[Idxipsdnext[n, 0]:Idxipsdnext[n, 1],Idxjpsdnext[n, 0]:Idxjpsdnext[n, 1], :, :] += newfilter[np.newaxis, np.newaxis, :, :] 
             
@@ -427,7 +684,10 @@ def initialize_nonparam_2d_nested_filter(X, gridres=1.0, **kwargs):
         level += 1
         Idxi, Idxj = _split_field((0, dim[0]), (0, dim[1]), 2**level)
         Idxipsd, Idxjpsd = _split_field((0, 2**max_level), (0, 2**max_level), 2**level)
-        
+    
+    if compact:
+        F = _finalize_filter_bank(F)
+    
     return F
 
 def generate_noise_2d_ssft_filter(F, randstate=np.random, seed=None, **kwargs):
@@ -435,13 +695,17 @@ def generate_noise_2d_ssft_filter(F, randstate=np.random, seed=None, **kwargs):
 
     Parameters
     ----------
-    F : array-like
+    F : array-like or dict
         Four-dimensional array containing the 2d fourier filters distributed over
-        a 2d spatial grid.
-    randstate : mtrand.RandomState
+        a 2d spatial grid, a compact filter bank (see the module documentation) 
+        or a plan returned by initialize_ssft_plan. With a plan, the overlap and 
+        win_type arguments are taken from the plan.
+    randstate : mtrand.RandomState or numpy.random.Generator
         Optional random generator to use. If set to None, use numpy.random.
     seed : int
-        Value to set a seed for the generator. None will not set the seed.
+        Value to set a seed for the generator. None will not set the seed. A 
+        numpy.random.Generator cannot be reseeded, so it is replaced with a new 
+        one initialized with the seed (see pysteps.noise.utils.seed_generator).
         
     Optional kwargs
     ---------------
@@ -451,6 +715,10 @@ def generate_noise_2d_ssft_filter(F, randstate=np.random, seed=None, **kwargs):
     win_type : string ['hanning', 'flat-hanning'] 
         Type of window used for localization.
         Default : flat-hanning
+    num_workers : int
+        The number of threads for filtering the local windows in parallel if F 
+        is a plan.
+        Default : 1
 
     Returns
     -------
@@ -459,65 +727,419 @@ def generate_noise_2d_ssft_filter(F, randstate=np.random, seed=None, **kwargs):
 
     """
     
-    if len(F.shape) != 4:
-        raise ValueError("the input is not four-dimensional array")
-    if np.any(~np.isfinite(F)):
-      raise ValueError("F contains non-finite values")
+    if isinstance(F, dict) and not _is_filter_bank(F):
+        return _generate_noise_2d_ssft_plan(F, randstate, seed, 
+                                            kwargs.get('num_workers', 1))
+    
+    _check_ssft_filter(F)
       
     # defaults
     overlap  = kwargs.get('overlap', 0.2)
     win_type = kwargs.get('win_type', 'flat-hanning')
     
     # set the seed
-    if seed is not None:
-        randstate.seed(seed)
+    randstate = seed_generator(randstate, seed)
+    
+    dim,num_windows = _get_ssft_shapes(F)
     
-    dim_y = F.shape[2]
-    dim_x = F.shape[3]
-    dim = (dim_y, dim_x)
+    dtype,cdtype = _get_dtypes(F["filters"] if _is_filter_bank(F) else F)
     
     # produce fields of white noise
-    N = randstate.randn(dim_y, dim_x)
-    fN = fft.fft2(N, **fft_kwargs)
+    N = randstate.standard_normal((dim[0], dim[1])).astype(dtype, copy=False)
+    if _is_filter_bank(F):
+        fN = fft.rfft2(N).astype(cdtype, copy=False)
+    else:
+        fN = fft.fft2(N).astype(cdtype, copy=False)
     
     # initialize variables
-    cN = np.zeros(dim)
-    sM = np.zeros(dim)
-    
-    idxi = np.zeros((2, 1), dtype=int)
-    idxj = np.zeros((2, 1), dtype=int)
+    cN = np.zeros(dim, dtype=dtype)
     
-    # get the window size
-    win_size = ( float(dim_y)/F.shape[0], float(dim_x)/F.shape[1] )
+    windows = _get_ssft_windows(dim, num_windows, 
+                                _get_ssft_win_size(dim, num_windows), overlap)
     
     # loop the windows and build composite image of correlated noise
+    for k,w in _iter_ssft_filters(F):
+        
+        # apply fourier filtering with local filter
+        if _is_filter_bank(F):
+            flN = fN * _get_bank_filter(F, k)
+            flN = np.array(fft.irfft2(flN, s=dim), dtype=dtype)
+        else:
+            flN = fN * F[w[0][0], w[0][1], :, :]
+            flN = np.array(fft.ifft2(flN).real, dtype=dtype)
+        
+        # add the local noise field multiplied by the tapering mask to the 
+        # composite image of each window using the filter, the mask is zero 
+        # outside the window
+        for i,j in w:
+            i0,i1,j0,j1 = windows[i, j, :]
+            M = build_2D_tapering_function((i1-i0, j1-j0), win_type)
+            cN[i0:i1, j0:j1] += flN[i0:i1, j0:j1]*M
 
-    # loop rows
-    for i in range(F.shape[0]):
-        # loop columns
-        for j in range(F.shape[1]):
+    # normalize the field
+    cN *= _get_ssft_weights(dim, num_windows, overlap, win_type).astype(dtype, copy=False)
+    cN = (cN - cN.mean())/cN.std()
+            
+    return cN
+
+def initialize_ssft_plan(F, **kwargs):
+    """Precompute a plan for generating noise with the local Fourier filters 
+    returned by initialize_nonparam_2d_ssft_filter or 
+    initialize_nonparam_2d_nested_filter. The plan contains the indices of the 
+    windows, their tapering masks, the normalization weights of the composite 
+    field and a compact filter for each window. The compact filters are 
+    obtained by truncating the convolution kernels of the local filters to 
+    the offsets within pad grid points and transforming them to the padded 
+    window size. Thus, the noise of each window is computed by FFTs of the 
+    white noise within the window padded by pad grid points instead of the 
+    whole domain. The result is equal to that of the full-domain filtering 
+    except for the truncated tails of the kernels.
+    
+    Parameters
+    ----------
+    F : array-like or dict
+        Four-dimensional array containing the 2d fourier filters distributed over
+        a 2d spatial grid, or a compact filter bank (see the module 
+        documentation).
+        
+    Optional kwargs
+    ---------------
+    overlap : float 
+        Percentage overlap [0-1] between successive windows.
+        Default : 0.2
+    win_type : string ['hanning', 'flat-hanning'] 
+        Type of window used for localization.
+        Default : flat-hanning
+    pad : int
+        The number of grid points the windows are padded with, i.e. the 
+        truncation radius of the kernels. The nonparametric filters of 
+        precipitation fields have long-tailed kernels, so a pad smaller than the 
+        window size loses a part of the large-scale variability of the noise.
+        Default : the larger window dimension
+    dtype : string ['float64', 'float32']
+        The precision of the noise generated with the plan.
+        Default : the precision of F
+    
+    Returns
+    -------
+    out : dict
+        The plan that can be passed to generate_noise_2d_ssft_filter. The 
+        windows sharing a filter of a compact filter bank also share their 
+        compact filters if the padded windows have the same size.
+    """
+    
+    _check_ssft_filter(F)
+    
+    dim,num_windows = _get_ssft_shapes(F)
+    
+    # defaults
+    overlap  = kwargs.get('overlap', 0.2)
+    win_type = kwargs.get('win_type', 'flat-hanning')
+    pad      = kwargs.get('pad', None)
+    dtype    = kwargs.get('dtype', None)
+    
+    if dtype is None:
+        dtype,_ = _get_dtypes(F["filters"] if _is_filter_bank(F) else F)
+    
+    if pad is None:
+        pad = int(np.ceil(max(_get_ssft_win_size(dim, num_windows))))
+    # the kernel must not wrap around the domain
+    pad = min(pad, int((dim[0]-1)/2), int((dim[1]-1)/2))
+    
+    windows = _get_ssft_windows(dim, num_windows, 
+                                _get_ssft_win_size(dim, num_windows), overlap)
+    
+    filters = [None] * (num_windows[0]*num_windows[1])
+    masks   = [None] * (num_windows[0]*num_windows[1])
+    offsets = np.arange(-pad, pad+1)
+    for k,w in _iter_ssft_filters(F):
+        # the kernel of the local filter
+        if _is_filter_bank(F):
+            kernel = fft.irfft2(_get_bank_filter(F, k), s=dim)
+        else:
+            kernel = fft.ifft2(F[w[0][0], w[0][1], :, :]).real
         
-            # apply fourier filtering with local filter
-            lF = F[i,j,:,:]
-            flN = fN * lF
-            flN = np.array(fft.ifft2(flN, **fft_kwargs).real)
+        filters_k = {}
+        for i,j in w:
+            i0,i1,j0,j1 = windows[i, j, :]
+            shape = (_get_fft_size(i1-i0+2*pad), _get_fft_size(j1-j0+2*pad))
             
-            # compute indices of local window
-            idxi[0] = np.max( (i*win_size[0] - overlap*win_size[0], 0) ).astype(int)
-            idxi[1] = np.min( (idxi[0] + win_size[0]  + overlap*win_size[0], dim_y) ).astype(int)
-            idxj[0] = np.max( (j*win_size[1] - overlap*win_size[1], 0) ).astype(int)
-            idxj[1] = np.min( (idxj[0] + win_size[1]  + overlap*win_size[1], dim_x) ).astype(int)
+            # truncate the kernel and transform it to the size of the padded 
+            # window
+            if shape not in filters_k:
+                k_w = np.zeros(shape)
+                k_w[np.ix_(offsets % shape[0], offsets % shape[1])] = \
+                    kernel[np.ix_(offsets % dim[0], offsets % dim[1])]
+                filters_k[shape] = np.array(fft.rfft2(k_w).real, 
+                                            dtype=dtype)
             
-            # build mask and add local noise field to the composite image
-            M = _get_mask(dim, idxi, idxj, win_type)
-            cN += flN*M
-            sM += M 
+            filters[i*num_windows[1]+j] = filters_k[shape]
+            masks[i*num_windows[1]+j] = \
+                build_2D_tapering_function((i1-i0, j1-j0), win_type)
+    
+    plan = {}
+    plan["shape"]   = tuple(dim)
+    plan["pad"]     = pad
+    plan["windows"] = windows.reshape((-1, 4))
+    plan["filters"] = filters
+    plan["masks"]   = masks
+    plan["weights"] = _get_ssft_weights(dim, num_windows, overlap, win_type).astype(dtype)
+    
+    return plan
 
+def _generate_noise_2d_ssft_plan(plan, randstate, seed, num_workers):
+    """Generate locally correlated noise by using a plan returned by 
+    initialize_ssft_plan."""
+    
+    # set the seed
+    randstate = seed_generator(randstate, seed)
+    
+    dim = plan["shape"]
+    pad = plan["pad"]
+    dtype = plan["weights"].dtype
+    
+    # produce fields of white noise
+    N = randstate.standard_normal((dim[0], dim[1])).astype(dtype, copy=False)
+    
+    def filter_window(k):
+        i0,i1,j0,j1 = plan["windows"][k, :]
+        shape = (plan["filters"][k].shape[0], 2*(plan["filters"][k].shape[1]-1))
+        # the padded window wraps around the boundaries like the global FFT
+        rows = np.arange(i0-pad, i0-pad+shape[0]) % dim[0]
+        cols = np.arange(j0-pad, j0-pad+shape[1]) % dim[1]
+        fN = fft.rfft2(N[np.ix_(rows, cols)])
+        fN *= plan["filters"][k]
+        flN = fft.irfft2(fN, s=shape)
+        
+        return flN[pad:pad+i1-i0, pad:pad+j1-j0]
+    
+    num_windows = plan["windows"].shape[0]
+    if num_workers > 1:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor, \
+             fft.worker_pool(num_workers):
+            flN = list(executor.map(filter_window, range(num_windows)))
+    else:
+        flN = [filter_window(k) for k in range(num_windows)]
+    
+    # build the composite image of correlated noise
+    cN = np.zeros(dim, dtype=dtype)
+    for k in range(num_windows):
+        i0,i1,j0,j1 = plan["windows"][k, :]
+        cN[i0:i1, j0:j1] += flN[k]*plan["masks"][k]
+    
     # normalize the field
-    cN[sM > 0] /= sM[sM > 0]         
+    cN *= plan["weights"]
     cN = (cN - cN.mean())/cN.std()
-            
+    
     return cN
+
+def _check_ssft_filter(F):
+    if _is_filter_bank(F):
+        if np.any(~np.isfinite(F["filters"])):
+            raise ValueError("F contains non-finite values")
+        return
+    if len(F.shape) != 4:
+        raise ValueError("the input is not four-dimensional array")
+    if np.any(~np.isfinite(F)):
+      raise ValueError("F contains non-finite values")
+
+def _get_ssft_shapes(F):
+    """Return the shape of the domain and the number of windows of the local 
+    filters F."""
+    if _is_filter_bank(F):
+        return tuple(F["shape"]),F["index"].shape
+    else:
+        return F.shape[2:4],F.shape[0:2]
+
+def _iter_ssft_filters(F):
+    """Iterate over the distinct local filters of F. Yield the index of the 
+    filter in a filter bank (or None for a four-dimensional array) and the list 
+    of the windows (i,j) using the filter."""
+    if _is_filter_bank(F):
+        for k in np.unique(F["index"]):
+            yield k,list(zip(*np.nonzero(F["index"] == k)))
+    else:
+        for i in range(F.shape[0]):
+            for j in range(F.shape[1]):
+                yield None,[(i, j)]
+
+def _get_ssft_win_size(dim, num_windows):
+    """Return the window size corresponding to the given number of windows."""
+    return ( float(dim[0])/num_windows[0], float(dim[1])/num_windows[1] )
+
+def _get_ssft_windows(dim, num_windows, win_size, overlap):
+    """Return an array of shape (num_windows[0],num_windows[1],4) containing 
+    the row and column index ranges (i0,i1,j0,j1) of the SSFT windows."""
+    windows = np.empty((num_windows[0], num_windows[1], 4), dtype=int)
+    for i in range(num_windows[0]):
+        for j in range(num_windows[1]):
+            i0 = int(max(i*win_size[0] - overlap*win_size[0], 0))
+            i1 = int(min(i0 + win_size[0] + overlap*win_size[0], dim[0]))
+            j0 = int(max(j*win_size[1] - overlap*win_size[1], 0))
+            j1 = int(min(j0 + win_size[1] + overlap*win_size[1], dim[1]))
+            windows[i, j, :] = (i0, i1, j0, j1)
+    
+    return windows
+
+def _get_ssft_weights(dim, num_windows, overlap, win_type):
+    """Return the normalization weights of the composite SSFT noise field, i.e. 
+    the reciprocal of the sum of the tapering masks where it is positive and 
+    zero elsewhere. The array is cached, and it is read-only."""
+    return cache.get_or_compute(("ssft_weights", tuple(dim), tuple(num_windows), 
+                                 overlap, win_type), _compute_ssft_weights, 
+                                dim, num_windows, overlap, win_type)
+
+def _compute_ssft_weights(dim, num_windows, overlap, win_type):
+    windows = _get_ssft_windows(dim, num_windows, 
+                                _get_ssft_win_size(dim, num_windows), overlap)
+    
+    sM = np.zeros(dim)
+    for i0,i1,j0,j1 in windows.reshape((-1, 4)):
+        sM[i0:i1, j0:j1] += build_2D_tapering_function((i1-i0, j1-j0), win_type)
+    
+    weights = np.zeros(dim)
+    weights[sM > 0] = 1.0 / sM[sM > 0]
+    
+    return weights
+
+def _is_filter_bank(F):
+    return isinstance(F, dict) and "index" in F
+
+def _init_filter_bank(F0, num_windows, dtype, encoding):
+    """Initialize a compact filter bank where all windows use the global 
+    filter F0. The filters are collected into a list until 
+    _finalize_filter_bank is called."""
+    if dtype not in ["float64", "float32"]:
+        raise ValueError("unknown compact_dtype %s, the available options are 'float64' and 'float32'" % dtype)
+    if encoding not in ["rfft", "radial"]:
+        raise ValueError("unknown compact_encoding %s, the available options are 'rfft' and 'radial'" % encoding)
+    
+    bank = {}
+    bank["shape"]    = tuple(F0.shape)
+    bank["encoding"] = encoding
+    bank["dtype"]    = dtype
+    bank["index"]    = np.zeros(num_windows, dtype=int)
+    bank["filters"]  = []
+    _add_bank_filter(bank, F0[:, :int(F0.shape[1]/2)+1], slice(None), slice(None))
+    
+    return bank
+
+def _add_bank_filter(bank, H, i, j):
+    """Encode the half-spectrum H of a filter, add it to the bank and assign it 
+    to the windows (i,j), where i and j are indices or slices."""
+    
+    if bank["encoding"] == "radial":
+        radii = spectral.get_radial_index(bank["shape"])
+        r = radii["radii"].ravel()
+        c = radii["weights"].ravel()
+        H_sum = np.bincount(r, weights=H.ravel()*c)
+        c_sum = np.bincount(r, weights=c)
+        H = np.zeros(len(H_sum))
+        H[c_sum > 0] = H_sum[c_sum > 0] / c_sum[c_sum > 0]
+    
+    bank["filters"].append(H.astype(bank["dtype"]))
+    bank["index"][i, j] = len(bank["filters"]) - 1
+
+def _finalize_filter_bank(bank):
+    """Stack the filters of a bank into one array. The filters that are no 
+    longer assigned to any window, e.g. the parent filters superseded by the 
+    nested initializer, are removed and the indices are remapped."""
+    used = np.unique(bank["index"])
+    bank["filters"] = np.stack([bank["filters"][k] for k in used])
+    bank["index"]   = np.searchsorted(used, bank["index"])
+    del bank["dtype"]
+    
+    return bank
+
+def _get_bank_filter(bank, k, full=False):
+    """Return the kth filter of a filter bank as a half-spectrum, or as a 
+    full-size array if full is True."""
+    H = bank["filters"][k]
+    if bank["encoding"] == "radial":
+        H = H[spectral.get_radial_index(bank["shape"])["radii"]]
+    
+    if not full:
+        return H
+    else:
+        return _get_full_filter(H, bank["shape"])
+
+def _get_full_filter(H, shape):
+    """Return the full-size filter corresponding to the half-spectrum H of an 
+    even filter, i.e. F(k)=F(-k)."""
+    M,N = shape
+    n = H.shape[1]
+    F = np.empty((M, N), dtype=H.dtype)
+    F[:, :n] = H
+    F[:, n:] = H[np.ix_(-np.arange(M) % M, -np.arange(n, N) % N)]
+    
+    return F
+
+def _compute_local_filters(X, windows, win_type, war_thr, num_workers):
+    """Compute the half-spectra of the local nonparametric filters of X for the 
+    given windows (i0,i1,j0,j1). The filter of a window is None if its 
+    fraction of rain does not exceed war_thr. The filters are computed in 
+    parallel if num_workers > 1, and they are returned in the order of the 
+    windows."""
+    windows = [tuple(w) for w in windows]
+    
+    def compute_filter(window):
+        return _compute_local_filter(X, window, win_type, war_thr)
+    
+    if num_workers > 1:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor, \
+             fft.worker_pool(num_workers):
+            return list(executor.map(compute_filter, windows))
+    else:
+        return [compute_filter(w) for w in windows]
+
+def _compute_local_filter(X, window, win_type, war_thr):
+    """Compute the half-spectrum of the nonparametric filter of X multiplied by 
+    the tapering function of the window. This is equivalent to 
+    initialize_nonparam_2d_fft_filter(X*mask, win_type=None, donorm=True), 
+    where mask is zero outside the window, but the FFTs along the rows are 
+    computed only for the rows of the window. The saving covers this axis 
+    only: the filter is needed at all M frequencies along the columns, so the 
+    FFTs along the columns have the full length M, and they are computed for 
+    all N/2+1 columns of the half-spectrum."""
+    i0,i1,j0,j1 = [int(i) for i in window]
+    M,N = X.shape
+    
+    # TODO: the 0.01 rain threshold must be improved
+    X_w = X[i0:i1, j0:j1] * build_2D_tapering_function((i1-i0, j1-j0), win_type)
+    war = float(np.sum(X_w > 0.01)) / ((i1-i0)*(j1-j0))
+    if war <= war_thr:
+        return None
+    
+    # the rows outside the window are zero, so their FFTs are zero
+    F_w = np.zeros((i1-i0, N))
+    F_w[:, j0:j1] = X_w
+    F_w = fft.rfftn(F_w, axes=(1,))
+    # the columns are zero-padded to the full height M, because the output is 
+    # needed at all frequencies
+    F = np.zeros((M, F_w.shape[1]), dtype=F_w.dtype)
+    F[i0:i1, :] = F_w
+    F = fft.fft(F, axis=0)
+    
+    # normalize the real and imaginary parts, the statistics are those of the 
+    # full spectrum: the real part is even and the imaginary part is odd, so 
+    # its mean is zero
+    c = spectral.get_radial_index((M, N))["weights"]
+    mu = np.sum(c*F.real) / (M*N)
+    F.real = (F.real - mu) / np.sqrt(np.sum(c*F.real**2) / (M*N) - mu**2)
+    F.imag = F.imag / np.sqrt(np.sum(c*F.imag**2) / (M*N))
+    
+    return np.abs(F)
+
+def _get_fft_size(n):
+    """Return the smallest integer >= n whose prime factors are 2, 3 and 5."""
+    while True:
+        r = n
+        for p in [2, 3, 5]:
+            while r % p == 0:
+                r //= p
+        if r == 1:
+            return n
+        n += 1
         
 def build_2D_tapering_function(win_size, win_type='flat-hanning'):
     """Produces two-dimensional tapering function for rectangular fields.
@@ -532,12 +1154,18 @@ def build_2D_tapering_function(win_size, win_type='flat-hanning'):
     Returns
     -------
     w2d : array-like
-        A two-dimensional numpy array containing the 2D tapering function.
+        A two-dimensional numpy array containing the 2D tapering function. The 
+        array is cached (see pysteps.utils.cache), and it is read-only.
     """
     
     if len(win_size) != 2:
         raise ValueError("win_size is not a two-element tuple")
     
+    win_size = (int(win_size[0]), int(win_size[1]))
+    return cache.get_or_compute(("tapering_function", win_size, win_type), 
+                                _build_2D_tapering_function, win_size, win_type)
+
+def _build_2D_tapering_function(win_size, win_type):
     if win_type == 'hanning':
         w1dr = np.hanning(win_size[0])
         w1dc = np.hanning(win_size[1])
@@ -546,7 +1174,7 @@ def build_2D_tapering_function(win_size, win_type='flat-hanning'):
     
         T = win_size[0]/4.0
         W = win_size[0]/2.0
-        B = np.linspace(-W,W,2*W)
+        B = np.linspace(-W,W,int(2*W))
         R = np.abs(B)-T
         R[R < 0] = 0.
         A = 0.5*(1.0 + np.cos(np.pi*R/T))
@@ -555,7 +1183,7 @@ def build_2D_tapering_function(win_size, win_type='flat-hanning'):
         
         T = win_size[1]/4.0
         W = win_size[1]/2.0
-        B = np.linspace(-W, W, 2*W)
+        B = np.linspace(-W, W, int(2*W))
         R = np.abs(B) - T
         R[R < 0] = 0.
         A = 0.5*(1.0 + np.cos(np.pi*R/T))
@@ -575,38 +1203,25 @@ def build_2D_tapering_function(win_size, win_type='flat-hanning'):
 
     return w2d
     
-def _rapsd(X):
-    """Compute radially averaged PSD of input field X.
-    """
-    
-    if X.shape[0] != X.shape[1]:
-        raise ValueError("a square array expected, but the shape of X is (%d,%d)" % \
-                         (X.shape[0], X.shape[1]))
-    
-    L = X.shape[0]
-    
-    if L % 2 == 1:
-        XC,YC = np.ogrid[-int(L/2):int(L/2)+1, -int(L/2):int(L/2)+1]
-    else:
-        XC,YC = np.ogrid[-int(L/2):int(L/2), -int(L/2):int(L/2)]
-    
-    R = np.sqrt(XC*XC + YC*YC).astype(int)
-    
-    F = fft.fftshift(fft.fft2(X, **fft_kwargs))
-    F = abs(F)**2
-    
-    if L % 2 == 0:
-        r_range = np.arange(0, int(L/2)+1)
+def _get_rfft_filter(F):
+    """Return the filter F in the layout of the real FFT. The real part of the 
+    inverse FFT of a filtered real field depends only on the even part 
+    (F(k)+F(-k))/2 of the filter, which is taken for the nonnegative 
+    frequencies of the last axis."""
+    M,N = F.shape
+    n = int(N/2) + 1
+    rows = -np.arange(M) % M
+    cols = -np.arange(n) % N
+    
+    return 0.5*(F[:, :n] + F[rows[:, np.newaxis], cols[np.newaxis, :]])
+
+def _get_dtypes(F):
+    """Return the real and complex data types for the noise generated with the 
+    filter F."""
+    if F.dtype == np.float32:
+        return np.float32,np.complex64
     else:
-        r_range = np.arange(0, int(L/2))
-    
-    result = []
-    for r in r_range:
-        MASK = R == r
-        F_vals = F[MASK]
-        result.append(np.mean(F_vals))
-    
-    return np.array(result)
+        return np.float64,np.complex128
 
 def _split_field(idxi, idxj, Segments):
     """ Split domain field into a number of equally sapced segments.
@@ -634,18 +1249,3 @@ def _split_field(idxi, idxj, Segments):
     Idxj = np.array(Idxj).astype(int)  
     
     return Idxi, Idxj
-    
-def _get_mask(Size, idxi, idxj, win_type):
-    """Compute a mask of zeros with a window at a given position. 
-    """
-
-    idxi = np.array(idxi).astype(int) 
-    idxj =  np.array(idxj).astype(int)
-    
-    win_size = (idxi[1] - idxi[0] , idxj[1] - idxj[0])
-    wind = build_2D_tapering_function(win_size, win_type)
-    
-    mask = np.zeros(Size) 
-    mask[idxi.item(0):idxi.item(1), idxj.item(0):idxj.item(1)] = wind
-    
-    return mask
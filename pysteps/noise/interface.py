@@ -2,7 +2,7 @@
 from . import fftgenerators
 from . import motion
 
-def get_method(name):
+def get_method(name, cascade=False):
     """Return two callable functions to initialize and generate 2d perturbations
     of precipitation  or velocity fields.\n\
     
@@ -30,11 +30,25 @@ def get_method(name):
     |                   | time-dependent velocity perturbations are sampled     |
     |                   | from the exponential distribution                     |
     +-------------------+-------------------------------------------------------+
+    
+    If cascade is True, the returned generator produces the noise directly as 
+    a normalized cascade decomposition (see 
+    fftgenerators.generate_noise_2d_fft_filter_cascade). This is supported 
+    only by the parametric and nonparametric methods.
     """
+    if cascade and name.lower() not in ["parametric", "nonparametric"]:
+        raise ValueError("method %s does not support generating noise cascades" % name)
+    
     if name.lower() == "parametric":
+        if cascade:
+            return fftgenerators.initialize_param_2d_fft_filter, \
+                fftgenerators.generate_noise_2d_fft_filter_cascade
         return fftgenerators.initialize_param_2d_fft_filter, \
             fftgenerators.generate_noise_2d_fft_filter
     elif name.lower() == "nonparametric":
+        if cascade:
+            return fftgenerators.initialize_nonparam_2d_fft_filter, \
+                fftgenerators.generate_noise_2d_fft_filter_cascade
         return fftgenerators.initialize_nonparam_2d_fft_filter, \
             fftgenerators.generate_noise_2d_fft_filter
     elif name.lower() == "ssft":
@@ -23,6 +23,7 @@ determined from the perturbator."""
 
 import numpy as np
 from scipy import linalg
+from .utils import seed_generator
 
 def initialize_bps(V, pixelsperkm, timestep, p_pert_par=(10.88,0.23,-7.68), 
                    p_pert_perp=(5.76,0.31,-2.72), randstate=np.random, seed=None):
@@ -52,10 +53,12 @@ def initialize_bps(V, pixelsperkm, timestep, p_pert_par=(10.88,0.23,-7.68),
       Spatial resolution of the motion field (pixels/kilometer).
     timestep : float
       Time step for the motion vectors (minutes).
-    randstate : mtrand.RandomState
+    randstate : mtrand.RandomState or numpy.random.Generator
       Optional random generator to use. If set to None, use numpy.random.
     seed : int
-      Optional seed number for the random generator.
+      Optional seed number for the random generator. A numpy.random.Generator 
+      cannot be reseeded, so it is replaced with a new one initialized with the 
+      seed (see pysteps.noise.utils.seed_generator).
     
     Returns
     -------
@@ -74,8 +77,7 @@ def initialize_bps(V, pixelsperkm, timestep, p_pert_par=(10.88,0.23,-7.68),
     
     perturbator = {}
     
-    if seed is not None:
-        randstate.seed(seed)
+    randstate = seed_generator(randstate, seed)
     
     v_pert_x = randstate.laplace()
     v_pert_y = randstate.laplace()
@@ -1,12 +1,108 @@
 """Miscellaneous utility functions related to generating stochastic perturbations."""
 
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+from ..cascade import bandpass_filters
+from ..cascade import decomposition
+from ..utils import fftbackend as fft
+
+def get_random_generators(seed, num_generators):
+    """Return a list of independent random generators, e.g. one for each 
+    ensemble member. The generators are spawned from a numpy.random.SeedSequence 
+    initialized with the given seed, so the stream of the ith generator depends 
+    only on the seed and i. Thus, the results do not depend on how the 
+    generators are later distributed between batches or parallel workers.
+    
+    Parameters
+    ----------
+    seed : int or None
+        The seed. If None, the generators are initialized with fresh entropy 
+        from the operating system.
+    num_generators : int
+        The number of generators.
+    
+    Returns
+    -------
+    out : list
+        A list of numpy.random.Generator instances.
+    """
+    seedseqs = np.random.SeedSequence(seed).spawn(num_generators)
+    
+    return [np.random.default_rng(s) for s in seedseqs]
+
+def seed_generator(randstate, seed):
+    """Set the seed of a random generator. A mtrand.RandomState (or the 
+    numpy.random module) is reseeded in place. A numpy.random.Generator cannot 
+    be reseeded, so a new Generator initialized with the seed is returned 
+    instead, and the given one is left unchanged.
+    
+    Parameters
+    ----------
+    randstate : mtrand.RandomState or numpy.random.Generator
+        The random generator.
+    seed : int or None
+        The seed. If None, randstate is returned as such.
+    
+    Returns
+    -------
+    out : mtrand.RandomState or numpy.random.Generator
+        The seeded generator that must be used instead of randstate.
+    """
+    if seed is None:
+        return randstate
+    
+    if isinstance(randstate, np.random.Generator):
+        return np.random.default_rng(seed)
+    
+    randstate.seed(seed)
+    
+    return randstate
+
+# the random streams that can be requested from get_member_generator, the 
+# values are part of the stream keys and must not be changed
+_RNG_PURPOSES = {"precip":0, "motion":1}
+
+def get_member_generator(seed, member, purpose):
+    """Return the random generator of the given ensemble member for the given 
+    purpose. The generator is a PCG64 stream whose key is (seed, member, 
+    purpose), so the generator of any member can be created without creating 
+    those of the other members. The keys are equivalent to those of the 
+    children spawned by numpy.random.SeedSequence.spawn, which makes the 
+    streams statistically independent.
+    
+    Parameters
+    ----------
+    seed : int
+        The seed. Unlike in get_random_generators, None is not allowed, because 
+        the generators of different members could then not be recreated.
+    member : int
+        Index of the ensemble member.
+    purpose : str
+        The purpose of the random numbers. The available options are 'precip' 
+        (precipitation field perturbations) and 'motion' (motion field 
+        perturbations).
+    
+    Returns
+    -------
+    out : numpy.random.Generator
+        The random generator.
+    """
+    if seed is None:
+        raise ValueError("seed is None, but an integer seed is required")
+    if purpose not in _RNG_PURPOSES.keys():
+        raise ValueError("unknown purpose %s, the available options are %s" % 
+                         (purpose, ", ".join(sorted(_RNG_PURPOSES.keys()))))
+    
+    seedseq = np.random.SeedSequence(seed, spawn_key=(member, 
+                                                      _RNG_PURPOSES[purpose]))
+    
+    return np.random.Generator(np.random.PCG64(seedseq))
  
 # TODO: This method needs a careful testing. Check the verification statistics, 
 # and particularly the ensemble spread and rank histogram with and without the 
 # adjustment.
 def compute_noise_stddev_adjs(R, R_thr_1, R_thr_2, F, decomp_method, num_iter, 
-                              conditional):
+                              conditional, **kwargs):
     """Simulate the effect of applying a precipitation mask to a Gaussian noise 
     field obtained by the nonparametric filter method. The idea is to decompose 
     the masked noise field into a cascade and compare the standard deviations of 
@@ -16,6 +112,12 @@ def compute_noise_stddev_adjs(R, R_thr_1, R_thr_2, F, decomp_method, num_iter,
     correction factors are calculated from the average values of the standard 
     deviations.
     
+    The realizations are generated and decomposed in batches by using real 
+    FFTs over the whole batch, and the spectrum of the observed field is 
+    computed only once. Each realization is drawn from its own random 
+    generator (see get_random_generators), so the result does not depend on 
+    the batch size or the number of workers.
+    
     Parameters
     ----------
     R : array_like
@@ -39,6 +141,22 @@ def compute_noise_stddev_adjs(R, R_thr_1, R_thr_2, F, decomp_method, num_iter,
         If set to True, compute the statistics conditionally by excluding areas 
         of no precipitation.
     
+    Optional kwargs
+    ---------------
+    seed : int
+        Seed for the random generators of the realizations. If None, the seed 
+        is drawn from numpy.random, so that it can be controlled with 
+        numpy.random.seed.
+        Default : None
+    batch_size : int
+        The number of realizations generated and decomposed together. If None, 
+        the batch size is chosen so that the work arrays of a batch take at most 
+        about 256 MB.
+        Default : None
+    num_workers : int
+        The number of threads for processing the batches in parallel.
+        Default : 1
+    
     Returns
     -------
     out : list
@@ -48,6 +166,10 @@ def compute_noise_stddev_adjs(R, R_thr_1, R_thr_2, F, decomp_method, num_iter,
     if R.shape[0] != R.shape[1]:
         raise ValueError("the dimensions of the input field are %dx%d, but square shape expected" % (R.shape[0], R.shape[1]))
     
+    seed        = kwargs.get("seed", None)
+    batch_size  = kwargs.get("batch_size", None)
+    num_workers = kwargs.get("num_workers", 1)
+    
     MASK = R >= R_thr_1
     
     R = R.copy()
@@ -62,23 +184,80 @@ def compute_noise_stddev_adjs(R, R_thr_1, R_thr_2, F, decomp_method, num_iter,
     MASK_ = MASK if conditional else None
     decomp_R = decomp_method(R, F, MASK=MASK_)
     
-    N_stds = []
-    
-    for k in range(num_iter):
-        # generate Gaussian white noise field, multiply it with the standard 
-        # deviation of the observed field and apply the precipitation mask
-        N = np.random.randn(R.shape[0], R.shape[1])
-        N = np.real(np.fft.ifft2(np.fft.fft2(N) * abs(np.fft.fft2(R))))
-        N = (N - np.mean(N)) / np.std(N) * sigma
-        N[~MASK] = R_thr_2 - mu
-        
-        # subtract the mean and decompose the masked noise field into a cascade
-        N -= np.mean(N)
-        decomp_N = decomp_method(N, F, MASK=MASK_)
-        
-        N_stds.append(decomp_N["stds"])
+    # the amplitude spectrum of the observed field is used as the noise filter
+    F_R = np.abs(fft.rfft2(R))
+    
+    if seed is None:
+        seed = np.random.randint(2**31)
+    randstates = get_random_generators(seed, num_iter)
+    
+    if batch_size is None:
+        # the noise fields, their spectra and one cascade level
+        batch_size = int(256*1024*1024 / (32*R.size))
+    batch_size = min(max(batch_size, 1), num_iter)
+    batches = [randstates[i:i+batch_size] for i in range(0, num_iter, batch_size)]
+    
+    def worker(randstates_):
+        return _compute_masked_noise_stds(randstates_, F_R, R.shape, MASK, mu, 
+                                          sigma, R_thr_2, F, decomp_method, 
+                                          conditional)
+    
+    if num_workers > 1 and len(batches) > 1:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor, \
+             fft.worker_pool(num_workers):
+            N_stds = list(executor.map(worker, batches))
+    else:
+        N_stds = [worker(b) for b in batches]
     
     # for each cascade level, compare the standard deviations between the 
     # observed field and the masked noise field, which gives the correction 
     # factors
     return decomp_R["stds"] / np.mean(np.vstack(N_stds), axis=0)
+
+def _compute_masked_noise_stds(randstates, F_R, shape, MASK, mu, sigma, R_thr_2, 
+                               F, decomp_method, conditional):
+    """Generate a batch of masked noise fields, one for each random generator, 
+    decompose them and return the standard deviations of the cascade levels as 
+    an array of shape (k,n)."""
+    # generate Gaussian white noise fields, multiply them with the standard 
+    # deviation of the observed field and apply the precipitation mask
+    N = np.empty((len(randstates), shape[0], shape[1]))
+    for i,randstate in enumerate(randstates):
+        randstate.standard_normal(out=N[i, :, :])
+    fN = fft.rfft2(N, axes=(-2, -1))
+    fN *= F_R
+    N = fft.irfft2(fN, s=shape, axes=(-2, -1))
+    N -= np.mean(N, axis=(1, 2), keepdims=True)
+    N *= sigma / np.std(N, axis=(1, 2), keepdims=True)
+    N[:, ~MASK] = R_thr_2 - mu
+    
+    # subtract the mean and decompose the masked noise fields into cascades
+    N -= np.mean(N, axis=(1, 2), keepdims=True)
+    
+    if decomp_method is not decomposition.decomposition_fft:
+        MASK_ = MASK if conditional else None
+        return np.vstack([decomp_method(N_, F, MASK=MASK_)["stds"] for N_ in N])
+    
+    # the FFT decomposition is done for the whole batch, one level at a time
+    fN = fft.rfft2(N, axes=(-2, -1))
+    N = None
+    n = len(F["weights_1d"])
+    W = None if bandpass_filters.is_compact(F) else decomposition.get_rfft_weights(F)
+    stds = np.empty((fN.shape[0], n))
+    for k in range(n):
+        if W is None:
+            # touch only the support of the band
+            idx,w = bandpass_filters.get_support(F, k)
+            fN_k = np.zeros(fN.shape, dtype=fN.dtype)
+            fN_k.reshape((fN.shape[0], -1))[:, idx] = \
+                fN.reshape((fN.shape[0], -1))[:, idx] * w
+        else:
+            fN_k = fN * W[k, :, :]
+        N_k = fft.irfft2(fN_k, s=shape, axes=(-2, -1))
+        if conditional:
+            N_k = N_k[:, MASK]
+        else:
+            N_k = N_k.reshape((N_k.shape[0], -1))
+        stds[:, k] = np.std(N_k, axis=1)
+    
+    return stds
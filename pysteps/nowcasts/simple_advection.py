@@ -44,6 +44,55 @@ def forecast(R, V, num_timesteps, extrap_method, extrap_kwargs={}):
     
     return R_f
 
+def iter_forecast(R, V, num_timesteps, extrap_method, extrap_kwargs={}):
+    """Generate a nowcast by applying a simple advection-based extrapolation to 
+    the given precipitation field, and return an iterator that yields the 
+    forecast fields one time step at a time. The next time step is computed 
+    only when it is requested. The extrapolation method must support the 
+    D_prev and return_displacement keyword arguments (see 
+    pysteps.advection.semilagrangian).
+    
+    Parameters
+    ----------
+    R : array-like
+      Two-dimensional array of shape (m,n) containing the input precipitation 
+      field.
+    V : array-like
+      Array of shape (2,m,n) containing the x- and y-components of the advection 
+      field. The velocities are assumed to represent one time step.
+    num_timesteps : int
+      Number of time steps to forecast.
+    extrap_method : str
+      Name of the extrapolation method to use. See the documentation of the 
+      advection module for the available choices.
+    extrap_kwargs : dict
+      Optional dictionary that is supplied as keyword arguments to the 
+      extrapolation method.
+    
+    Returns
+    -------
+    out : iterator
+      An iterator yielding tuples (t,R_f), where t is the index of the time 
+      step and R_f is a two-dimensional array of shape (m,n) containing the 
+      nowcast precipitation field for time step t.
+    """
+    _check_inputs(R, V)
+    
+    extrap_method = advection.get_method(extrap_method)
+    
+    return _iter_forecast(R, V, num_timesteps, extrap_method, extrap_kwargs)
+
+def _iter_forecast(R, V, num_timesteps, extrap_method, extrap_kwargs):
+    # the displacement accumulated along the advection trajectory is carried 
+    # over to the next time step
+    extrap_kwargs = extrap_kwargs.copy()
+    extrap_kwargs["return_displacement"] = True
+    D = extrap_kwargs.pop("D_prev", None)
+    
+    for t in range(num_timesteps):
+        R_f,D = extrap_method(R, V, 1, D_prev=D, **extrap_kwargs)
+        yield t,R_f[0]
+
 def _check_inputs(R, V):
     if len(R.shape) != 2:
         raise ValueError("R must be a two-dimensional array")
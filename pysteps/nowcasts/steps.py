@@ -1,18 +1,33 @@
 """Implementation of the STEPS method."""
 
+import json
 import numpy as np
+import multiprocessing
 import sys
 import time
+import traceback
 from .. import advection
 from .. import cascade
 from .. import noise
+from ..noise import utils as noise_utils
 from ..postproc import probmatching
 from ..timeseries import autoregression, correlation
+from ..utils import cache
+from ..utils import fftbackend as fft
 try:
     import dask
     dask_imported = True
 except ImportError:
     dask_imported = False
+try:
+    from multiprocessing import shared_memory
+    shared_memory_imported = True
+except ImportError:
+    shared_memory_imported = False
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 # TODO: Using non-square shapes of the inputs has not been tested.
 def forecast(R, V, num_timesteps, num_ens_members, num_cascade_levels, R_thr, 
@@ -21,7 +36,10 @@ def forecast(R, V, num_timesteps, num_ens_members, num_cascade_levels, R_thr,
              vel_pert_method=None, conditional=False, use_precip_mask=True, 
              use_probmatching=True, callback=None, return_output=True, 
              extrap_kwargs={}, filter_kwargs={}, noise_kwargs={}, 
-             vel_pert_kwargs={}, seed=None):
+             vel_pert_kwargs={}, seed=None, member_major=False, 
+             member_callback=None, backend="dask", num_workers=None, 
+             checkpoint_file=None, checkpoint_interval=None, dtype="float64", 
+             domain="spatial", ar_decay_tol=None, multiresolution=False):
     """Generate a nowcast ensemble by using the STEPS method described in 
     Bowler et al. 2006: STEPS: A probabilistic precipitation forecasting scheme 
     which merges an extrapolation nowcast with downscaled NWP.
@@ -56,7 +74,14 @@ def forecast(R, V, num_timesteps, num_ens_members, num_cascade_levels, R_thr,
       See the documentation of pysteps.cascade.bandpass_filters.
     noise_method : str
       Name of the noise generator to use for perturbating the precipitation 
-      field. See the documentation of pysteps.noise.interface.
+      field. See the documentation of pysteps.noise.interface. With the 
+      'parametric' and 'nonparametric' generators and decomp_method='fft', the 
+      noise cascade is generated directly from the filtered spectrum of the 
+      white noise, which saves the inverse and forward FFTs between the noise 
+      generator and the decomposition. With the other decomposition methods, 
+      the noise fields of all members are generated with one batched FFT per 
+      time step (see 
+      pysteps.noise.fftgenerators.generate_noise_2d_fft_filter_batch).
     pixelsperkm : float
       Spatial resolution of the motion field (pixels/kilometer).
     timestep : float
@@ -82,7 +107,9 @@ def forecast(R, V, num_timesteps, num_ens_members, num_cascade_levels, R_thr,
       the nowcast. The function takes one argument: a three-dimensional array 
       of shape (num_ens_members,h,w), where h and w are the height and width 
       of the input field R, respectively. This can be used, for instance, 
-      writing the outputs into files.
+      writing the outputs into files. The array is reused between the calls, 
+      so it must be copied if it is needed after the call returns. See also 
+      iter_forecast.
     return_output : bool
       Set to False to disable returning the outputs as numpy arrays. This can 
       save memory if the intermediate results are written to output files using 
@@ -92,17 +119,108 @@ def forecast(R, V, num_timesteps, num_ens_members, num_cascade_levels, R_thr,
       extrapolation method.
     filter_kwargs : dict
       Optional dictionary that is supplied as keyword arguments to the 
-      filter method.
+      filter method. With compact=True, the filter stores only the supports 
+      of the frequency bands instead of the dense 2d weights (see 
+      pysteps.cascade.bandpass_filters).
     noise_kwargs : dict
       Optional dictionary that is supplied as keyword arguments to the 
       initializer of the noise generator. See the documentation of 
-      pysteps.noise.fftgenerators.
+      pysteps.noise.fftgenerators. With the 'ssft' and 'nested' generators, 
+      the key 'ssft_plan' (default False) can be set to True for converting 
+      the local filters into a plan that filters the noise in padded local 
+      windows instead of the whole domain (see 
+      pysteps.noise.fftgenerators.initialize_ssft_plan). The plan is faster, 
+      but it is an approximation that truncates the convolution kernels of 
+      the local filters to the padding, which loses a part of the 
+      large-scale variability of the noise.
     vel_pert_kwargs : dict
       Optional dictionary that is supplied as keyword arguments to the 
       initializer of the velocity perturbator. See the documentation of 
       pysteps.noise.motion.
     seed : int
-      Optional seed number for the random generators.
+      Optional seed number for the random generators. The generators of each 
+      ensemble member are keyed by the seed and the member index (see 
+      pysteps.noise.utils.get_member_generator), so the forecast of a member 
+      does not depend on the ensemble size, the backend or the execution 
+      order. If None, the seed is drawn from numpy.random.
+    member_major : bool
+      If True, compute each ensemble member through all time steps before 
+      starting the next one. The shared initialization is done only once, and 
+      only the state of the current member is kept in memory. This way the 
+      memory usage does not grow with the ensemble size if return_output is 
+      set to False and the outputs are processed by member_callback. If False, 
+      all members are computed for one time step before proceeding to the next 
+      one, and the outputs are supplied to callback.
+    member_callback : function
+      Optional function that is called after computation of all time steps of 
+      one ensemble member if member_major is True. The function takes two 
+      arguments: the index of the ensemble member and a three-dimensional array 
+      of shape (num_timesteps,h,w) containing the forecast fields. The array 
+      is reused between the calls.
+    backend : str
+      The backend for computing the ensemble members in parallel. The options 
+      are 'dask' (the default threaded scheduler of dask, the members are 
+      computed serially if dask is not installed), 'serial' and 'processes'. 
+      With 'processes', the members are distributed to a pool of worker 
+      processes. The large read-only inputs (the band-pass filter, the noise 
+      filter, the AR(p) parameters, the motion field and the precipitation 
+      mask) are placed in shared memory instead of being copied to each 
+      worker, and the results are streamed back to callback (or 
+      member_callback) as soon as they are complete. This requires Python 3.8 
+      or later. The dask backend is not applied if member_major is True.
+    num_workers : int
+      The number of worker processes if backend is 'processes'. If None, the 
+      number of CPUs is used.
+    checkpoint_file : str
+      Optional name of the file where the state of the nowcast is saved. The 
+      nowcast can be continued from the saved state with resume_forecast. The 
+      file is written in the numpy .npz format. Checkpoints are not supported 
+      if member_major is True or backend is 'processes'.
+    checkpoint_interval : int
+      If checkpoint_file is given, save the state after every 
+      checkpoint_interval time steps. If None, the state is saved only after 
+      the last time step.
+    dtype : str
+      The floating point precision of the computations and the outputs: 
+      'float64' (the default) or 'float32'. With 'float32', the cascades, the 
+      noise fields, the FFTs, the advection and the outputs use single 
+      precision, which halves the memory usage and bandwidth. The AR(p) 
+      parameters and the cascade statistics are still estimated in double 
+      precision.
+    domain : str
+      The domain where the cascades are iterated: 'spatial' (the default) or 
+      'spectral'. With 'spectral', the cascade levels of the AR(p) models and 
+      the noise are kept as Fourier spectra (see 
+      pysteps.cascade.decomposition). Because the AR(p) models and the 
+      recomposition of the cascade are linear, they are applied to the spectra, 
+      and the normalization of the noise cascade is done by using Parseval's 
+      theorem. Thus, only the inverse FFT of the recomposed cascade is needed 
+      for each member and time step instead of num_cascade_levels inverse FFTs 
+      of the noise cascade. Together with the forward FFT of the noise 
+      generator, this reduces the number of FFTs per member and time step from 
+      1+num_cascade_levels to 2. The results are equal to those of the spatial 
+      domain up to rounding errors. This option requires decomp_method='fft'.
+    ar_decay_tol : float
+      If set, skip the AR(p) updates of the cascade levels whose memory has 
+      decayed. The contribution of the initial cascades to the forecast is 
+      computed in closed form from the AR(p) parameters (see 
+      pysteps.timeseries.autoregression.compute_ar_memory_decay). Once it 
+      falls below ar_decay_tol for all remaining time steps, the level is 
+      taken directly from the normalized noise cascade, and its AR(p) buffers 
+      are released. This neglects the temporal correlation of the noise 
+      component of the level, so ar_decay_tol should be small (e.g. 0.01). 
+      A level is skipped only when all finer levels are also skipped. If 
+      None (the default), all levels are iterated at every time step.
+    multiresolution : bool
+      If True, each cascade level is represented on a grid whose resolution 
+      matches its frequency band (see pysteps.cascade.decomposition). The 
+      AR(p) models, the noise cascades and their normalization then operate 
+      on these smaller arrays, and the levels are upsampled to the input 
+      resolution only when the cascade is recomposed. This reduces the memory 
+      usage and the cost of the AR(p) models by a factor that grows with 
+      num_cascade_levels. The filter weights below 1e-4 are neglected, so the 
+      results are close but not equal to those obtained with the default 
+      (False). This option requires decomp_method='fft'.
     
     Returns
     -------
@@ -112,8 +230,220 @@ def forecast(R, V, num_timesteps, num_ens_members, num_cascade_levels, R_thr,
       precipitation fields for each ensemble member. Otherwise, a None value 
       is returned.
     """
+    _check_backend(backend)
+    _check_checkpoint_args(checkpoint_file, member_major, backend)
+    
+    state = _initialize(R, V, num_timesteps, num_ens_members, num_cascade_levels, 
+                        R_thr, extrap_method, decomp_method, 
+                        bandpass_filter_method, noise_method, pixelsperkm, 
+                        timestep, ar_order, vel_pert_method, conditional, 
+                        use_precip_mask, use_probmatching, extrap_kwargs, 
+                        filter_kwargs, noise_kwargs, vel_pert_kwargs, seed, 
+                        dtype, domain, ar_decay_tol, multiresolution)
+    
+    print("Starting nowcast computation.")
+    
+    if return_output:
+        R_f = np.empty((num_ens_members, num_timesteps, V.shape[1], V.shape[2]), 
+                       dtype=dtype)
+    else:
+        R_f = None
+    
+    if member_major:
+        for j,R_f_ in _iter_members(state, num_ens_members, num_timesteps, 
+                                    backend, num_workers):
+            if member_callback is not None:
+                member_callback(j, R_f_)
+            if return_output:
+                R_f[j, :, :, :] = R_f_
+    else:
+        if backend != "processes":
+            members = [_init_member(state, j) for j in range(num_ens_members)]
+        else:
+            members = None
+        _run_timesteps(state, members, 0, num_ens_members, num_timesteps, 
+                       backend, num_workers, callback, R_f, checkpoint_file, 
+                       checkpoint_interval)
+    
+    if return_output:
+        if num_ens_members == 1:
+            return R_f[0, :, :, :]
+        else:
+            return R_f
+    else:
+        return None
+
+def iter_forecast(R, V, num_timesteps, num_ens_members, num_cascade_levels, 
+                  R_thr, extrap_method, decomp_method, bandpass_filter_method, 
+                  noise_method, pixelsperkm, timestep, ar_order=2, 
+                  vel_pert_method=None, conditional=False, use_precip_mask=True, 
+                  use_probmatching=True, extrap_kwargs={}, filter_kwargs={}, 
+                  noise_kwargs={}, vel_pert_kwargs={}, seed=None, 
+                  backend="dask", num_workers=None, dtype="float64", 
+                  domain="spatial", ar_decay_tol=None, 
+                  multiresolution=False):
+    """Generate a nowcast ensemble by using the STEPS method, and return an 
+    iterator that yields the forecast fields one time step at a time. The 
+    iterator computes the next time step only when it is requested, so the 
+    consumer controls the pace of the computation and no outputs are 
+    accumulated in memory.
+    
+    The initialization is done when this function is called. The parameters 
+    are the same as in forecast.
+    
+    Returns
+    -------
+    out : iterator
+      An iterator yielding tuples (t,R_f), where t is the index of the time 
+      step and R_f is a three-dimensional array of shape (num_ens_members,m,n) 
+      containing the forecast fields of the ensemble members. The same array is 
+      reused for all time steps, so it must be copied if it is needed after 
+      requesting the next time step.
+    """
+    _check_backend(backend)
+    
+    state = _initialize(R, V, num_timesteps, num_ens_members, num_cascade_levels, 
+                        R_thr, extrap_method, decomp_method, 
+                        bandpass_filter_method, noise_method, pixelsperkm, 
+                        timestep, ar_order, vel_pert_method, conditional, 
+                        use_precip_mask, use_probmatching, extrap_kwargs, 
+                        filter_kwargs, noise_kwargs, vel_pert_kwargs, seed, 
+                        dtype, domain, ar_decay_tol, multiresolution)
+    
+    print("Starting nowcast computation.")
+    
+    return _iter_timesteps(state, num_ens_members, num_timesteps, backend, 
+                           num_workers)
+
+def resume_forecast(checkpoint, num_timesteps, callback=None, 
+                    return_output=True, backend="dask", checkpoint_file=None, 
+                    checkpoint_interval=None):
+    """Continue a STEPS nowcast from a checkpoint saved by forecast or 
+    resume_forecast. The computation continues exactly from the saved state, 
+    i.e. the AR(p) model states, the random generators, the displacements of 
+    the advection and the perturbation generators are restored, and the 
+    resulting forecast fields are identical to those that would have been 
+    obtained by computing all time steps in one run.
+    
+    Parameters
+    ----------
+    checkpoint : str or dict
+      File name of the checkpoint or a checkpoint dictionary returned by 
+      load_checkpoint.
+    num_timesteps : int
+      Number of time steps to forecast after the time step of the checkpoint.
+    callback : function
+      Optional function that is called after computation of each time step. 
+      See forecast.
+    return_output : bool
+      Set to False to disable returning the outputs as numpy arrays.
+    backend : str
+      The backend for computing the ensemble members in parallel, either 
+      'dask' or 'serial'. See forecast.
+    checkpoint_file : str
+      Optional name of the file where the state of the nowcast is saved. It can 
+      be the same file as the one the nowcast was resumed from.
+    checkpoint_interval : int
+      If checkpoint_file is given, save the state after every 
+      checkpoint_interval time steps. If None, the state is saved only after 
+      the last time step.
+    
+    Returns
+    -------
+    out : ndarray
+      If return_output is True, a four-dimensional array of shape 
+      (num_ens_members,num_timesteps,m,n) containing the forecast fields for 
+      the time steps following the checkpoint. Otherwise, a None value is 
+      returned.
+    """
+    _check_backend(backend)
+    _check_checkpoint_args(checkpoint_file, False, backend)
+    if backend == "processes":
+        raise ValueError("resuming a nowcast is not supported with the processes backend")
+    
+    if not isinstance(checkpoint, dict):
+        checkpoint = load_checkpoint(checkpoint)
+    
+    state   = checkpoint["state"]
+    members = checkpoint["members"]
+    t0      = checkpoint["timestep"]
+    num_ens_members = len(members)
+    
+    print("Resuming nowcast computation from time step %d." % t0)
+    
+    if return_output:
+        R_f = np.empty((num_ens_members, num_timesteps, state["V"].shape[1], 
+                        state["V"].shape[2]), dtype=state["dtype"])
+    else:
+        R_f = None
+    
+    _run_timesteps(state, members, t0, num_ens_members, num_timesteps, backend, 
+                   None, callback, R_f, checkpoint_file, checkpoint_interval)
+    
+    if return_output:
+        if num_ens_members == 1:
+            return R_f[0, :, :, :]
+        else:
+            return R_f
+    else:
+        return None
+
+def save_checkpoint(filename, checkpoint):
+    """Save a checkpoint of a STEPS nowcast into a file in the numpy .npz 
+    format.
+    
+    Parameters
+    ----------
+    filename : str
+      Name of the output file.
+    checkpoint : dict
+      Dictionary with the keys 'state' (the shared state of the nowcast), 
+      'members' (list of the states of the ensemble members) and 'timestep' 
+      (index of the next time step to compute).
+    """
+    arrays = {}
+    meta = _encode_checkpoint(checkpoint, arrays)
+    arrays["__meta__"] = np.array(json.dumps(meta))
+    
+    # write to a file object so that numpy does not append the .npz extension
+    with open(filename, "wb") as f:
+        np.savez(f, **arrays)
+
+def load_checkpoint(filename):
+    """Load a checkpoint of a STEPS nowcast saved by save_checkpoint.
+    
+    Parameters
+    ----------
+    filename : str
+      Name of the input file.
+    
+    Returns
+    -------
+    out : dict
+      The checkpoint dictionary, see save_checkpoint.
+    """
+    with np.load(filename, allow_pickle=False) as f:
+        arrays = dict((k, f[k]) for k in f.files)
+    meta = json.loads(str(arrays.pop("__meta__")))
+    
+    return _decode_checkpoint(meta, arrays)
+
+def _initialize(R, V, num_timesteps, num_ens_members, num_cascade_levels, R_thr, 
+                extrap_method, decomp_method, bandpass_filter_method, 
+                noise_method, pixelsperkm, timestep, ar_order, vel_pert_method, 
+                conditional, use_precip_mask, use_probmatching, extrap_kwargs, 
+                filter_kwargs, noise_kwargs, vel_pert_kwargs, seed, dtype, 
+                domain, ar_decay_tol, multiresolution):
+    """Check the inputs and compute the shared state of the nowcast."""
     _check_inputs(R, V, ar_order)
     
+    if domain not in ["spatial", "spectral"]:
+        raise ValueError("unknown domain %s, the available options are 'spatial' and 'spectral'" % domain)
+    if domain == "spectral" and decomp_method != "fft":
+        raise ValueError("domain='spectral' requires decomp_method='fft'")
+    if multiresolution and decomp_method != "fft":
+        raise ValueError("multiresolution=True requires decomp_method='fft'")
+    
     if np.any(~np.isfinite(R)):
         raise ValueError("R contains non-finite values")
     
@@ -140,6 +470,8 @@ def forecast(R, V, num_timesteps, num_ens_members, num_cascade_levels, R_thr,
     print("velocity perturbator: %s" % vel_pert_method)
     print("precipitation mask:   %s" % "yes" if use_precip_mask  else "no")
     print("probability matching: %s" % "yes" if use_probmatching else "no")
+    print("cascade domain:       %s" % domain)
+    print("multiresolution:      %s" % ("yes" if multiresolution else "no"))
     print("")
     
     print("Parameters:")
@@ -160,14 +492,15 @@ def forecast(R, V, num_timesteps, num_ens_members, num_cascade_levels, R_thr,
         print("conditional precip. intensity threshold: %g" % R_thr)
     
     L = R.shape[1]
-    extrap_method = advection.get_method(extrap_method)
-    R = R[-(ar_order + 1):, :, :].copy()
+    extrap_method_ = advection.get_method(extrap_method)
+    R = R[-(ar_order + 1):, :, :].astype(dtype)
+    V = V.astype(dtype, copy=False)
     
     # advect the previous precipitation fields to the same position with the 
     # most recent one (i.e. transform them into the Lagrangian coordinates)
     extrap_kwargs = extrap_kwargs.copy()
     res = []
-    f = lambda R,i: extrap_method(R[i, :, :], V, ar_order-i, "min", **extrap_kwargs)[-1]
+    f = lambda R,i: extrap_method_(R[i, :, :], V, ar_order-i, "min", **extrap_kwargs)[-1]
     for i in range(ar_order):
         if not dask_imported:
             R[i, :, :] = f(R, i)
@@ -182,20 +515,34 @@ def forecast(R, V, num_timesteps, num_ens_members, num_cascade_levels, R_thr,
     else:
         MASK_thr = None
     
-    # initialize the band-pass filter
+    # initialize the band-pass filter, or take it from the cache if it has been 
+    # computed earlier with the same parameters
     filter_method = cascade.get_method(bandpass_filter_method)
-    filter = filter_method(L, num_cascade_levels, **filter_kwargs)
+    filter = cache.get_or_compute(("bandpass_filter", bandpass_filter_method, L, 
+                                   num_cascade_levels, np.dtype(dtype).name, 
+                                   sorted(filter_kwargs.items())), 
+                                  filter_method, L, num_cascade_levels, 
+                                  dtype=dtype, **filter_kwargs)
     
     # compute the cascade decompositions of the input precipitation fields
-    decomp_method = cascade.get_method(decomp_method)
-    R_d = []
-    for i in range(ar_order+1):
-        R_ = decomp_method(R[i, :, :], filter, MASK=MASK_thr)
-        R_d.append(R_)
-    
     # normalize the cascades and rearrange them into a four-dimensional array 
     # of shape (num_cascade_levels,ar_order+1,L,L) for the autoregressive model
-    R_c,mu,sigma = _stack_cascades(R_d, num_cascade_levels)
+    if decomp_method == "fft":
+        # the input fields are decomposed together with one FFT
+        R_d = cascade.decomposition.decomposition_fft_batch(R, filter, 
+                                                            MASK=MASK_thr)
+        R_c = R_d["cascade_levels"]
+        R_c -= R_d["means"][:, :, np.newaxis, np.newaxis]
+        R_c /= R_d["stds"][:, :, np.newaxis, np.newaxis]
+        R_c = np.ascontiguousarray(R_c.swapaxes(0, 1))
+        mu,sigma = R_d["means"][-1, :],R_d["stds"][-1, :]
+    else:
+        decomp_method_ = cascade.get_method(decomp_method)
+        R_d = []
+        for i in range(ar_order+1):
+            R_ = decomp_method_(R[i, :, :], filter, MASK=MASK_thr)
+            R_d.append(R_)
+        R_c,mu,sigma = _stack_cascades(R_d, num_cascade_levels)
     R_d = None
     
     # compute lag-l temporal autocorrelation coefficients for each cascade level
@@ -221,201 +568,637 @@ def forecast(R, V, num_timesteps, num_ens_members, num_cascade_levels, R_thr,
     
     _print_ar_params(PHI, False)
     
+    if ar_decay_tol is not None:
+        ar_skip_timesteps = _compute_ar_skip_timesteps(PHI, ar_decay_tol)
+        _print_ar_skip_timesteps(ar_skip_timesteps)
+    else:
+        ar_skip_timesteps = None
+    
+    # The shared state of the nowcast. It is computed only once, and it is not 
+    # modified when the ensemble members are iterated.
+    state = {}
+    state["V"]                = V
+    state["dtype"]            = np.dtype(dtype).name
+    state["domain"]           = domain
+    state["multiresolution"]  = multiresolution
+    state["R_thr"]            = R_thr
+    state["timestep"]         = timestep
+    state["ar_order"]         = ar_order
+    state["PHI"]              = PHI
+    state["ar_skip_timesteps"] = ar_skip_timesteps
+    state["mu"]               = mu
+    state["sigma"]            = sigma
+    state["filter"]           = filter
+    state["extrap_method"]    = extrap_method
+    state["decomp_method"]    = decomp_method
+    state["noise_method"]     = noise_method
+    state["vel_pert_method"]  = vel_pert_method
+    state["use_precip_mask"]  = use_precip_mask
+    state["use_probmatching"] = use_probmatching
+    state["extrap_kwargs"]    = extrap_kwargs
+    
     # discard all except the p-1 last cascades because they are not needed for 
     # the AR(p) model
-    R_c = R_c[:, -ar_order:, :, :]
+    state["R_c"] = R_c[:, -ar_order:, :, :].copy()
+    R_c = None
     
-    # stack the cascades into a five-dimensional array containing all ensemble 
-    # members
-    R_c = np.stack([R_c.copy() for i in range(num_ens_members)])
+    if domain == "spectral" or multiresolution:
+        # transform the normalized cascades into the Fourier domain, the filter 
+        # weights in the layout of the real FFT are included in the filter
+        cdtype = np.complex64 if state["dtype"] == "float32" else np.complex128
+        state["R_c"] = fft.rfft2(state["R_c"]).astype(cdtype, copy=False)
+        if multiresolution:
+            # crop the cascade levels to their resolutions
+            state["level_shapes"] = cascade.decomposition.get_level_shapes(filter)
+            state["R_c"] = _crop_cascade(state["R_c"], (R.shape[1], R.shape[2]), 
+                                         state["level_shapes"], domain, dtype)
     
-    # initialize the random generators
-    if noise_method is not None:
-        randgen_prec   = []
-        randgen_motion = []
-        np.random.seed(seed)
-        for j in range(num_ens_members):
-            rs = np.random.RandomState(seed)
-            randgen_prec.append(rs)
-            seed = rs.randint(0, high=1e9)
-            rs = np.random.RandomState(seed)
-            randgen_motion.append(rs)
-            seed = rs.randint(0, high=1e9)
+    # the random generators of the members are created from this seed in 
+    # _init_member
+    if seed is None:
+        seed = np.random.randint(2**31)
+    state["seed"] = int(seed)
     
     if noise_method is not None:
-        # get methods for perturbations
-        init_noise, generate_noise = noise.get_method(noise_method)
-        
         # initialize the perturbation generator for the precipitation field
+        init_noise,_ = noise.get_method(noise_method)
+        noise_kwargs = noise_kwargs.copy()
+        ssft_plan = noise_kwargs.pop("ssft_plan", False)
         pp = init_noise(R[-1, :, :], **noise_kwargs)
+        if noise_method.lower() in ["ssft", "nested"] and ssft_plan:
+            # replace the local filters (or their compact filter bank) with a 
+            # plan that filters the noise in the padded local windows
+            state["pp"] = noise.fftgenerators.initialize_ssft_plan(pp, dtype=dtype)
+        elif isinstance(pp, dict):
+            # the precision of a compact filter bank is set by its 
+            # compact_dtype
+            state["pp"] = pp
+        else:
+            # the noise generators follow the precision of the filter
+            state["pp"] = pp.astype(dtype, copy=False)
+        pp = None
     
     if vel_pert_method is not None:
-        init_vel_noise, generate_vel_noise = noise.get_method(vel_pert_method)
-        
-        # initialize the perturbation generators for the motion field
-        vps = []
-        for j in range(num_ens_members):
-            kwargs = {"randstate":randgen_motion[j], 
-                      "p_pert_par":vp_par, 
-                      "p_pert_perp":vp_perp}
-            vp_ = init_vel_noise(V, pixelsperkm, timestep, **kwargs)
-            vps.append(vp_)
-    
-    D = [None for j in range(num_ens_members)]
-    R_f = [[] for j in range(num_ens_members)]
+        state["pixelsperkm"]       = pixelsperkm
+        state["vel_pert_kwargs"] = {"p_pert_par":vp_par, "p_pert_perp":vp_perp}
     
     if use_precip_mask or use_probmatching:
-        MASK_thr = R[-1, :, :] >= R_thr
+        state["MASK_thr"] = R[-1, :, :] >= R_thr
+        state["R_min"]    = np.min(R)
     
     if use_probmatching:
         # compute the wet area ratio and the precipitation mask
-        war = 1.0*np.sum(MASK_thr) / (R.shape[1]*R.shape[2])
-        R_min = np.min(R)
+        state["war"] = 1.0*np.sum(state["MASK_thr"]) / (R.shape[1]*R.shape[2])
         #R_m = R_c.copy()
     
     if use_probmatching:
         pmm_bin_edges = np.linspace(R_thr, 60, 200)
-        hist = np.histogram(R[-1, :, :][MASK_thr], bins=pmm_bin_edges)[0]
-        R0_cdf = probmatching.compute_empirical_cdf(pmm_bin_edges, hist)
+        hist = np.histogram(R[-1, :, :][state["MASK_thr"]], bins=pmm_bin_edges)[0]
+        state["pmm_bin_edges"] = pmm_bin_edges
+        state["R0_cdf"] = probmatching.compute_empirical_cdf(pmm_bin_edges, hist)
     
-    R = R[-1, :, :]
+    return state
+
+def _run_timesteps(state, members, t0, num_ens_members, num_timesteps, backend, 
+                   num_workers, callback, R_f, checkpoint_file, 
+                   checkpoint_interval):
+    """Compute the time steps t0,...,t0+num_timesteps-1 of the nowcast, and 
+    supply the outputs to callback and R_f. If checkpoint_file is given, save 
+    the state of the nowcast after every checkpoint_interval time steps and 
+    after the last one."""
+    for t,R_f_ in _iter_timesteps(state, num_ens_members, num_timesteps, 
+                                  backend, num_workers, out=R_f, 
+                                  members=members, t0=t0):
+        if callback is not None:
+            callback(R_f_)
+        
+        if checkpoint_file is not None:
+            k = t - t0 + 1
+            if k == num_timesteps or (checkpoint_interval is not None and \
+                                      k % checkpoint_interval == 0):
+                save_checkpoint(checkpoint_file, {"state":state, 
+                                                  "members":members, 
+                                                  "timestep":t+1})
+
+def _iter_members(state, num_ens_members, num_timesteps, backend, num_workers):
+    """Iterate each ensemble member through all time steps, and yield tuples 
+    (j,R_f), where R_f is an array of shape (num_timesteps,m,n) containing the 
+    forecast fields of the jth member. Only the states of the members being 
+    computed are kept in memory."""
+    if backend == "processes":
+        for j,R_f_ in _iter_processes(state, num_ens_members, num_timesteps, 
+                                      True, num_workers):
+            yield j,R_f_
+        return
     
-    print("Starting nowcast computation.")
+    shape = state["V"].shape[1:3]
+    R_f_ = np.empty((num_timesteps,) + shape, dtype=state["dtype"])
+    
+    for j in range(num_ens_members):
+        print("Computing nowcast for ensemble member %d... " % (j+1), end="")
+        sys.stdout.flush()
+        starttime = time.time()
+        
+        member = _init_member(state, j)
+        for t in range(num_timesteps):
+            R_f_[t, :, :] = _iterate_member(state, member, t)
+        member = None
+        
+        print("%.2f seconds." % (time.time() - starttime))
+        
+        yield j,R_f_
+
+def _iter_timesteps(state, num_ens_members, num_timesteps, backend, num_workers, 
+                    out=None, members=None, t0=0):
+    """Iterate all ensemble members one time step at a time, and yield tuples 
+    (t,R_f), where R_f is an array of shape (num_ens_members,m,n) containing 
+    the forecast fields for time step t. If out is None, the same array is 
+    reused for all time steps. Otherwise, out is an array of shape 
+    (num_ens_members,num_timesteps,m,n), and R_f is a view to out[:, t-t0]. 
+    The computation starts from the member states given in members (updated in 
+    place) at time step t0. If members is None, they are initialized."""
+    if backend == "processes":
+        for t,R_f_ in _iter_processes(state, num_ens_members, num_timesteps, 
+                                      False, num_workers):
+            if out is not None:
+                out[:, t, :, :] = R_f_
+            yield t,R_f_
+        return
+    
+    if members is None:
+        members = [_init_member(state, j) for j in range(num_ens_members)]
+    
+    shape = state["V"].shape[1:3]
+    if out is None:
+        R_f_ = np.empty((num_ens_members,) + shape, dtype=state["dtype"])
     
     # iterate each time step
-    for t in range(num_timesteps):
+    for t in range(t0, t0+num_timesteps):
         print("Computing nowcast for time step %d... " % (t+1), end="")
         sys.stdout.flush()
         starttime = time.time()
         
+        if out is not None:
+            R_f_ = out[:, t-t0, :, :]
+        
         # iterate each ensemble member
-        def worker(j):
-            if noise_method is not None:
-                # generate noise field
-                EPS = generate_noise(pp, randstate=randgen_prec[j])
-                # decompose the noise field into a cascade
-                EPS = decomp_method(EPS, filter)
+        use_dask = backend == "dask" and dask_imported and num_ens_members > 1
+        if not use_dask and _use_noise_batch(state):
+            # generate the noise fields of all members with one batched FFT
+            EPS = _generate_noise_batch(state, members)
+        else:
+            EPS = [None] * num_ens_members
+        res = []
+        for j in range(num_ens_members):
+            if not use_dask:
+                R_f_[j, :, :] = _iterate_member(state, members[j], t, EPS=EPS[j])
             else:
-                EPS = None
-            
-            # iterate the AR(p) model for each cascade level
-            for i in range(num_cascade_levels):
-                # normalize the noise cascade
-                if EPS is not None:
-                    EPS_ = (EPS["cascade_levels"][i, :, :] - EPS["means"][i]) / EPS["stds"][i]
-                else:
-                    EPS_ = None
-                # apply AR(p) process to cascade level
-                R_c[j, i, :, :, :] = \
-                    autoregression.iterate_ar_model(R_c[j, i, :, :, :], PHI[i, :], EPS=EPS_)
-                # use a separate AR(p) model for the non-perturbed forecast, 
-                # from which the mask is obtained
-                #if use_precip_mask:
-                #    R_m[j, i, :, :, :] = \
-                #        autoregression.iterate_ar_model(R_m[j, i, :, :, :], PHI[i, :])
-            
-            EPS  = None
-            EPS_ = None
-            
-            # compute the recomposed precipitation field(s) from the cascades 
-            # obtained from the AR(p) model(s)
-            R_r = _recompose_cascade(R_c[j, :, :, :], mu, sigma)
-            
-            if use_precip_mask:
-                # apply the precipitation mask to prevent generation of new 
-                # precipitation into areas where it was not originally 
-                # observed
-                R_r[~MASK_thr] = R_min
+                res.append(dask.delayed(_iterate_member)(state, members[j], t))
+        
+        if use_dask:
+            # the members are computed concurrently, so they share the FFT 
+            # thread budget
+            with fft.worker_pool(min(num_ens_members, multiprocessing.cpu_count())):
+                R_dask = dask.compute(*res)
+            for j,R_ in enumerate(R_dask):
+                R_f_[j, :, :] = R_
+            R_dask = None
+        res = None
+        EPS = None
+        
+        print("%.2f seconds." % (time.time() - starttime))
+        
+        yield t,R_f_
+
+def _iter_processes(state, num_ens_members, num_timesteps, member_major, 
+                    num_workers):
+    """Compute the ensemble members in a pool of worker processes. The members 
+    are distributed evenly to the workers, and each worker keeps the states of 
+    its members. The computed fields are sent back through a queue. In 
+    member-major order, tuples (j,R_f) are yielded once all time steps of 
+    member j have been received. Otherwise, tuples (t,R_f) are yielded in 
+    ascending order of t once all members of time step t have been received. 
+    The yielded arrays are reused."""
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
+    num_workers = max(min(num_workers, num_ens_members), 1)
+    
+    shape = state["V"].shape[1:3]
+    
+    shm_state,shm_blocks = _share_state(state)
+    
+    # divide the FFT thread budget among the worker processes
+    fft_threads = max(int(fft.get_threads_per_call() / num_workers), 1)
+    
+    ctx = multiprocessing.get_context()
+    result_queue = ctx.Queue()
+    workers = []
+    try:
+        for k in range(num_workers):
+            member_ids = list(range(k, num_ens_members, num_workers))
+            p = ctx.Process(target=_process_worker, 
+                            args=(shm_state, member_ids, num_timesteps, 
+                                  member_major, result_queue, fft_threads))
+            p.daemon = True
+            p.start()
+            workers.append(p)
+        
+        # buffers for the incomplete time steps or members, respectively, and 
+        # a list of buffers that can be reused
+        buffers = {}
+        counts  = {}
+        free_buffers = []
+        next_t  = 0
+        starttime = time.time()
+        
+        if member_major:
+            buffer_shape = (num_timesteps,) + shape
+        else:
+            buffer_shape = (num_ens_members,) + shape
+        
+        for k in range(num_ens_members*num_timesteps):
+            while True:
+                try:
+                    msg = result_queue.get(timeout=1.0)
+                    break
+                except queue.Empty:
+                    for p in workers:
+                        if p.exitcode is not None and p.exitcode != 0:
+                            raise Exception("worker process exited with code %d" % p.exitcode)
             
-            if use_probmatching:
-                # obtain the precipitation mask from the non-perturbed 
-                # forecast that is scale-filtered by the AR(p) model
-                #R_m_ = _recompose_cascade(R_m[j, :, :, :], mu, sigma)
-                
-                #R_s = R_m_.flatten()
-                
-                # compute the threshold value R_pct_thr corresponding to the 
-                # same fraction of precipitation pixels (forecast values above 
-                # R_min) as in the most recently observed precipitation field
-                R_s = R_r.flatten()
-                R_s.sort(kind="quicksort")
-                x = 1.0*np.arange(1, len(R_s)+1)[::-1] / len(R_s)
-                i = np.argmin(abs(x - war))
-                # handle ties
-                if R_s[i] == R_s[i + 1]:
-                    i = np.where(R_s == R_s[i])[0][-1] + 1
-                R_pct_thr = R_s[i]
-                
-                # apply the above mask and adjust the intensity values to 
-                # preserve the wet-area ratio
-                MASK_p = R_r < R_pct_thr
-                R_r[~MASK_p] = R_r[~MASK_p] + (R_thr - R_pct_thr)
-                R_r[MASK_p] = R_min
-                
-                R_s  = None
-                #R_m_ = None
-                
-                # adjust the conditional CDF of the forecast (precipitation 
-                # intensity above the threshold R_thr) to match the most 
-                # recently measured precipitation field
-                R_out_hist = np.histogram(R_r[~MASK_p], bins=pmm_bin_edges)[0]
-                R_out_cdf = probmatching.compute_empirical_cdf(pmm_bin_edges, R_out_hist)
-                pmm = probmatching.pmm_init(pmm_bin_edges, R_out_cdf, pmm_bin_edges, R0_cdf)
-                R_r[~MASK_p] = probmatching.pmm_compute(pmm, R_r[~MASK_p])
-                
-                # TODO: this is needed because the probability matching 
-                # introduces nan values for some reason. Take a closer look 
-                # on this.
-                R_r[~np.isfinite(R_r)] = R_thr
-                
-                R_out_hist = None
-                R_out_cdf = None
-                pmm = None
-                # the old version is currently commented out
-                #R_r = probmatching.nonparam_match_empirical_cdf(R_r, R)
+            if msg[0] == "error":
+                raise Exception("error in worker process:\n%s" % msg[1])
+            _,t,j,R_ = msg
             
-            # compute the perturbed motion field
-            if vel_pert_method is not None:
-                V_ = V + generate_vel_noise(vps[j], t*timestep)
+            key = j if member_major else t
+            if key not in buffers:
+                if len(free_buffers) > 0:
+                    buffers[key] = free_buffers.pop()
+                else:
+                    buffers[key] = np.empty(buffer_shape, dtype=state["dtype"])
+                counts[key] = 0
+            if member_major:
+                buffers[key][t, :, :] = R_
             else:
-                V_ = V
-            
-            # advect the recomposed precipitation field to obtain the forecast 
-            # for time step t
-            extrap_kwargs.update({"D_prev":D[j], "return_displacement":True})
-            R_f_,D_ = extrap_method(R_r, V_, 1, **extrap_kwargs)
-            D[j] = D_
-            R_f_ = R_f_[0]
+                buffers[key][j, :, :] = R_
+            counts[key] += 1
             
-            return R_f_
-        
-        res = []
-        for j in range(num_ens_members):
-            if not dask_imported or num_ens_members == 1:
-                res.append(worker(j))
+            if member_major:
+                if counts[j] == num_timesteps:
+                    print("Computed nowcast for ensemble member %d." % (j+1))
+                    counts.pop(j)
+                    R_ = buffers.pop(j)
+                    yield j,R_
+                    free_buffers.append(R_)
             else:
-                res.append(dask.delayed(worker)(j))
+                # yield the time steps in ascending order
+                while next_t in counts and counts[next_t] == num_ens_members:
+                    print("Computed nowcast for time step %d: %.2f seconds." % \
+                          (next_t+1, time.time() - starttime))
+                    counts.pop(next_t)
+                    R_ = buffers.pop(next_t)
+                    yield next_t,R_
+                    free_buffers.append(R_)
+                    next_t += 1
         
-        R_f_ = dask.compute(*res) if dask_imported and num_ens_members > 1 else res
-        res = None
+        for p in workers:
+            p.join()
+    finally:
+        for p in workers:
+            if p.is_alive():
+                p.terminate()
+        for shm in shm_blocks:
+            shm.close()
+            shm.unlink()
+
+def _process_worker(shm_state, member_ids, num_timesteps, member_major, 
+                    result_queue, fft_threads):
+    try:
+        fft.set_num_threads(fft_threads)
+        state,shm_blocks = _attach_state(shm_state)
         
-        print("%.2f seconds." % (time.time() - starttime))
+        if member_major:
+            for j in member_ids:
+                member = _init_member(state, j)
+                for t in range(num_timesteps):
+                    R_ = _iterate_member(state, member, t)
+                    result_queue.put(("result", t, j, R_))
+                member = None
+        else:
+            members = [_init_member(state, j) for j in member_ids]
+            for t in range(num_timesteps):
+                for j,member in zip(member_ids, members):
+                    R_ = _iterate_member(state, member, t)
+                    result_queue.put(("result", t, j, R_))
         
-        if callback is not None:
-            callback(np.stack(R_f_))
-            R_f_ = None
+        state = None
+        for shm in shm_blocks:
+            shm.close()
+    except Exception:
+        result_queue.put(("error", traceback.format_exc()))
+
+# the large read-only arrays of the nowcast state that are placed in shared 
+# memory for the worker processes
+_SHARED_ARRAYS = [("filter", "weights_2d_rfft"), 
+                  ("filter", "support_index"), ("filter", "support_weights"), 
+                  ("pp",), ("PHI",), ("V",), ("MASK_thr",), ("R_c",)]
+
+def _share_state(state):
+    """Copy the large arrays of the state into shared memory blocks. Return a 
+    shallow copy of the state where the arrays are replaced with references to 
+    the shared memory blocks, and the list of the blocks."""
+    shm_state  = state.copy()
+    shm_blocks = []
+    
+    for keys in _SHARED_ARRAYS:
+        parent = _get_parent_dict(shm_state, keys)
+        X = parent.get(keys[-1], None)
+        if not isinstance(X, np.ndarray) or X.nbytes == 0:
+            continue
         
-        if return_output:
-            for j in range(num_ens_members):
-                R_f[j].append(R_f_[j])
+        shm = shared_memory.SharedMemory(create=True, size=X.nbytes)
+        shm_blocks.append(shm)
+        X_shm = np.ndarray(X.shape, dtype=X.dtype, buffer=shm.buf)
+        X_shm[...] = X
+        parent[keys[-1]] = ("__shared_memory__", shm.name, X.shape, X.dtype.str)
     
-    if return_output:
-        if num_ens_members == 1:
-            return np.stack(R_f[0])
+    return shm_state,shm_blocks
+
+def _attach_state(shm_state):
+    """Inverse of _share_state: replace the references to the shared memory 
+    blocks with read-only arrays."""
+    state = shm_state.copy()
+    shm_blocks = []
+    
+    for keys in _SHARED_ARRAYS:
+        parent = _get_parent_dict(state, keys)
+        ref = parent.get(keys[-1], None)
+        if not isinstance(ref, tuple) or ref[0] != "__shared_memory__":
+            continue
+        
+        shm = shared_memory.SharedMemory(name=ref[1])
+        shm_blocks.append(shm)
+        X = np.ndarray(ref[2], dtype=np.dtype(ref[3]), buffer=shm.buf)
+        X.flags.writeable = False
+        parent[keys[-1]] = X
+    
+    return state,shm_blocks
+
+def _get_parent_dict(state, keys):
+    # Return the dictionary containing the item specified by the given list of 
+    # nested keys. The nested dictionaries are copied so that the original 
+    # state is not modified.
+    parent = state
+    for key in keys[:-1]:
+        if not isinstance(parent.get(key, None), dict):
+            return {}
+        parent[key] = parent[key].copy()
+        parent = parent[key]
+    
+    return parent
+
+def _check_checkpoint_args(checkpoint_file, member_major, backend):
+    if checkpoint_file is not None and (member_major or backend == "processes"):
+        raise ValueError("checkpoints are not supported if member_major is True or backend is 'processes'")
+
+# Encoding of the nowcast state for save_checkpoint: arrays are stored as 
+# separate entries of the .npz file, and the remaining structure is stored as 
+# JSON with references to the arrays.
+def _encode_checkpoint(obj, arrays):
+    if isinstance(obj, dict):
+        return {"__dict__":[[k, _encode_checkpoint(v, arrays)] for k,v in obj.items()]}
+    elif isinstance(obj, (list, tuple)):
+        key = "__list__" if isinstance(obj, list) else "__tuple__"
+        return {key:[_encode_checkpoint(v, arrays) for v in obj]}
+    elif isinstance(obj, np.ndarray):
+        key = "array_%d" % len(arrays)
+        arrays[key] = obj
+        return {"__array__":key}
+    elif isinstance(obj, np.random.RandomState):
+        name,keys,pos,has_gauss,cached_gaussian = obj.get_state()
+        return {"__randomstate__":[name, _encode_checkpoint(keys, arrays), 
+                                   int(pos), int(has_gauss), 
+                                   float(cached_gaussian)]}
+    elif isinstance(obj, np.random.Generator):
+        return {"__generator__":_encode_checkpoint(obj.bit_generator.state, 
+                                                   arrays)}
+    elif isinstance(obj, (bool, np.bool_)):
+        return bool(obj)
+    elif isinstance(obj, (int, np.integer)):
+        return int(obj)
+    elif isinstance(obj, (float, np.floating)):
+        return float(obj)
+    elif obj is None or isinstance(obj, str):
+        return obj
+    else:
+        raise TypeError("cannot save object of type %s into a checkpoint" % type(obj))
+
+def _decode_checkpoint(obj, arrays):
+    if isinstance(obj, dict):
+        if "__dict__" in obj:
+            return dict((k, _decode_checkpoint(v, arrays)) for k,v in obj["__dict__"])
+        elif "__list__" in obj:
+            return [_decode_checkpoint(v, arrays) for v in obj["__list__"]]
+        elif "__tuple__" in obj:
+            return tuple(_decode_checkpoint(v, arrays) for v in obj["__tuple__"])
+        elif "__array__" in obj:
+            return arrays[obj["__array__"]]
+        elif "__randomstate__" in obj:
+            name,keys,pos,has_gauss,cached_gaussian = obj["__randomstate__"]
+            randstate = np.random.RandomState()
+            randstate.set_state((name, _decode_checkpoint(keys, arrays), pos, 
+                                 has_gauss, cached_gaussian))
+            return randstate
+        elif "__generator__" in obj:
+            bg_state = _decode_checkpoint(obj["__generator__"], arrays)
+            bitgen = getattr(np.random, bg_state["bit_generator"])()
+            bitgen.state = bg_state
+            return np.random.Generator(bitgen)
+    
+    return obj
+
+def _check_backend(backend):
+    if backend not in ["dask", "serial", "processes"]:
+        raise ValueError("unknown backend %s, the currently implemented backends are 'dask', 'serial' and 'processes'" % backend)
+    if backend == "processes" and not shared_memory_imported:
+        raise Exception("the processes backend requires multiprocessing.shared_memory (Python 3.8 or later)")
+
+def _init_member(state, j):
+    """Initialize the state of the jth ensemble member."""
+    member = {}
+    
+    # the AR(p) model is iterated in place by treating the time dimension of 
+    # R_c as a ring buffer, head is the index of the most recent cascade
+    if isinstance(state["R_c"], list):
+        member["R_c"] = [R_c_.copy() for R_c_ in state["R_c"]]
+    else:
+        member["R_c"] = state["R_c"].copy()
+    member["ar_head"] = state["ar_order"] - 1
+    member["D"]       = None
+    
+    # the generators depend only on the seed and j, so any member can be 
+    # initialized alone
+    if state["noise_method"] is not None:
+        member["randgen_prec"] = noise_utils.get_member_generator(state["seed"], 
+                                                                  j, "precip")
+    
+    if state["vel_pert_method"] is not None:
+        init_vel_noise,_ = noise.get_method(state["vel_pert_method"])
+        randgen_motion = noise_utils.get_member_generator(state["seed"], j, 
+                                                          "motion")
+        member["vp"] = init_vel_noise(state["V"], state["pixelsperkm"], 
+                                      state["timestep"], randstate=randgen_motion, 
+                                      **state["vel_pert_kwargs"])
+    
+    return member
+
+def _iterate_member(state, member, t, EPS=None):
+    """Compute the forecast field of one ensemble member for time step t. The 
+    member state is updated in place. EPS is an optional noise field of the 
+    member generated by _generate_noise_batch."""
+    decomp_method   = cascade.get_method(state["decomp_method"])
+    extrap_method   = advection.get_method(state["extrap_method"])
+    PHI             = state["PHI"]
+    R_thr           = state["R_thr"]
+    use_precip_mask = state["use_precip_mask"]
+    spectral        = state.get("domain", "spatial") == "spectral"
+    multiresolution = state.get("multiresolution", False)
+    shape           = state["V"].shape[1:3]
+    
+    if state["noise_method"] is not None and _use_noise_cascade(state):
+        # generate the normalized noise cascade directly from the spectrum of 
+        # the noise field
+        _,generate_noise = noise.get_method(state["noise_method"], cascade=True)
+        EPS = generate_noise(state["pp"], state["filter"], 
+                             randstate=member["randgen_prec"], 
+                             domain=state.get("domain", "spatial"), 
+                             multiresolution=multiresolution)
+        EPS_ = EPS["cascade_levels"]
+    elif state["noise_method"] is not None:
+        # generate noise field
+        if EPS is None and _use_noise_batch(state):
+            EPS = _generate_noise_batch(state, [member])[0]
+        elif EPS is None:
+            _,generate_noise = noise.get_method(state["noise_method"])
+            EPS = generate_noise(state["pp"], randstate=member["randgen_prec"])
+        # decompose the noise field into a cascade
+        if not spectral and not multiresolution:
+            EPS = decomp_method(EPS, state["filter"])
         else:
-            return np.stack([np.stack(R_f[j]) for j in range(num_ens_members)])
+            EPS = decomp_method(EPS, state["filter"], domain=state["domain"], 
+                                multiresolution=multiresolution)
+        # normalize the noise cascade in place, in the spectral domain the mean 
+        # is subtracted from the zero-frequency component
+        EPS_ = EPS["cascade_levels"]
+        for i in range(len(EPS_)):
+            if not spectral:
+                EPS_[i] -= EPS["means"][i]
+            else:
+                level_shape = state["level_shapes"][i] if multiresolution else shape
+                EPS_[i][0, 0] -= EPS["means"][i] * level_shape[0] * level_shape[1]
+            EPS_[i] /= EPS["stds"][i]
     else:
-        return None
+        EPS_ = None
+    
+    num_levels = PHI.shape[0]
+    num_active = _get_num_active_levels(state, t)
+    if len(member["R_c"]) > num_active:
+        # the memory of the finest cascade levels has decayed, so their AR(p) 
+        # buffers are no longer needed
+        if multiresolution:
+            member["R_c"] = member["R_c"][:num_active]
+        else:
+            member["R_c"] = member["R_c"][:num_active].copy()
+    
+    # iterate the AR(p) model for all cascade levels, the normalized noise 
+    # cascade is overwritten by the new cascade
+    if multiresolution:
+        # the levels have different shapes, so they are iterated separately
+        if EPS_ is None:
+            EPS_ = [np.zeros(R_c_.shape[1:], dtype=R_c_.dtype) for R_c_ in state["R_c"]]
+        head = member["ar_head"]
+        for i in range(num_active):
+            member["ar_head"],_ = \
+                autoregression.iterate_ar_model_inplace(member["R_c"][i], 
+                                                        PHI[i, :], head, 
+                                                        EPS=EPS_[i], 
+                                                        out=EPS_[i])
+        R_c_ = EPS_
+    elif num_active == num_levels:
+        member["ar_head"],R_c_ = \
+            autoregression.iterate_ar_model_batched(member["R_c"], PHI, 
+                                                    member["ar_head"], EPS=EPS_, 
+                                                    out=EPS_)
+    else:
+        # the skipped levels are taken from the normalized noise cascade
+        if EPS_ is None:
+            EPS_ = np.zeros((num_levels,) + member["R_c"].shape[2:], 
+                            dtype=member["R_c"].dtype)
+        if num_active > 0:
+            member["ar_head"],_ = \
+                autoregression.iterate_ar_model_batched(member["R_c"], 
+                                                        PHI[:num_active], 
+                                                        member["ar_head"], 
+                                                        EPS=EPS_[:num_active], 
+                                                        out=EPS_[:num_active])
+        R_c_ = EPS_
+    # use a separate AR(p) model for the non-perturbed forecast, 
+    # from which the mask is obtained
+    #if use_precip_mask:
+    #    R_m[j, i, :, :, :] = \
+    #        autoregression.iterate_ar_model(R_m[j, i, :, :, :], PHI[i, :])
+    
+    EPS  = None
+    EPS_ = None
+    
+    # compute the recomposed precipitation field(s) from the cascades 
+    # obtained from the AR(p) model(s)
+    if multiresolution:
+        R_r = _recompose_cascade_multiresolution(R_c_, state["mu"], 
+                                                 state["sigma"], shape, 
+                                                 state["level_shapes"], spectral)
+    elif not spectral:
+        R_r = _recompose_cascade(R_c_, state["mu"], state["sigma"])
+    else:
+        R_r = _recompose_cascade_spectral(R_c_, state["mu"], state["sigma"], 
+                                          shape)
+    R_c_ = None
+    
+    if use_precip_mask:
+        # apply the precipitation mask to prevent generation of new 
+        # precipitation into areas where it was not originally 
+        # observed
+        R_r[~state["MASK_thr"]] = state["R_min"]
+    
+    if state["use_probmatching"]:
+        # Set the pixels below the threshold corresponding to the same fraction 
+        # of precipitation pixels as in the most recently observed 
+        # precipitation field to R_min, and shift the values above it to 
+        # preserve the wet-area ratio. Then adjust the conditional CDF of the 
+        # forecast (precipitation intensity above the threshold R_thr) to 
+        # match the most recently measured precipitation field. The threshold 
+        # is found by selection instead of sorting the field.
+        R_r = probmatching.match_war_and_cdf(R_r, state["war"], R_thr, 
+                                             state["R_min"], 
+                                             state["pmm_bin_edges"], 
+                                             state["R0_cdf"])
+        # the old version is currently commented out
+        #R_r = probmatching.nonparam_match_empirical_cdf(R_r, R)
+    
+    # compute the perturbed motion field
+    if state["vel_pert_method"] is not None:
+        _,generate_vel_noise = noise.get_method(state["vel_pert_method"])
+        V_ = state["V"] + generate_vel_noise(member["vp"], t*state["timestep"])
+    else:
+        V_ = state["V"]
+    
+    # advect the recomposed precipitation field to obtain the forecast 
+    # for time step t
+    extrap_kwargs = state["extrap_kwargs"].copy()
+    extrap_kwargs.update({"D_prev":member["D"], "return_displacement":True})
+    R_f_,member["D"] = extrap_method(R_r, V_, 1, **extrap_kwargs)
+    
+    return R_f_[0]
 
 def _check_inputs(R, V, ar_order):
     if len(R.shape) != 3:
@@ -456,6 +1239,20 @@ def _print_ar_params(PHI, include_perturb_term):
         print(fmt_str % ((k+1,) + tuple(PHI[k, :])))
         print(hline_str)
 
+def _print_ar_skip_timesteps(ar_skip_timesteps):
+    print("****************************************")
+    print("* Time steps for skipping AR(p) models *")
+    print("****************************************")
+    
+    hline_str = "---------------------"
+    print(hline_str)
+    print("| Level | Time step |")
+    print(hline_str)
+    
+    for k,t in enumerate(ar_skip_timesteps):
+        print("| %-5d | %-9s |" % (k+1, "-" if t is None else "%d" % t))
+        print(hline_str)
+
 def _print_corrcoefs(GAMMA):
     print("************************************************")
     print("* Correlation coefficients for cascade levels: *")
@@ -483,6 +1280,72 @@ def _print_corrcoefs(GAMMA):
         print(fmt_str % ((k+1,) + tuple(GAMMA[k, :])))
         print(hline_str)
 
+def _compute_ar_skip_timesteps(PHI, tol):
+    # For each cascade level, find the first time step after which the 
+    # contribution of the initial cascades stays below tol. None means that the 
+    # level is never skipped.
+    ar_skip_timesteps = []
+    p = PHI.shape[1] - 1
+    for i in range(PHI.shape[0]):
+        # The decay d(k) satisfies d(s) <= q*max(d(0),...,d(k-1)) for all s>=k, 
+        # where q=max(d(k-p+1),...,d(k)), because the rows of the kth power of 
+        # the companion matrix are the first rows of its p last powers. The 
+        # horizon is extended until this bound is below tol, so the result 
+        # does not depend on the number of time steps.
+        num_steps = 16
+        while True:
+            decay = autoregression.compute_ar_memory_decay(PHI[i, :], num_steps)
+            decay = np.hstack([[1.0], decay])
+            if np.max(decay[-p:]) * np.max(decay[:-1]) < tol:
+                above = np.where(decay >= tol)[0]
+                ar_skip_timesteps.append(int(above[-1]) + 1 if len(above) > 0 else 1)
+                break
+            elif num_steps >= 65536:
+                ar_skip_timesteps.append(None)
+                break
+            num_steps *= 2
+    
+    # the skipped levels must be the finest ones so that the remaining AR(p) 
+    # buffers form a contiguous block, so a level is skipped only when all 
+    # finer levels are also skipped
+    for i in range(len(ar_skip_timesteps)-2, -1, -1):
+        t_i,t_f = ar_skip_timesteps[i],ar_skip_timesteps[i+1]
+        if t_i is not None and (t_f is None or t_f > t_i):
+            ar_skip_timesteps[i] = t_f
+    
+    return ar_skip_timesteps
+
+def _get_num_active_levels(state, t):
+    # Return the number of cascade levels whose AR(p) models are iterated at 
+    # time step t. The time steps in ar_skip_timesteps are one-based.
+    ar_skip_timesteps = state.get("ar_skip_timesteps", None)
+    if ar_skip_timesteps is None:
+        return state["PHI"].shape[0]
+    
+    return sum([1 for t_skip in ar_skip_timesteps if t_skip is None or t+1 < t_skip])
+
+def _use_noise_cascade(state):
+    # The global Fourier filter generators can produce the noise cascade 
+    # directly in the spectral domain when the cascade is decomposed with the 
+    # FFT-based method.
+    return state["noise_method"].lower() in ["parametric", "nonparametric"] and \
+        state["decomp_method"] == "fft"
+
+def _use_noise_batch(state):
+    # The noise fields of the global Fourier filter generators are generated 
+    # with the batched generator if the noise cascade is not generated 
+    # directly.
+    return state["noise_method"] is not None and \
+        state["noise_method"].lower() in ["parametric", "nonparametric"] and \
+        not _use_noise_cascade(state)
+
+def _generate_noise_batch(state, members):
+    # Generate the noise fields of the given members. Each field depends only 
+    # on the random generator of its member, so the result does not depend on 
+    # how the members are batched.
+    return noise.fftgenerators.generate_noise_2d_fft_filter_batch(
+        state["pp"], randstates=[member["randgen_prec"] for member in members])
+
 def _stack_cascades(R_d, num_levels):
   R_c   = []
   mu    = np.empty(num_levels)
@@ -505,7 +1368,59 @@ def _stack_cascades(R_d, num_levels):
   return np.stack(R_c),mu,sigma
 
 def _recompose_cascade(R, mu, sigma):
-    R_rc = [(R[i, -1, :, :] * sigma[i]) + mu[i] for i in range(len(mu))]
+    # the statistics are converted to Python floats so that they do not change 
+    # the precision of R
+    R_rc = [(R[i, :, :] * float(sigma[i])) + float(mu[i]) for i in range(len(mu))]
     R_rc = np.sum(np.stack(R_rc), axis=0)
     
     return R_rc
+
+def _recompose_cascade_spectral(R, mu, sigma, shape):
+    # Recompose a cascade whose levels are real FFT spectra, and transform the 
+    # result back to the spatial domain with one inverse FFT. The means of the 
+    # levels only contribute to the zero-frequency component.
+    F = R[0, :, :] * float(sigma[0])
+    for i in range(1, len(mu)):
+        F += R[i, :, :] * float(sigma[i])
+    F[0, 0] += float(np.sum(mu)) * shape[0] * shape[1]
+    
+    dtype = np.float32 if F.dtype == np.complex64 else np.float64
+    
+    return fft.irfft2(F, s=shape).astype(dtype, copy=False)
+
+def _recompose_cascade_multiresolution(R, mu, sigma, shape, level_shapes, 
+                                       spectral):
+    # Recompose a cascade whose levels have different resolutions. The spectra 
+    # of the levels are padded to the input resolution and summed, and the 
+    # result is transformed back to the spatial domain with one inverse FFT.
+    F = None
+    for i,level_shape in enumerate(level_shapes):
+        F_i = R[i] if spectral else fft.rfft2(R[i])
+        c = float(sigma[i]) * shape[0] * shape[1] / (level_shape[0] * level_shape[1])
+        F_i = cascade.decomposition.pad_rfft_spectrum(F_i * c, shape)
+        if F is None:
+            F = F_i
+        else:
+            F += F_i
+    F[0, 0] += float(np.sum(mu)) * shape[0] * shape[1]
+    
+    dtype = np.float32 if R[0].dtype in [np.float32, np.complex64] else np.float64
+    
+    return fft.irfft2(F, s=shape).astype(dtype, copy=False)
+
+def _crop_cascade(R_c, shape, level_shapes, domain, dtype):
+    # Crop the real FFT spectra of the cascades of shape (n,p,M,N/2+1) to the 
+    # resolutions of the levels. The levels are returned as a list of arrays of 
+    # shape (p,m,n), either as spectra or transformed to the spatial domain.
+    R_c_ = []
+    for i,level_shape in enumerate(level_shapes):
+        c = 1.0*level_shape[0]*level_shape[1] / (shape[0]*shape[1])
+        F = np.stack([cascade.decomposition.crop_rfft_spectrum(R_c[i, j, :, :], 
+                                                               level_shape) \
+                      for j in range(R_c.shape[1])]) * c
+        if domain == "spectral":
+            R_c_.append(F.astype(R_c.dtype, copy=False))
+        else:
+            R_c_.append(fft.irfft2(F, s=level_shape).astype(dtype, copy=False))
+    
+    return R_c_
@@ -1,22 +1,130 @@
 ''' Methods for probability matching'''
 
 import numpy as np
-from scipy import interpolate as sip
 
 def compute_empirical_cdf(bin_edges, hist):
-    cdf = []
-    xs = 0.0
+    # the cumulative sums are computed along the last axis, so hist can also 
+    # contain a batch of histograms
+    cdf = np.cumsum(np.diff(bin_edges) * hist, axis=-1)
+    cdf = np.concatenate([np.zeros(cdf.shape[:-1] + (1,)), cdf], axis=-1)
     
-    for x,h in zip(zip(bin_edges[:-1], bin_edges[1:]), hist):
-        cdf.append(xs)
-        xs += (x[1] - x[0]) * h
+    return cdf / cdf[..., -1:]
+
+def compute_war_threshold(X, war):
+    """Compute the threshold value above which the fraction of the values of 
+    X is (approximately) equal to the given wet-area ratio. The threshold is 
+    found by selection (numpy.partition) in linear time instead of sorting. 
+    If the selected value is tied with the next larger value, the threshold is 
+    set to the smallest value greater than it, so that the tied values fall 
+    below the threshold.
+    
+    Parameters
+    ----------
+    X : array_like
+      Array of shape (m,n) or (k,m,n) containing one or k fields.
+    war : float
+      The wet-area ratio, i.e. the fraction of the values that should be at 
+      least the threshold.
+    
+    Returns
+    -------
+    out : float or ndarray
+      The threshold for X, or an array of k thresholds if X is 
+      three-dimensional. If there is no greater value to break a tie, the 
+      threshold is infinity.
+    """
+    batched = len(X.shape) == 3
+    X = X.reshape(X.shape[0] if batched else 1, -1)
+    N = X.shape[1]
+    
+    # index of the threshold value in the ascending order
+    i = N - int(np.floor(war*N + 0.5))
+    i = min(max(i, 0), N-1)
+    
+    if i < N - 1:
+        X_p = np.partition(X, [i, i+1], axis=1)
+        thr = X_p[:, i].copy()
+        # handle ties
+        for j in np.where(X_p[:, i+1] == thr)[0]:
+            X_ = X[j, :]
+            X_ = X_[X_ > thr[j]]
+            thr[j] = np.min(X_) if len(X_) > 0 else np.inf
+    else:
+        thr = np.max(X, axis=1)
+    
+    return thr if batched else float(thr[0])
+
+def match_war_and_cdf(X, war, R_thr, R_min, bin_edges, target_cdf):
+    """Adjust a field or a batch of fields so that their wet-area ratios and 
+    the cumulative distribution functions (CDF) of the precipitation 
+    intensities above the threshold match the given ones.
+    
+    The wet-area ratio is preserved by finding the threshold with 
+    compute_war_threshold. The values below the threshold are set to R_min, 
+    and the values above it are shifted so that the threshold becomes R_thr. 
+    The CDFs of the shifted values are then computed from their histograms, 
+    which are counted for all fields with one pass over the data, and matched 
+    with the target CDF by using linear interpolation lookup tables (see 
+    pmm_init). The values that cannot be matched because they are outside the 
+    range of the bins are set to R_thr.
+    
+    Parameters
+    ----------
+    X : array_like
+      Array of shape (m,n) or (k,m,n) containing one or k fields.
+    war : float
+      The target wet-area ratio.
+    R_thr : float
+      The intensity threshold for precipitation.
+    R_min : float
+      The value assigned to the pixels without precipitation.
+    bin_edges : array_like
+      Array of length b+1 containing the bin edges of the CDFs.
+    target_cdf : array_like
+      Array of length b+1 containing the target CDF at the bin edges, e.g. 
+      computed with compute_empirical_cdf.
+    
+    Returns
+    -------
+    out : ndarray
+      Array of the same shape and type as X containing the adjusted fields.
+    """
+    shape = X.shape
+    X = X.reshape((-1,) + shape[-2:])
+    k = X.shape[0]
+    
+    thr = compute_war_threshold(X, war)
+    
+    # apply the threshold and shift the values above it to preserve the 
+    # wet-area ratio
+    X = X.reshape(k, -1)
+    MASK_w = X >= thr[:, np.newaxis]
     
-    cdf.append(xs)
-    cdf = np.array(cdf) / xs
+    # the values above the thresholds of all fields are processed as one array, 
+    # and j contains the index of the field of each value
+    num_wet = np.sum(MASK_w, axis=1)
+    j = np.repeat(np.arange(k), num_wet)
+    x = X[MASK_w] + np.repeat((R_thr - thr).astype(X.dtype), num_wet)
     
-    return cdf
+    # compute the CDFs of the values above the threshold for all fields with 
+    # one bincount, and match them with the target CDF
+    b = len(bin_edges) - 1
+    i = _get_bin_indices(x, bin_edges)
+    valid = np.logical_and(i >= 0, i < b)
+    hist = np.bincount(j[valid]*b + i[valid], minlength=k*b).reshape(k, b)
+    cdf  = compute_empirical_cdf(bin_edges, hist)
+    
+    lut = _init_lut(bin_edges, cdf, bin_edges, target_cdf)
+    x = _apply_lut(lut, x, i, j)
+    x[~np.isfinite(x)] = R_thr
+    
+    X_out = np.full(X.shape, R_min, dtype=X.dtype)
+    X_out[MASK_w] = x
+    
+    return X_out.reshape(shape)
 
-def nonparam_match_empirical_cdf(initialarray, targetarray):
+def nonparam_match_empirical_cdf(initialarray, targetarray, method="exact", 
+                                 num_bins=10000):
     """Matches the empirical CDF of the initial array with the empirical CDF
     of a target array. 
     Initial ranks are conserved, but empirical distribution matches the target one.
@@ -28,74 +136,368 @@ def nonparam_match_empirical_cdf(initialarray, targetarray):
         The initial array whose CDF is to be changed.
     targetarray : 
         The target array whose CDF is to be matched.
+    method : str
+        'exact' (the default) matches the ranks of the values exactly by 
+        sorting both arrays, which takes O(N log N) time. 'approx' 
+        approximates the ranks and the target values at the ranks by 
+        histograms with num_bins equally spaced bins, which takes linear 
+        time. The values are assumed to be uniformly distributed within the 
+        bins containing at least 16 values. The values of the other bins, 
+        which include the tails of the distributions, are ranked exactly by 
+        sorting them, and so are the values whose ranks fall into such bins 
+        of the target histogram. The error of the output values is thus 
+        typically a fraction of the bin width of the target histogram, also 
+        in the tails, but it is not strictly bounded by it: within a bin, the 
+        values are mapped as if they were uniformly distributed. If the 
+        arrays contain less than about 16*num_bins values, most of the bins 
+        are sparse, and the method approaches the exact one. With 'approx', 
+        the arrays are not required to have the same size.
+    num_bins : int
+        The number of histogram bins if method is 'approx'.
         
     Returns
     -------
     outputarray : array-like
         The new array. 
     """
-    if initialarray.size != targetarray.size:
+    if method == "exact" and initialarray.size != targetarray.size:
         raise ValueError("the input arrays must have the same size")
     if np.any(~np.isfinite(initialarray)) or np.any(~np.isfinite(targetarray)):
       raise ValueError("input contains non-finite values")
     
-    # zeros in initial image
-    zvalue = initialarray.min()
-    idxzeros = initialarray == zvalue
-
-    # flatten the arrays
-    arrayshape = initialarray.shape
-    target = targetarray.flatten()
-    array = initialarray.flatten()
+    outputarray = _nonparam_match(initialarray.flatten(), targetarray.flatten(), 
+                                  method, num_bins)
     
-    # rank target values
-    order = target.argsort()
-    ranked = target[order]
-
-    # rank initial values order
-    orderin = array.argsort()
-    ranks = np.empty(len(array), int)
-    ranks[orderin] = np.arange(len(array))
+    # reshape as original array
+    return outputarray.reshape(initialarray.shape)
 
-    # get ranked values from target and rearrange with inital order
-    outputarray = ranked[ranks]
+def nonparam_match_empirical_cdf_masked(initialarray, targetarray, MASK, 
+                                        MASK_target=None, method="exact", 
+                                        num_bins=10000):
+    """Matches the empirical CDF of the values of the initial array inside a 
+    mask with the empirical CDF of the values of a target array. The values 
+    outside the mask are not changed. As in nonparam_match_empirical_cdf, the 
+    ranks and the minimum values (zero-pixels) of the initial array are 
+    conserved within the mask.
+    
+    Parameters: 
+    ----------
+    initialarray : array-like
+        The initial array whose CDF is to be changed.
+    targetarray : array-like
+        The target array whose CDF is to be matched.
+    MASK : array-like
+        Boolean array of the same shape as initialarray. The values where MASK 
+        is True are matched.
+    MASK_target : array-like
+        Optional boolean array of the same shape as targetarray. If given, 
+        only the values where MASK_target is True are used for computing the 
+        target CDF.
+    method : str
+        'exact' or 'approx', see nonparam_match_empirical_cdf. If the numbers 
+        of the masked values differ, the exact method interpolates the sorted 
+        target values linearly at the relative ranks of the initial values.
+    num_bins : int
+        The number of histogram bins if method is 'approx'.
+        
+    Returns
+    -------
+    outputarray : array-like
+        The new array. 
+    """
+    if MASK.shape != initialarray.shape:
+        raise ValueError("dimension mismatch between initialarray and MASK: initialarray.shape=%s, MASK.shape=%s" % \
+                         (str(initialarray.shape), str(MASK.shape)))
+    if MASK_target is not None and MASK_target.shape != targetarray.shape:
+        raise ValueError("dimension mismatch between targetarray and MASK_target: targetarray.shape=%s, MASK_target.shape=%s" % \
+                         (str(targetarray.shape), str(MASK_target.shape)))
+    
+    array  = initialarray[MASK]
+    target = targetarray[MASK_target] if MASK_target is not None else targetarray.flatten()
+    if np.any(~np.isfinite(array)) or np.any(~np.isfinite(target)):
+      raise ValueError("input contains non-finite values")
+    if len(target) == 0 and len(array) > 0:
+        raise ValueError("the target array contains no values inside the mask")
+    
+    outputarray = initialarray.astype(np.result_type(initialarray, targetarray))
+    if len(array) > 0:
+        outputarray[MASK] = _nonparam_match(array, target, method, num_bins)
+    
+    return outputarray
 
-    # reshape as original array
-    outputarray = outputarray.reshape(arrayshape)
+def _nonparam_match(array, target, method, num_bins):
+    # Match the CDF of the one-dimensional array with the CDF of target, and 
+    # conserve the minimum values (zero-pixels) of the array.
+    if method not in ["exact", "approx"]:
+        raise ValueError("unknown method %s, the available options are 'exact' and 'approx'" % method)
+    
+    # zeros in initial image
+    zvalue = array.min()
+    idxzeros = array == zvalue
+    
+    if method == "exact":
+        # rank target values
+        ranked = np.sort(target)
+        
+        # rank initial values order
+        orderin = array.argsort()
+        ranks = np.empty(len(array), int)
+        ranks[orderin] = np.arange(len(array))
+        
+        # get ranked values from target and rearrange with inital order
+        if len(ranked) == len(array):
+            outputarray = ranked[ranks]
+        else:
+            r = ranks * (len(ranked)-1.0) / max(len(array)-1, 1)
+            outputarray = np.interp(r, np.arange(len(ranked)), ranked)
+    elif np.min(target) == np.max(target):
+        outputarray = np.full(len(array), target[0], dtype=np.float64)
+    else:
+        # Approximate the ranks of the values with a histogram of the initial 
+        # array, and the target values at the relative ranks with a histogram 
+        # of the target array. The values of the sparse bins, which include 
+        # the tails of the distributions, are ranked exactly.
+        bin_edges,i,h,c = _get_histogram(array, num_bins)
+        os = _init_order_statistics(target, num_bins)
+        s = (len(target)-1.0) / max(len(array)-1, 1)
+        
+        # The values of the bins with at least _MIN_BIN_COUNT values are 
+        # assumed to be uniformly distributed within the bin, and they are 
+        # mapped linearly between the target values at the relative ranks of 
+        # the first and last values of the bin.
+        r_lo = s * c
+        r_hi = s * np.maximum(c+h-1, c)
+        y_lo = _get_order_statistics(os, r_lo)
+        y_hi = _get_order_statistics(os, r_hi)
+        
+        w = array - np.take(bin_edges, i)
+        w *= num_bins / (bin_edges[-1] - bin_edges[0])
+        h_i = np.take(h, i)
+        w *= h_i
+        w -= 0.5
+        w /= np.maximum(h_i-1, 1)
+        np.clip(w, 0.0, 1.0, out=w)
+        outputarray = np.take(y_lo, i)
+        w *= np.take(y_hi, i) - outputarray
+        outputarray += w
+        w = None
+        
+        # The values of the sparse bins, which include the tails of the 
+        # distributions, are ranked exactly by sorting them, and so are the 
+        # values of the bins whose ranks map to sparse bins of the target.
+        k_lo = _get_bins_of_ranks(os, np.floor(r_lo).astype(int))
+        k_hi = _get_bins_of_ranks(os, np.ceil(r_hi).astype(int))
+        exact = np.logical_or(h < _MIN_BIN_COUNT, 
+            np.take(os["num_sparse"], k_hi+1) > np.take(os["num_sparse"], k_lo))
+        h_e = np.where(exact, h, 0)
+        c_e = np.cumsum(h_e) - h_e
+        idx = np.where(np.take(exact, i))[0]
+        idx = idx[np.argsort(array[idx], kind="mergesort")]
+        i_e = np.take(i, idx)
+        ranks = np.take(c, i_e) + np.arange(len(idx)) - np.take(c_e, i_e)
+        outputarray[idx] = _get_order_statistics(os, s*ranks)
     
     # readding original zeros
     outputarray[idxzeros] = zvalue
-
+    
     return outputarray
 
-def nonparam_match_empirical_cdf_masked():
-    pass
+# the minimum number of values in a histogram bin for assuming that the values 
+# are uniformly distributed within the bin, the values of the bins with fewer 
+# values are sorted
+_MIN_BIN_COUNT = 16
 
-def pmm_init(bin_edges_1, cdf_1, bin_edges_2, cdf_2):
-    pmm = {}
+def _get_histogram(x, num_bins):
+    # Return the uniform bin edges of a histogram of the values of x, the bin 
+    # indices of the values, the number of values in each bin and the number of 
+    # values below each bin.
+    bin_edges = _get_histogram_bin_edges(x, num_bins)
+    i = _get_bin_indices(x, bin_edges, exact=False)
+    h = np.bincount(i, minlength=num_bins)
+    
+    return bin_edges,i,h,np.cumsum(h)-h
+
+def _init_order_statistics(x, num_bins):
+    # Initialize the approximate order statistics of the values of x, see 
+    # _get_order_statistics.
+    bin_edges,i,h,c = _get_histogram(x, num_bins)
+    sparse = h < _MIN_BIN_COUNT
+    h_s = np.where(sparse, h, 0)
     
-    pmm["bin_edges_1"]      = bin_edges_1.copy()
-    pmm["cdf_1"]            = cdf_1.copy()
-    pmm["bin_edges_2"]      = bin_edges_2.copy()
-    pmm["cdf_2"]            = cdf_2.copy()
-    pmm["cdf_interpolator"] = sip.interp1d(bin_edges_1, cdf_1, kind="linear")
+    os = {}
+    os["bin_edges"] = bin_edges
+    os["counts"]    = h
+    os["ends"]      = c + h
+    # the sorted values of the sparse bins and the index of the first value of 
+    # each bin in them
+    os["sparse_values"]  = np.sort(x[np.take(sparse, i)])
+    os["sparse_offsets"] = np.cumsum(h_s) - h_s
+    # the number of sparse bins below each bin
+    os["num_sparse"] = np.hstack([[0], np.cumsum(sparse)])
+    # the minimum value is usually repeated (e.g. zero precipitation), so the 
+    # values of its bin are not uniformly distributed
+    os["min_value"] = bin_edges[0]
+    os["min_count"] = np.sum(x[i == 0] == bin_edges[0])
+    
+    return os
+
+def _get_bins_of_ranks(os, r):
+    # Return the indices of the bins containing the values of the integer 
+    # ranks r (0 for the smallest value).
+    k = np.searchsorted(os["ends"], r, side="right")
     
-    return pmm
+    return np.clip(k, 0, len(os["counts"])-1, out=k)
+
+def _get_order_statistics(os, ranks):
+    # Return the values at the given ranks (0 for the smallest value) by using 
+    # the order statistics initialized with _init_order_statistics. The 
+    # values are assumed to be uniformly distributed within the bins containing 
+    # at least _MIN_BIN_COUNT values, and the values of the sparse bins are 
+    # exact. The values at non-integer ranks are linearly interpolated as in 
+    # numpy.interp.
+    n = os["ends"][-1]
+    r = np.floor(ranks).astype(int)
+    np.clip(r, 0, max(n-2, 0), out=r)
+    f = np.clip(ranks - r, 0.0, 1.0)
+    
+    y = []
+    for r_ in [r, np.minimum(r+1, n-1)]:
+        k = _get_bins_of_ranks(os, r_)
+        h_k = np.take(os["counts"], k)
+        r_k = r_ - (np.take(os["ends"], k) - h_k)
+        bin_edges = os["bin_edges"]
+        y_ = (r_k + 0.5) / np.maximum(h_k, 1)
+        y_ *= (bin_edges[-1] - bin_edges[0]) / (len(bin_edges) - 1)
+        y_ += np.take(bin_edges, k)
+        mask = h_k < _MIN_BIN_COUNT
+        y_[mask] = np.take(os["sparse_values"], 
+                           np.take(os["sparse_offsets"], k[mask]) + r_k[mask])
+        y_[r_ < os["min_count"]] = os["min_value"]
+        y.append(y_)
+    
+    return y[0] + f*(y[1] - y[0])
+
+def _get_histogram_bin_edges(X, num_bins):
+    x_min,x_max = float(np.min(X)),float(np.max(X))
+    if x_max == x_min:
+        x_max = x_min + 1.0
+    
+    return np.linspace(x_min, x_max, num_bins+1)
+
+def pmm_init(bin_edges_1, cdf_1, bin_edges_2, cdf_2):
+    """Initialize a probability matching that maps values with the CDF cdf_1 
+    to values with the CDF cdf_2. The CDFs are given at the bin edges, and 
+    they are linearly interpolated between them. Instead of interpolator 
+    objects, the initialization computes lookup tables: the slopes of cdf_1 
+    in each bin and, for each bin, the range of the indices of cdf_2 where 
+    the inverse of cdf_2 needs to be searched."""
+    return _init_lut(np.asarray(bin_edges_1), np.asarray(cdf_1)[np.newaxis, :], 
+                     np.asarray(bin_edges_2), np.asarray(cdf_2))
 
 def pmm_compute(pmm, x):
-    mask = np.logical_and(x >= pmm["bin_edges_1"][0], x <= pmm["bin_edges_1"][-1])
-    p = pmm["cdf_interpolator"](x[mask])
+    """Apply a probability matching initialized with pmm_init to the values 
+    x. The values outside the range of bin_edges_1 are mapped to nan."""
+    i = _get_bin_indices(x, pmm["bin_edges_1"])
+    
+    return _apply_lut(pmm, x, i, np.zeros(len(x), dtype=int))
+
+def _init_lut(bin_edges_1, cdf_1, bin_edges_2, cdf_2):
+    # The lookup tables for mapping values with the CDFs cdf_1 (an array of 
+    # shape (k,b+1)) to values with the CDF cdf_2.
+    lut = {}
+    
+    lut["bin_edges_1"] = bin_edges_1
+    lut["cdf_1"]       = cdf_1
+    lut["bin_edges_2"] = bin_edges_2
+    lut["cdf_2"]       = cdf_2
+    lut["slopes_1"]    = np.diff(cdf_1, axis=1) / np.diff(bin_edges_1)
+    
+    # cdf_1 is nondecreasing, so the values in the ith bin are mapped between 
+    # cdf_1[i] and cdf_1[i+1], and their inverses are bracketed by the 
+    # corresponding indices of cdf_2
+    lo = np.searchsorted(cdf_2, cdf_1[:, :-1], side="right")
+    hi = np.searchsorted(cdf_2, cdf_1[:, 1:], side="right")
+    lut["inv_lo"]   = lo
+    lut["inv_span"] = np.maximum(hi - lo, 0)
+    
+    return lut
+
+def _apply_lut(lut, x, i, j):
+    # Map the values x with the bin indices i (see _get_bin_indices) by using 
+    # the jth CDF of the lookup table.
+    bin_edges_1 = lut["bin_edges_1"]
+    cdf_1       = lut["cdf_1"]
+    b = len(bin_edges_1) - 1
+    
+    mask = np.logical_and(i >= 0, i < b)
+    x = x[mask]
+    i = i[mask]
+    j = j[mask]
+    
+    # linear interpolation of cdf_1 as in numpy.interp
+    ji = j*b + i
+    p = np.take(lut["slopes_1"], ji) * (x - np.take(bin_edges_1, i)) + \
+        np.take(cdf_1, ji + j)
+    p[x == bin_edges_1[-1]] = cdf_1[j[x == bin_edges_1[-1]], -1]
+    
+    # Search the inverse of cdf_2 only between the indices bracketing the bin. 
+    # The brackets usually contain a few values, otherwise use binary search.
+    span = np.take(lut["inv_span"], ji)
+    max_span = np.max(span) if len(span) > 0 else 0
+    if max_span <= 8:
+        cdf_2 = lut["cdf_2"]
+        k = np.take(lut["inv_lo"], ji)
+        for s in range(max_span):
+            k += np.logical_and(s < span, np.take(cdf_2, k, mode="clip") <= p)
+    else:
+        k = None
     
     result = np.ones(len(mask)) * np.nan
-    result[mask] = _invfunc(p, pmm["bin_edges_2"], pmm["cdf_2"])
+    result[mask] = _invfunc(p, lut["bin_edges_2"], lut["cdf_2"], b=k)
     
     return result
 
-def _invfunc(y, fx, fy):
+def _get_bin_indices(x, bin_edges, exact=True):
+  # Return the indices of the bins containing the values of x. The bins are 
+  # defined as in numpy.histogram: the ith bin is [bin_edges[i],bin_edges[i+1]) 
+  # and the last one also includes its right edge. The values below and above 
+  # the bins get the indices -1 and len(bin_edges)-1, respectively. If exact 
+  # is False, the values are assumed to be inside the uniform bins, and the 
+  # values within rounding errors from the bin edges may be assigned to the 
+  # adjacent bins.
+  n = len(bin_edges) - 1
+  d = np.diff(bin_edges)
+  
+  if not exact:
+      i = x - bin_edges[0]
+      i *= n / (bin_edges[-1] - bin_edges[0])
+      np.floor(i, out=i)
+      np.clip(i, 0, n-1, out=i)
+      return i.astype(np.intp)
+  elif np.all(np.abs(d - d[0]) <= 1e-8*abs(d[0])):
+      # uniform bins: compute the indices arithmetically instead of searching, 
+      # and correct the rounding errors at the bin edges
+      i = x - bin_edges[0]
+      i *= n / (bin_edges[-1] - bin_edges[0])
+      np.floor(i, out=i)
+      np.clip(i, -1, n, out=i)
+      i[np.isnan(i)] = n
+      i = i.astype(np.intp)
+      i -= np.logical_and(i >= 0, x < np.take(bin_edges, i, mode="clip"))
+      i += np.logical_and(i < n, x >= np.take(bin_edges, i+1, mode="clip"))
+  else:
+      i = np.searchsorted(bin_edges, x, side="right") - 1
+  i[x == bin_edges[-1]] = n - 1
+  
+  return i
+
+def _invfunc(y, fx, fy, b=None):
   if len(y) == 0:
       return np.array([])
   
-  b = np.digitize(y, fy)
+  # the same as numpy.digitize for increasing bins
+  if b is None:
+      b = np.searchsorted(fy, y, side="right")
   mask = np.logical_and(b > 0, b < len(fy))
   c = (y[mask] - fy[b[mask]-1]) / (fy[b[mask]] - fy[b[mask]-1])
   
@@ -0,0 +1,27 @@
+"""Common inputs for the tests."""
+
+import numpy as np
+from pysteps.utils import spectral
+
+def get_precip_field(shape, seed=42):
+    """Return a smooth random field in dBR units with some precipitation-free 
+    areas (values below zero)."""
+    rs = np.random.RandomState(seed)
+    F = np.fft.rfft2(rs.randn(*shape))
+    R = spectral.get_rfft_radius_map(shape)
+    R = np.fft.irfft2(F / np.maximum(R, 1.0)**1.5, s=shape)
+    return 10.0 * (R - np.mean(R)) / np.std(R) + 5.0
+
+def get_steps_inputs(shape=(64, 64), ar_order=2):
+    """Return the input fields and the motion field for a STEPS nowcast."""
+    R = np.stack([get_precip_field(shape, seed=i) for i in range(ar_order+1)])
+    V = np.ones((2,) + shape)
+    return R,V
+
+# the arguments of steps.forecast after R, V and num_timesteps for a small 
+# nowcast with perturbed motion fields
+STEPS_ARGS = (2, 4, 0.0, "semilagrangian", "fft", "gaussian", 
+              "nonparametric", 1.0, 5.0)
+STEPS_KWARGS = {"vel_pert_method":"bps", "seed":42, 
+                "vel_pert_kwargs":{"p_pert_par":(10.88, 0.23, -7.68), 
+                                   "p_pert_perp":(5.76, 0.31, -2.72)}}
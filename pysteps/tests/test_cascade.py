@@ -0,0 +1,61 @@
+"""Tests for the band-pass filters and the cascade decompositions."""
+
+import numpy as np
+import pytest
+from pysteps.cascade import bandpass_filters, decomposition
+from pysteps.tests.helpers import get_precip_field
+
+def test_filter_gaussian():
+    filter = bandpass_filters.filter_gaussian(64, 6)
+    assert np.allclose(np.sum(filter["weights_2d_rfft"], axis=0), 1.0)
+
+@pytest.mark.parametrize("shape", [(64, 64), (50, 77)])
+def test_get_weights_2d(shape):
+    M,N = shape
+    filter = bandpass_filters.filter_gaussian(N, 6, M=M)
+    W = bandpass_filters.get_weights_2d(filter)
+    assert W.shape == (6, M, N)
+    # the dense weights are centered, even and consistent with the 
+    # half-spectrum
+    W_ = np.fft.ifftshift(W, axes=(1, 2))
+    assert np.array_equal(W_[:, :, :int(N/2)+1], filter["weights_2d_rfft"])
+    assert np.array_equal(W_[:, -np.arange(M) % M, :][:, :, -np.arange(N) % N], 
+                          W_)
+    
+    filter = bandpass_filters.filter_gaussian(N, 6, M=M, compact=True)
+    assert np.allclose(bandpass_filters.get_weights_2d(filter, 2), W[2], 
+                       atol=1e-6)
+
+@pytest.mark.parametrize("shape", [(64, 64), (50, 77)])
+def test_decomposition_pyramid_reconstruction(shape):
+    X = get_precip_field(shape)
+    filter = bandpass_filters.filter_gaussian(64, 5)
+    
+    levels = decomposition.decomposition_pyramid(X, filter)["cascade_levels"]
+    assert levels.shape == (5,) + shape
+    assert np.allclose(np.sum(levels, axis=0), X)
+    
+    # the decimated levels halve the shape per level and expand to the 
+    # non-decimated ones
+    levels_d = decomposition.decomposition_pyramid(X, filter, 
+                                                   decimate=True)["cascade_levels"]
+    assert levels_d[-1].shape == shape
+    assert levels_d[-2].shape == tuple(int((l+1)/2) for l in shape)
+    for X_d,X_ in zip(levels_d, levels):
+        assert np.allclose(decomposition.expand_pyramid_level(X_d, shape), X_)
+
+def test_decomposition_fft_compact():
+    # the levels of a compact filter are computed in a reused buffer, where the 
+    # support of the previous level must be cleared
+    X = get_precip_field((64, 64))
+    filter = bandpass_filters.filter_gaussian(64, 6)
+    filter_c = bandpass_filters.filter_gaussian(64, 6, compact=True)
+    
+    levels = decomposition.decomposition_fft(X, filter)["cascade_levels"]
+    levels_c = decomposition.decomposition_fft(X, filter_c)["cascade_levels"]
+    assert np.allclose(levels_c, levels, atol=1e-4)
+    
+    levels_c = decomposition.decomposition_fft_batch(np.stack([X, 2.0*X]), 
+                                                     filter_c)["cascade_levels"]
+    assert np.allclose(levels_c[0], levels, atol=1e-4)
+    assert np.allclose(levels_c[1], 2.0*levels, atol=2e-4)
@@ -0,0 +1,65 @@
+"""Tests for the FFT backend."""
+
+import numpy as np
+import pytest
+import pysteps
+from pysteps.utils import fftbackend
+
+def _get_engines():
+    engines = ["numpy"]
+    if fftbackend.scipy_fft_imported:
+        engines.append("scipy")
+    if fftbackend.pyfftw_imported:
+        engines.append("pyfftw")
+    return engines
+
+def test_fftbackend_is_module():
+    # pysteps.utils must not shadow the backend with a name leaked by a star 
+    # import
+    import types
+    assert isinstance(fftbackend, types.ModuleType)
+    assert not hasattr(pysteps.utils, "fft") or \
+        isinstance(pysteps.utils.fft, types.ModuleType)
+
+@pytest.mark.parametrize("engine", _get_engines())
+def test_rfft2_roundtrip(engine):
+    engine_prev = fftbackend.get_engine()
+    fftbackend.set_engine(engine)
+    try:
+        X = np.random.RandomState(0).randn(3, 16, 12)
+        F = fftbackend.rfft2(X, axes=(-2, -1))
+        assert np.allclose(F, np.fft.rfft2(X, axes=(-2, -1)))
+        # the second call reuses the cached plan and must not alias the output 
+        # of the first one
+        F_ = fftbackend.rfft2(2.0*X, axes=(-2, -1))
+        assert np.allclose(F_, 2.0*F)
+        Y = fftbackend.irfft2(F, s=X.shape[1:], axes=(-2, -1))
+        assert np.allclose(X, Y)
+    finally:
+        fftbackend.set_engine(engine_prev)
+
+def test_worker_pool_divides_thread_budget():
+    num_threads = fftbackend.get_num_threads()
+    fftbackend.set_num_threads(8)
+    try:
+        assert fftbackend.get_threads_per_call() == 8
+        with fftbackend.worker_pool(4):
+            assert fftbackend.get_threads_per_call() == 2
+            with fftbackend.worker_pool(4):
+                assert fftbackend.get_threads_per_call() == 1
+        assert fftbackend.get_threads_per_call() == 8
+    finally:
+        fftbackend.set_num_threads(num_threads)
+
+@pytest.mark.skipif(not fftbackend.pyfftw_imported, reason="pyFFTW not installed")
+def test_plan_cache_size_is_limited():
+    engine_prev = fftbackend.get_engine()
+    fftbackend.set_engine("pyfftw")
+    fftbackend.set_max_plans(2)
+    try:
+        for n in range(4, 10):
+            fftbackend.rfft2(np.ones((n, n)))
+        assert len(fftbackend._local.plans) == 2
+    finally:
+        fftbackend.set_max_plans(32)
+        fftbackend.set_engine(engine_prev)
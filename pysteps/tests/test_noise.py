@@ -0,0 +1,42 @@
+"""Tests for the noise generators."""
+
+import numpy as np
+import pytest
+from pysteps.noise import fftgenerators
+from pysteps.tests.helpers import get_precip_field
+
+def test_nested_filter_bank():
+    X = get_precip_field((128, 128))
+    X[X < 0.0] = 0.0
+    F = fftgenerators.initialize_nonparam_2d_nested_filter(X, max_level=3, 
+                                                           compact=True)
+    F_d = fftgenerators.initialize_nonparam_2d_nested_filter(X, max_level=3)
+    
+    # every filter of the bank is assigned to some window
+    assert np.array_equal(np.unique(F["index"]), np.arange(len(F["filters"])))
+    for i in range(8):
+        for j in range(8):
+            F_ij = fftgenerators._get_bank_filter(F, F["index"][i, j], full=True)
+            assert np.allclose(F_ij, F_d[i, j])
+
+@pytest.mark.parametrize("ssft", [False, True])
+def test_generate_noise_seed_generator(ssft):
+    X = get_precip_field((64, 64))
+    X[X < 0.0] = 0.0
+    if ssft:
+        F = fftgenerators.initialize_nonparam_2d_ssft_filter(X)
+        generate = fftgenerators.generate_noise_2d_ssft_filter
+    else:
+        F = fftgenerators.initialize_nonparam_2d_fft_filter(X)
+        generate = fftgenerators.generate_noise_2d_fft_filter
+    
+    # a numpy.random.Generator is replaced with a new one created from the seed
+    N_1 = generate(F, randstate=np.random.default_rng(1), seed=42)
+    N_2 = generate(F, randstate=np.random.default_rng(2), seed=42)
+    N_3 = generate(F, randstate=np.random.default_rng(42))
+    assert np.array_equal(N_1, N_2)
+    assert np.array_equal(N_1, N_3)
+    
+    N_1 = generate(F, randstate=np.random.RandomState(1), seed=42)
+    N_2 = generate(F, randstate=np.random.RandomState(2), seed=42)
+    assert np.array_equal(N_1, N_2)
@@ -0,0 +1,98 @@
+"""Tests for the nowcasting methods."""
+
+import sys
+import numpy as np
+import pytest
+from pysteps.nowcasts import steps
+from pysteps.utils import fftbackend
+from pysteps.tests.helpers import get_steps_inputs, STEPS_ARGS, STEPS_KWARGS
+
+def test_steps_forecast():
+    R,V = get_steps_inputs()
+    R_f = steps.forecast(R, V, 3, *STEPS_ARGS, backend="serial", **STEPS_KWARGS)
+    assert R_f.shape == (2, 3, 64, 64)
+    # the advection leaves no data at the inflow boundaries
+    assert np.all(np.isfinite(R_f[:, :, 16:48, 16:48]))
+
+def test_steps_member_major():
+    R,V = get_steps_inputs()
+    R_f = steps.forecast(R, V, 3, *STEPS_ARGS, backend="serial", **STEPS_KWARGS)
+    
+    R_m = np.empty_like(R_f)
+    def member_callback(j, R_j):
+        R_m[j] = R_j
+    R_f_ = steps.forecast(R, V, 3, *STEPS_ARGS, member_major=True, 
+                          member_callback=member_callback, backend="serial", 
+                          **STEPS_KWARGS)
+    # the generators are keyed by the member index, so the execution order 
+    # does not change the outputs
+    assert np.array_equal(R_f_, R_f, equal_nan=True)
+    assert np.array_equal(R_m, R_f, equal_nan=True)
+
+@pytest.mark.skipif(sys.version_info < (3, 8), 
+                    reason="the processes backend requires Python 3.8")
+@pytest.mark.parametrize("member_major", [False, True])
+def test_steps_processes(member_major):
+    R,V = get_steps_inputs()
+    R_f = steps.forecast(R, V, 3, *STEPS_ARGS, backend="serial", **STEPS_KWARGS)
+    R_f_ = steps.forecast(R, V, 3, *STEPS_ARGS, member_major=member_major, 
+                          backend="processes", num_workers=2, **STEPS_KWARGS)
+    assert np.array_equal(R_f_, R_f, equal_nan=True)
+
+def test_steps_checkpoint_resume(tmp_path):
+    R,V = get_steps_inputs()
+    R_f = steps.forecast(R, V, 3, *STEPS_ARGS, backend="serial", **STEPS_KWARGS)
+    
+    checkpoint_file = str(tmp_path / "checkpoint.npz")
+    R_f_1 = steps.forecast(R, V, 1, *STEPS_ARGS, backend="serial", 
+                           checkpoint_file=checkpoint_file, **STEPS_KWARGS)
+    R_f_2 = steps.resume_forecast(checkpoint_file, 2, backend="serial")
+    assert np.array_equal(np.concatenate([R_f_1, R_f_2], axis=1), R_f, 
+                          equal_nan=True)
+
+def test_steps_float32():
+    R,V = get_steps_inputs()
+    R_f = {}
+    for dtype in ["float32", "float64"]:
+        R_f[dtype] = steps.forecast(R, V, 3, *STEPS_ARGS, backend="serial", 
+                                    dtype=dtype, **STEPS_KWARGS)
+    assert R_f["float32"].dtype == np.float32
+    
+    MASK = np.isfinite(R_f["float64"])
+    assert np.array_equal(np.isfinite(R_f["float32"]), MASK)
+    
+    # the statistics of each member and time step computed in single precision 
+    # differ by about 1e-4 from those computed in double precision (the values 
+    # are in dBR)
+    R_thr = STEPS_ARGS[2]
+    stats = {}
+    for dtype in ["float32", "float64"]:
+        R_ = np.where(MASK, R_f[dtype], np.nan)
+        stats[dtype] = [np.nanmean(R_, axis=(2, 3)), np.nanstd(R_, axis=(2, 3)), 
+                        np.sum(R_ > R_thr, axis=(2, 3)) / np.sum(MASK, axis=(2, 3))]
+    for s_32,s_64 in zip(stats["float32"], stats["float64"]):
+        assert np.allclose(s_32, s_64, rtol=0.0, atol=1e-3)
+
+@pytest.mark.parametrize("domain,num_ffts", [("spatial", 1+STEPS_ARGS[1]), 
+                                             ("spectral", 2)])
+def test_steps_num_ffts(domain, num_ffts, monkeypatch):
+    # count the two-dimensional transforms computed with the FFT backend, a 
+    # call with leading axes counts as one transform per field
+    counts = {}
+    for name in ["rfft2", "irfft2", "fft2", "ifft2"]:
+        def fft_counted(X, *args, fft_func=getattr(fftbackend, name), **kwargs):
+            counts["num"] = counts.get("num", 0) + int(np.prod(X.shape[:-2]))
+            return fft_func(X, *args, **kwargs)
+        monkeypatch.setattr(fftbackend, name, fft_counted)
+    
+    R,V = get_steps_inputs()
+    num = []
+    for num_timesteps in [1, 3]:
+        counts["num"] = 0
+        steps.forecast(R, V, num_timesteps, *STEPS_ARGS, backend="serial", 
+                       domain=domain, **STEPS_KWARGS)
+        num.append(counts["num"])
+    
+    # the initialization is the same for both runs, so the difference is the 
+    # number of transforms for two time steps of two members
+    assert num[1] - num[0] == 2 * 2 * num_ffts
@@ -0,0 +1,93 @@
+"""Tests for the probability matching methods."""
+
+import numpy as np
+import pytest
+from pysteps.postproc import probmatching
+from pysteps.tests.helpers import get_precip_field
+
+def _get_lognormal_fields(shape_1, shape_2, seed=42):
+    # two lognormal fields with about 50% zeros
+    rng = np.random.default_rng(seed)
+    X_1 = rng.lognormal(size=shape_1)
+    X_1[X_1 < 1.0] = 0.0
+    X_2 = 1.5 * rng.lognormal(size=shape_2)
+    X_2[X_2 < 1.5] = 0.0
+    return X_1,X_2
+
+@pytest.mark.parametrize("n,num_bins", [(50, 1000), (300, 10000), (1000, 10000)])
+def test_nonparam_match_approx(n, num_bins):
+    X_1,X_2 = _get_lognormal_fields((n, n), (n, n))
+    R_e = probmatching.nonparam_match_empirical_cdf(X_1, X_2, method="exact")
+    R_a = probmatching.nonparam_match_empirical_cdf(X_1, X_2, method="approx",
+                                                    num_bins=num_bins)
+    bin_width = np.ptp(X_2) / num_bins
+    # the error is a fraction of the bin width also in the tails
+    assert np.max(np.abs(R_a - R_e)) < bin_width
+    # the extreme values are ranked exactly
+    i = np.argmax(X_1)
+    assert R_a.flat[i] == R_e.flat[i] == np.max(X_2)
+    assert np.all(R_a[X_1 == 0.0] == 0.0)
+
+def test_nonparam_match_approx_masked_sizes_differ():
+    X_1,X_2 = _get_lognormal_fields((400, 400), (300, 300))
+    MASK = np.ones(X_1.shape, dtype=bool)
+    MASK[:, :100] = False
+    R_e = probmatching.nonparam_match_empirical_cdf_masked(X_1, X_2, MASK,
+                                                           method="exact")
+    R_a = probmatching.nonparam_match_empirical_cdf_masked(X_1, X_2, MASK,
+                                                           method="approx")
+    assert np.max(np.abs(R_a - R_e)) < np.ptp(X_2) / 10000
+    assert np.all(R_a[~MASK] == X_1[~MASK])
+
+def _match_war_and_cdf_sort(X, war, R_thr, R_min, bin_edges, target_cdf):
+    # the sort-based implementation previously used in STEPS
+    R_s = np.sort(X.flatten())
+    x = 1.0*np.arange(1, len(R_s)+1)[::-1] / len(R_s)
+    i = np.argmin(abs(x - war))
+    if R_s[i] == R_s[i + 1]:
+        i = np.where(R_s == R_s[i])[0][-1] + 1
+    R_pct_thr = R_s[i]
+    
+    X = X.copy()
+    MASK_p = X < R_pct_thr
+    X[~MASK_p] = X[~MASK_p] + (R_thr - R_pct_thr)
+    X[MASK_p] = R_min
+    
+    hist = np.histogram(X[~MASK_p], bins=bin_edges)[0]
+    cdf = probmatching.compute_empirical_cdf(bin_edges, hist)
+    x = X[~MASK_p]
+    MASK_b = np.logical_and(x >= bin_edges[0], x <= bin_edges[-1])
+    p = np.interp(x[MASK_b], bin_edges, cdf)
+    b = np.digitize(p, target_cdf)
+    MASK_c = np.logical_and(b > 0, b < len(target_cdf))
+    b = b[MASK_c]
+    c = (p[MASK_c] - target_cdf[b-1]) / (target_cdf[b] - target_cdf[b-1])
+    y = np.full(len(p), np.nan)
+    y[MASK_c] = c * bin_edges[b] + (1.0-c) * bin_edges[b-1]
+    x[:] = np.nan
+    x[MASK_b] = y
+    x[~np.isfinite(x)] = R_thr
+    X[~MASK_p] = x
+    
+    return X
+
+@pytest.mark.parametrize("quantize", [False, True])
+def test_match_war_and_cdf(quantize):
+    R_thr = 1.0
+    R_min = -15.0
+    X = np.stack([get_precip_field((100, 120), seed=i) for i in range(4)])
+    if quantize:
+        # quantized values produce ties at the threshold
+        X = np.round(X * 2.0) / 2.0
+    bin_edges = np.linspace(R_thr, 60, 200)
+    hist = np.histogram(X[0][X[0] >= R_thr], bins=bin_edges)[0]
+    target_cdf = probmatching.compute_empirical_cdf(bin_edges, hist)
+    war = np.mean(X[0] >= R_thr)
+    
+    R = probmatching.match_war_and_cdf(X[1:], war, R_thr, R_min, bin_edges, 
+                                       target_cdf)
+    for k in range(3):
+        R_ = _match_war_and_cdf_sort(X[k+1], war, R_thr, R_min, bin_edges, 
+                                     target_cdf)
+        assert np.allclose(R[k], R_, rtol=1e-12, atol=1e-12)
+        assert np.array_equal(R[k] == R_min, R_ == R_min)
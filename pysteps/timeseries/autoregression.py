@@ -74,6 +74,45 @@ def estimate_ar_params_yw(gamma):
     
     return phi
 
+def compute_ar_memory_decay(phi, num_timesteps):
+    """Compute the decay of the deterministic part of an AR(p) model, i.e. the 
+    contribution of the initial fields to the fields obtained by iterating the 
+    model. The decay is computed in closed form from the powers of the 
+    companion matrix of the model.
+    
+    Parameters
+    ----------
+    phi : array_like
+      Array of length p+1 specifying the parameters of the AR(p) model. See 
+      iterate_ar_model for the order of the parameters.
+    num_timesteps : int
+      The number of time steps for which to compute the decay.
+    
+    Returns
+    -------
+    out : ndarray
+      Array of length num_timesteps, where the kth element is the sum of the 
+      absolute values of the coefficients of the p initial fields in the field 
+      obtained after k+1 iterations of the model. For fields with unit 
+      variance, this is an upper bound for the standard deviation of the 
+      deterministic part of the field.
+    """
+    p = len(phi) - 1
+    
+    # the companion matrix maps the vector (X_t,X_t-1,...,X_t-p+1) to 
+    # (X_t+1,X_t,...,X_t-p+2) when the innovation term is excluded
+    C = np.zeros((p, p))
+    C[0, :] = phi[:p]
+    C[1:, :-1] = np.eye(p-1)
+    
+    decay = np.empty(num_timesteps)
+    c = np.eye(p)[0, :]
+    for k in range(num_timesteps):
+        c = np.dot(c, C)
+        decay[k] = np.sum(np.abs(c))
+    
+    return decay
+
 def iterate_ar_model(X, phi, EPS=None):
     """Apply an AR(p) model to a time-series of two-dimensional fields.
     
@@ -108,3 +147,127 @@ def iterate_ar_model(X, phi, EPS=None):
         X_new += phi[-1] * EPS
     
     return np.stack(list(X[1:, :, :]) + [X_new])
+
+def iterate_ar_model_inplace(X, phi, head, EPS=None, out=None):
+    """Apply an AR(p) model to a time-series of two-dimensional fields stored 
+    in a ring buffer. Unlike iterate_ar_model, this function does not allocate 
+    a new array for the time series. Instead, the new field overwrites the 
+    oldest one in X, and the position of the most recent field is tracked by 
+    the head index.
+    
+    Parameters
+    ----------
+    X : array_like
+      Three-dimensional array of shape (p,w,h) containing a time series of p 
+      two-dimensional fields of shape (w,h). The array is used as a ring buffer: 
+      the most recent field is X[head], the previous one is X[head-1] (modulo 
+      p) and so on. The array is modified in place.
+    phi : array_like
+      Array of length p+1 specifying the parameters of the AR(p) model. The 
+      parameters are in ascending order by increasing time lag, and the last 
+      element is the parameter corresponding to the innovation term EPS.
+    head : int
+      Index of the most recent field in X. If the fields of X are in ascending 
+      order by time (as in iterate_ar_model), head is p-1.
+    EPS : array_like
+      Optional perturbation field of shape (w,h) for the AR(p) process. If EPS 
+      is None, the innovation term is not added.
+    out : array_like
+      Optional array of shape (w,h) where the new field is written. The array 
+      is also used as a work buffer, and it can be the same array as EPS. If 
+      out is None, a new array is allocated.
+    
+    Returns
+    -------
+    out : tuple
+      Two-element tuple containing the new head index of X and the array 
+      containing the new field.
+    """
+    if X.shape[0] != len(phi)-1:
+      raise ValueError("dimension mismatch between X and phi: X.shape[0]=%d, len(phi)=%d" % (X.shape[0], len(phi)))
+    
+    if EPS is not None and EPS.shape != (X.shape[1], X.shape[2]):
+        raise ValueError("dimension mismatch between X and EPS: X.shape=%s, EPS.shape=%s" % (str(X.shape), str(EPS.shape)))
+    
+    return _iterate_ar_model_ringbuffer(X, [phi_ for phi_ in phi], head, EPS, out)
+
+def iterate_ar_model_batched(X, PHI, head, EPS=None, out=None):
+    """Apply AR(p) models to a batch of time-series of two-dimensional fields 
+    stored in ring buffers. The AR(p) parameters can be given separately for 
+    each cascade level, and they are broadcast over the leading dimensions of 
+    X. This allows updating, for instance, all cascade levels of one ensemble 
+    member or all ensemble members in one vectorized call.
+    
+    Parameters
+    ----------
+    X : array_like
+      Array of shape (...,n,p,w,h) containing the time series for n cascade 
+      levels. The array is modified in place. See iterate_ar_model_inplace for 
+      the ring buffer layout along the lag dimension of length p.
+    PHI : array_like
+      Array of shape (n,p+1) containing the parameters of the AR(p) model for 
+      each cascade level. See iterate_ar_model for the order of the parameters.
+    head : int
+      Index of the most recent field along the lag dimension of X.
+    EPS : array_like
+      Optional perturbation fields of shape (...,n,w,h). If EPS is None, the 
+      innovation term is not added.
+    out : array_like
+      Optional array of shape (...,n,w,h) where the new fields are written. The 
+      array is also used as a work buffer, and it can be the same array as EPS. 
+      If out is None, a new array is allocated.
+    
+    Returns
+    -------
+    out : tuple
+      Two-element tuple containing the new head index of X and the array 
+      containing the new fields.
+    """
+    if len(X.shape) < 4:
+        raise ValueError("X must have at least four dimensions")
+    if PHI.shape != (X.shape[-4], X.shape[-3]+1):
+        raise ValueError("dimension mismatch between X and PHI: X.shape=%s, PHI.shape=%s" % (str(X.shape), str(PHI.shape)))
+    
+    shape = X.shape[:-3] + X.shape[-2:]
+    if EPS is not None and EPS.shape != shape:
+        raise ValueError("dimension mismatch between X and EPS: X.shape=%s, EPS.shape=%s" % (str(X.shape), str(EPS.shape)))
+    
+    # reshape the parameters so that they broadcast over the cascade levels
+    phi = [PHI[:, i].reshape(-1, 1, 1) for i in range(PHI.shape[1])]
+    
+    return _iterate_ar_model_ringbuffer(np.moveaxis(X, -3, 0), phi, head, EPS, 
+                                        out)
+
+def _iterate_ar_model_ringbuffer(X, phi, head, EPS, out):
+    # X is a view whose first axis is the lag axis of the ring buffer
+    p = X.shape[0]
+    
+    # use the precision of X, e.g. to avoid upcasting single-precision inputs
+    phi = [np.asarray(phi_, dtype=X.dtype) for phi_ in phi]
+    
+    if out is None:
+        out = np.empty(X.shape[1:], dtype=X.dtype)
+    elif out.shape != X.shape[1:]:
+        raise ValueError("dimension mismatch between X and out: X.shape=%s, out.shape=%s" % (str(X.shape), str(out.shape)))
+    
+    # the oldest field is overwritten by the new one
+    new_head = (head + 1) % p
+    X_old = X[new_head]
+    
+    # Accumulate the new field into out without temporary arrays. The innovation 
+    # term is added first so that out can share its memory with EPS. Once the 
+    # oldest field has been added, its slot is used as a work buffer.
+    if EPS is not None:
+        np.multiply(EPS, phi[-1], out=out)
+        X_old *= phi[p-1]
+        out += X_old
+    else:
+        np.multiply(X_old, phi[p-1], out=out)
+    
+    for i in range(p-1):
+        np.multiply(X[(head - i) % p], phi[i], out=X_old)
+        out += X_old
+    
+    X_old[...] = out
+    
+    return new_head, out
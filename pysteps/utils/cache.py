@@ -0,0 +1,217 @@
+"""Cache for arrays that are expensive to compute but depend only on a small
+number of parameters, e.g. the grid shape and the parameters of a method.
+Typical examples are band-pass filter weights, tapering windows and coordinate
+grids that are rebuilt with identical values in every nowcast cycle.
+
+The cached values are kept in memory and evicted in least recently used (LRU)
+order when the total size exceeds the limit set by set_max_size. Optionally,
+the values can also be persisted on disk by setting a cache directory with
+set_cache_dir, so that they survive restarts of the process.
+
+The cached values can be numpy arrays or dictionaries whose values are numpy
+arrays, scalars, strings or None. The arrays returned from the cache are shared
+between the callers, and they are therefore set to read-only."""
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+
+_cache      = OrderedDict()
+_cache_size = 0
+_max_size   = 256*1024*1024
+_cache_dir  = None
+_lock       = threading.RLock()
+_stats      = {"hits":0, "misses":0, "disk_hits":0, "evictions":0}
+
+def get_or_compute(key, func, *args, **kwargs):
+    """Return the value corresponding to the given key from the cache. If the
+    value is not found, compute it by calling func(*args, **kwargs) and store
+    it into the cache.
+
+    Parameters
+    ----------
+    key : tuple
+      A tuple identifying the value. It should contain the name of the method
+      and all parameters the value depends on. The items must have a
+      deterministic string representation (e.g. strings, numbers, tuples and
+      None).
+    func : function
+      The function for computing the value.
+
+    Returns
+    -------
+    out : ndarray or dict
+      The cached or computed value.
+    """
+    key = _make_key(key)
+
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+            return _cache[key]
+
+    value = None
+    if _cache_dir is not None:
+        value = _load_value(key)
+        if value is not None:
+            with _lock:
+                _stats["disk_hits"] += 1
+
+    if value is None:
+        value = func(*args, **kwargs)
+        with _lock:
+            _stats["misses"] += 1
+        if _cache_dir is not None:
+            _save_value(key, value)
+
+    _set_readonly(value)
+
+    with _lock:
+        _insert(key, value)
+
+    return value
+
+def get_stats():
+    """Return the cache statistics.
+
+    Returns
+    -------
+    out : dict
+      Dictionary containing the numbers of cache hits, misses, values loaded
+      from disk and evictions, the number of cached values and their total
+      size in bytes.
+    """
+    with _lock:
+        stats = _stats.copy()
+        stats["num_items"] = len(_cache)
+        stats["size"]      = _cache_size
+
+    return stats
+
+def clear():
+    """Remove all values from the in-memory cache and reset the statistics. The
+    values persisted on disk are not removed."""
+    global _cache_size
+
+    with _lock:
+        _cache.clear()
+        _cache_size = 0
+        for k in _stats.keys():
+            _stats[k] = 0
+
+def set_max_size(max_size):
+    """Set the maximum total size of the values kept in the in-memory cache.
+
+    Parameters
+    ----------
+    max_size : int
+      The maximum size in bytes. Set to zero to disable the in-memory cache.
+    """
+    global _max_size
+
+    with _lock:
+        _max_size = max_size
+        _evict()
+
+def set_cache_dir(path):
+    """Set the directory for persisting the cached values on disk.
+
+    Parameters
+    ----------
+    path : str
+      Path to the cache directory. It is created if it does not exist. Set to
+      None to disable the on-disk cache.
+    """
+    global _cache_dir
+
+    if path is not None and not os.path.exists(path):
+        os.makedirs(path)
+    _cache_dir = path
+
+def _evict():
+    global _cache_size
+
+    while _cache_size > _max_size and len(_cache) > 0:
+        _,value = _cache.popitem(last=False)
+        _cache_size -= _get_size(value)
+        _stats["evictions"] += 1
+
+def _get_size(value):
+    if isinstance(value, dict):
+        return sum([v.nbytes for v in value.values() if isinstance(v, np.ndarray)])
+    else:
+        return value.nbytes
+
+def _insert(key, value):
+    global _cache_size
+
+    if key in _cache:
+        return
+
+    size = _get_size(value)
+    if size > _max_size:
+        return
+
+    _cache[key] = value
+    _cache_size += size
+    _evict()
+
+def _make_key(key):
+    return repr(tuple(key))
+
+def _get_filename(key):
+    return os.path.join(_cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".npz")
+
+def _load_value(key):
+    filename = _get_filename(key)
+    if not os.path.exists(filename):
+        return None
+
+    try:
+        with np.load(filename, allow_pickle=False) as f:
+            arrays = dict((k, f[k]) for k in f.files)
+    except (IOError, ValueError):
+        return None
+
+    meta = json.loads(str(arrays.pop("__meta__")))
+    # check for hash collisions
+    if meta["key"] != key:
+        return None
+
+    if meta["type"] == "array":
+        return arrays["value"]
+    else:
+        value = dict(meta["items"])
+        value.update(arrays)
+        return value
+
+def _save_value(key, value):
+    if isinstance(value, dict):
+        arrays = dict((k, v) for k,v in value.items() if isinstance(v, np.ndarray))
+        items  = [(k, v.item() if isinstance(v, np.generic) else v) \
+                  for k,v in value.items() if not isinstance(v, np.ndarray)]
+        meta = {"key":key, "type":"dict", "items":items}
+    else:
+        arrays = {"value":value}
+        meta = {"key":key, "type":"array"}
+    arrays["__meta__"] = np.array(json.dumps(meta))
+
+    # write into a temporary file first so that concurrent processes never
+    # read a partially written file
+    filename = _get_filename(key)
+    tmpfilename = filename + ".%d.tmp" % os.getpid()
+    with open(tmpfilename, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmpfilename, filename)
+
+def _set_readonly(value):
+    if isinstance(value, dict):
+        for v in value.values():
+            if isinstance(v, np.ndarray):
+                v.flags.writeable = False
+    else:
+        value.flags.writeable = False
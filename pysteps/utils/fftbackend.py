@@ -0,0 +1,313 @@
+"""A common interface to the Fast Fourier Transform (FFT) libraries used by
+pysteps.
+
+The transforms are computed with one of the following engines:
+
+  numpy      numpy.fft, single-threaded
+  scipy      scipy.fft, multithreaded with the workers argument
+  pyfftw     pyFFTW with cached FFTW plans, multithreaded
+
+By default, pyFFTW is used if it is installed, then scipy.fft and finally
+numpy.fft. The engine can be changed with set_engine.
+
+The functions of this module (fft2, rfft2, irfft2, etc.) take the same
+arguments as the corresponding functions of numpy.fft, and the optional
+argument threads. The number of threads is ignored by the numpy engine.
+
+The global thread budget set with set_num_threads (the default is 1) is the
+total number of FFT threads of the process. Code that calls the transforms
+from several workers at the same time registers the workers with worker_pool,
+and the budget is then divided among them. If threads is None, a transform
+uses its share of the budget (see get_threads_per_call). An explicit threads
+argument is used as such.
+
+With the pyfftw engine, the FFTW plans are cached by the name of the
+transform, the shape and data type of the input, the transform shape, the axes
+and the number of threads. The FFTW planner is not thread-safe, so plans are
+created under a lock, and an FFTW object is never shared between threads
+because it holds its own input and output arrays. Each thread keeps at most
+set_max_plans plans, and the least recently used ones are discarded. Thus, the
+transforms can be called from multiple threads, e.g. by dask or the thread
+pools of pysteps. The accumulated FFTW wisdom can be persisted on disk with
+set_wisdom_file, so that expensive planner efforts (e.g. FFTW_MEASURE) pay off
+across runs."""
+
+import atexit
+from collections import OrderedDict
+import contextlib
+import os
+import threading
+import numpy as np
+try:
+    import pyfftw
+    import pyfftw.builders
+    pyfftw_imported = True
+except ImportError:
+    pyfftw_imported = False
+try:
+    import scipy.fft
+    scipy_fft_imported = True
+except ImportError:
+    scipy_fft_imported = False
+
+if pyfftw_imported:
+    _engine = "pyfftw"
+elif scipy_fft_imported:
+    _engine = "scipy"
+else:
+    _engine = "numpy"
+_num_threads    = 1
+_num_workers    = 1
+_max_plans      = 32
+_planner_effort = "FFTW_ESTIMATE"
+_wisdom_file    = None
+_lock           = threading.RLock()
+_local          = threading.local()
+_plan_generation = 0
+
+fftshift  = np.fft.fftshift
+ifftshift = np.fft.ifftshift
+fftfreq   = np.fft.fftfreq
+rfftfreq  = np.fft.rfftfreq
+
+def set_engine(name, planner_effort=None):
+    """Set the engine for computing the FFTs.
+
+    Parameters
+    ----------
+    name : str
+      The name of the engine. The available options are 'numpy', 'scipy' and
+      'pyfftw'.
+    planner_effort : str
+      The planner effort of the FFTW plans if name is 'pyfftw', e.g.
+      'FFTW_ESTIMATE' (the default) or 'FFTW_MEASURE'.
+    """
+    global _engine, _planner_effort
+
+    if name not in ["numpy", "scipy", "pyfftw"]:
+        raise ValueError("unknown engine %s, the available options are 'numpy', 'scipy' and 'pyfftw'" % name)
+    if name == "scipy" and not scipy_fft_imported:
+        raise Exception("the scipy engine requires scipy.fft (SciPy 1.4 or later)")
+    if name == "pyfftw" and not pyfftw_imported:
+        raise Exception("the pyfftw engine requires pyFFTW")
+
+    with _lock:
+        _engine = name
+        if planner_effort is not None:
+            _planner_effort = planner_effort
+        clear_plans()
+
+def get_engine():
+    """Return the name of the current FFT engine."""
+    return _engine
+
+def set_num_threads(num_threads):
+    """Set the global thread budget, i.e. the total number of threads used by
+    the transforms of the process (see the module documentation).
+
+    Parameters
+    ----------
+    num_threads : int
+      The number of threads. If None, use the number of CPUs.
+    """
+    global _num_threads
+
+    if num_threads is None:
+        num_threads = os.cpu_count() or 1
+    if num_threads < 1:
+        raise ValueError("num_threads must be at least 1")
+
+    _num_threads = int(num_threads)
+
+def get_num_threads():
+    """Return the global thread budget."""
+    return _num_threads
+
+def get_threads_per_call():
+    """Return the number of threads used by a transform whose threads argument
+    is None, i.e. the global thread budget divided by the number of workers
+    registered with worker_pool (at least one)."""
+    return max(int(_num_threads / _num_workers), 1)
+
+@contextlib.contextmanager
+def worker_pool(num_workers):
+    """Context manager for dividing the thread budget among num_workers
+    workers that call the transforms concurrently, e.g. the threads of a
+    concurrent.futures.ThreadPoolExecutor. Nested pools divide the budget
+    further.
+
+    Parameters
+    ----------
+    num_workers : int
+      The number of workers.
+    """
+    global _num_workers
+
+    num_workers = max(int(num_workers), 1)
+    with _lock:
+        _num_workers *= num_workers
+    try:
+        yield
+    finally:
+        with _lock:
+            _num_workers = int(_num_workers / num_workers)
+
+def set_max_plans(max_plans):
+    """Set the maximum number of FFTW plans cached by each thread with the
+    pyfftw engine. Each plan holds its own input and output arrays, so the
+    limit bounds the memory of long-running thread pools.
+
+    Parameters
+    ----------
+    max_plans : int
+      The maximum number of plans per thread.
+    """
+    global _max_plans
+
+    if max_plans < 1:
+        raise ValueError("max_plans must be at least 1")
+
+    _max_plans = int(max_plans)
+
+def set_wisdom_file(filename):
+    """Persist the FFTW wisdom of the pyfftw engine in the given file. The
+    wisdom is loaded from the file if it exists, and it is written back when
+    the interpreter exits or save_wisdom is called.
+
+    Parameters
+    ----------
+    filename : str
+      Name of the wisdom file. If None, the wisdom is not persisted.
+    """
+    global _wisdom_file
+
+    _wisdom_file = filename
+    if filename is not None and pyfftw_imported and os.path.exists(filename):
+        with np.load(filename) as f:
+            wisdom = tuple(bytes(f["wisdom_%d" % i]) for i in range(len(f.files)))
+        with _lock:
+            pyfftw.import_wisdom(wisdom)
+
+def save_wisdom(filename=None):
+    """Save the FFTW wisdom accumulated by the pyfftw engine.
+
+    Parameters
+    ----------
+    filename : str
+      Name of the wisdom file. If None, use the file set with set_wisdom_file.
+    """
+    if filename is None:
+        filename = _wisdom_file
+    if filename is None or not pyfftw_imported:
+        return
+
+    with _lock:
+        wisdom = pyfftw.export_wisdom()
+    arrays = dict(("wisdom_%d" % i, np.frombuffer(w, dtype=np.uint8))
+                  for i,w in enumerate(wisdom))
+    # write into a temporary file first so that concurrent readers never see
+    # a partially written file
+    tmpfile = "%s.%d.tmp" % (filename, os.getpid())
+    with open(tmpfile, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmpfile, filename)
+
+def clear_plans():
+    """Discard the cached FFTW plans of all threads. The wisdom is kept, so
+    recreating the plans is cheap."""
+    global _plan_generation
+
+    with _lock:
+        _plan_generation += 1
+
+def _get_plan(name, X, args, kwargs, threads):
+    # Return the cached FFTW object of the calling thread for the given
+    # transform, or create it.
+    plans = getattr(_local, "plans", None)
+    if plans is None or _local.generation != _plan_generation:
+        plans = _local.plans = OrderedDict()
+        _local.generation = _plan_generation
+
+    key = (name, X.shape, X.dtype.str, _freeze(args),
+           tuple((k, _freeze(v)) for k,v in sorted(kwargs.items())), threads)
+    plan = plans.get(key, None)
+    if plan is None:
+        # the plan is built on a private array, because the builders may
+        # adopt the given array as the input array of the plan, and the
+        # planner may overwrite it
+        X_p = pyfftw.empty_aligned(X.shape, dtype=X.dtype)
+        with _lock:
+            plan = getattr(pyfftw.builders, name)(X_p, *args, threads=threads,
+                                                  planner_effort=_planner_effort,
+                                                  **kwargs)
+        plans[key] = plan
+        while len(plans) > _max_plans:
+            plans.popitem(last=False)
+    else:
+        plans.move_to_end(key)
+
+    return plan
+
+def _freeze(v):
+    # convert lists (e.g. the axes argument) into hashable tuples
+    if isinstance(v, (list, tuple)):
+        return tuple(_freeze(v_) for v_ in v)
+    else:
+        return v
+
+def _transform(name, X, args, kwargs, threads):
+    if threads is None:
+        threads = get_threads_per_call()
+
+    if _engine == "pyfftw":
+        X = np.asarray(X)
+        plan = _get_plan(name, X, args, kwargs, threads)
+        if plan.input_array.shape == X.shape:
+            # copy the input into the internal array of the plan, because the
+            # complex-to-real transforms overwrite their input
+            plan.input_array[...] = X
+            # calling the plan without arguments executes it and normalizes
+            # the inverse transforms
+            Y = plan()
+        else:
+            # the plan pads or truncates the input
+            Y = plan(X)
+        # the output array is reused by the next call of the plan
+        return Y.copy()
+    elif _engine == "scipy":
+        return getattr(scipy.fft, name)(X, *args, workers=threads, **kwargs)
+    else:
+        return getattr(np.fft, name)(X, *args, **kwargs)
+
+def _make_transform(name):
+    def transform(X, *args, **kwargs):
+        threads = kwargs.pop("threads", None)
+        return _transform(name, X, args, kwargs, threads)
+
+    transform.__name__ = name
+    transform.__doc__  = """Compute numpy.fft.%s with the current engine. The
+    optional argument threads sets the number of threads, see the module
+    documentation.""" % name
+
+    return transform
+
+fft    = _make_transform("fft")
+ifft   = _make_transform("ifft")
+rfft   = _make_transform("rfft")
+irfft  = _make_transform("irfft")
+fft2   = _make_transform("fft2")
+ifft2  = _make_transform("ifft2")
+rfft2  = _make_transform("rfft2")
+irfft2 = _make_transform("irfft2")
+fftn   = _make_transform("fftn")
+ifftn  = _make_transform("ifftn")
+rfftn  = _make_transform("rfftn")
+irfftn = _make_transform("irfftn")
+
+@atexit.register
+def _save_wisdom_at_exit():
+    if _wisdom_file is not None:
+        try:
+            save_wisdom()
+        except Exception:
+            pass
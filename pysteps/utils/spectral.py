@@ -0,0 +1,166 @@
+"""Utilities for computing radially averaged power spectra of two-dimensional
+fields.
+
+The radial wavenumbers are defined in the same way as in the band-pass filters
+of pysteps.cascade.bandpass_filters: the radius of a Fourier wavenumber is its
+distance from the zero frequency in units of grid points in the centered
+(fftshifted) layout. The radius maps depend only on the grid shape, and they
+are cached (see pysteps.utils.cache), so that computing the power spectrum of
+a field costs one real FFT and one weighted histogram."""
+
+import numpy as np
+from . import cache
+from . import fftbackend as fft
+
+def rapsd(X, return_freq=False, d=1.0):
+    """Compute the radially averaged power spectral density (RAPSD) of a
+    two-dimensional field.
+
+    Parameters
+    ----------
+    X : array-like
+      Two-dimensional array containing the input field. All values are required
+      to be finite.
+    return_freq : bool
+      If True, return also the frequencies corresponding to the radial
+      wavenumbers.
+    d : float
+      The sample spacing of the grid, used for computing the frequencies.
+
+    Returns
+    -------
+    out : array-like or tuple
+      One-dimensional array containing the power spectrum averaged over the
+      integer radial wavenumbers 0,1,...,L/2 (0,1,...,L/2-1 if L is odd), where
+      L is the maximum of the dimensions of X. If return_freq is True, a tuple
+      (psd, freq) is returned, where freq contains the frequencies
+      corresponding to the wavenumbers.
+    """
+    if len(X.shape) != 2:
+        raise ValueError("the input is not two-dimensional array")
+
+    radial_index = get_radial_index(X.shape)
+    r_max = len(radial_index["counts"])
+
+    F = fft.rfft2(X)
+    P = F.real**2 + F.imag**2
+    P *= radial_index["weights"]
+
+    psd = np.bincount(radial_index["radii"].ravel(), weights=P.ravel(),
+                      minlength=r_max)[:r_max]
+    psd /= radial_index["counts"]
+
+    if not return_freq:
+        return psd
+    else:
+        freq = np.arange(r_max) / (max(X.shape) * d)
+        return psd, freq
+
+def get_radius_map(shape):
+    """Return the radii of the Fourier wavenumbers of a field of the given
+    shape.
+
+    Parameters
+    ----------
+    shape : tuple
+      Two-element tuple containing the shape of the field.
+
+    Returns
+    -------
+    out : array-like
+      Two-dimensional array of the given shape containing the radii of the
+      wavenumbers in the centered layout, i.e. the zero frequency is at index
+      (M/2,N/2). The array is cached, and it is read-only.
+    """
+    shape = (int(shape[0]), int(shape[1]))
+    return cache.get_or_compute(("radius_map", shape), _compute_radius_map,
+                                shape)
+
+def get_rfft_radius_map(shape):
+    """Return the radii of the Fourier wavenumbers of the half-spectrum of a
+    field of the given shape in the layout of the two-dimensional real FFT.
+
+    Parameters
+    ----------
+    shape : tuple
+      Two-element tuple containing the shape (M,N) of the field.
+
+    Returns
+    -------
+    out : array-like
+      Array of shape (M,N/2+1) containing the radii of the wavenumbers, i.e.
+      the elements of get_radius_map shifted so that the zero frequency is at
+      index (0,0), without the negative frequencies along the last axis. The
+      array is cached, and it is read-only.
+    """
+    shape = (int(shape[0]), int(shape[1]))
+    return cache.get_or_compute(("rfft_radius_map", shape),
+                                _compute_rfft_radius_map, shape)
+
+def get_radial_index(shape):
+    """Return the integer radial wavenumbers of the half-spectrum of a field of
+    the given shape in the layout of the two-dimensional real FFT.
+
+    Parameters
+    ----------
+    shape : tuple
+      Two-element tuple containing the shape of the field.
+
+    Returns
+    -------
+    out : dict
+      Dictionary containing the integer radii ('radii') of the half-spectrum,
+      the weights of the half-spectrum elements ('weights', two for the
+      elements whose conjugate-symmetric counterparts are not included in the
+      half-spectrum) and the number of elements of the full spectrum having
+      each radius ('counts'). The arrays are cached, and they are read-only.
+    """
+    shape = (int(shape[0]), int(shape[1]))
+    return cache.get_or_compute(("radial_index", shape), _compute_radial_index,
+                                shape)
+
+def _compute_radius_map(shape):
+    M,N = shape
+
+    if N % 2 == 1:
+        rx = np.s_[-int(N/2):int(N/2)+1]
+    else:
+        rx = np.s_[-int(N/2):int(N/2)]
+
+    if M % 2 == 1:
+        ry = np.s_[-int(M/2):int(M/2)+1]
+    else:
+        ry = np.s_[-int(M/2):int(M/2)]
+
+    Y,X = np.ogrid[ry, rx]
+
+    return np.sqrt(X*X + Y*Y)
+
+def _compute_rfft_radius_map(shape):
+    n = int(shape[1]/2) + 1
+
+    R = fft.ifftshift(get_radius_map(shape))
+
+    return np.ascontiguousarray(R[:, :n])
+
+def _compute_radial_index(shape):
+    M,N = shape
+    n = int(N/2) + 1
+
+    radii = get_rfft_radius_map(shape).astype(int)
+
+    c = np.full(n, 2.0)
+    c[0] = 1.0
+    if N % 2 == 0:
+        c[-1] = 1.0
+    weights = np.repeat(c[np.newaxis, :], M, axis=0)
+
+    L = max(M, N)
+    if L % 2 == 0:
+        r_max = int(L/2) + 1
+    else:
+        r_max = int(L/2)
+    counts = np.bincount(radii.ravel(), weights=weights.ravel(),
+                         minlength=r_max)[:r_max]
+
+    return {"radii":radii, "weights":weights, "counts":counts}